@@ -0,0 +1,78 @@
+"""
+Aging of overdue loans.
+
+``Loan.aging_bucket`` records how far past its ``due_date`` an Active loan is.
+Buckets only change when the calendar crosses a boundary or a loan is settled,
+so ``sweep_overdue`` (run daily) recomputes them with one set-based UPDATE per
+bucket over the ``(status, due_date)`` index, touching only loans whose bucket
+is wrong, in chunks of ``chunk_size`` rows per transaction. Readers such as the
+staff dashboard use the stored buckets and never compare dates themselves.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Loan
+from .versions import bump_versions
+
+# First day past due_date that falls into each overdue bucket.
+BUCKET_STARTS = [
+    (Loan.OVERDUE_1_30, 1),
+    (Loan.OVERDUE_31_60, 31),
+    (Loan.OVERDUE_61_90, 61),
+    (Loan.OVERDUE_90_PLUS, 91),
+]
+CHUNK_SIZE = 1000
+
+
+def bucket_filters(today):
+    """``(bucket, Q)`` pairs selecting the due dates that belong in each bucket on ``today``."""
+    filters = [(Loan.CURRENT, Q(due_date__gte=today) | Q(due_date__isnull=True))]
+    for i, (bucket, first_day) in enumerate(BUCKET_STARTS):
+        in_bucket = Q(due_date__lte=today - timedelta(days=first_day))
+        if i + 1 < len(BUCKET_STARTS):
+            in_bucket &= Q(due_date__gt=today - timedelta(days=BUCKET_STARTS[i + 1][1]))
+        filters.append((bucket, in_bucket))
+    return filters
+
+
+def _move(queryset, bucket, chunk_size):
+    """Set ``aging_bucket`` on every loan in ``queryset``, ``chunk_size`` loans per transaction."""
+    moved = 0
+    queryset = queryset.order_by()
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.values_list('pk', 'borrower_id')[:chunk_size])
+            if not rows:
+                return moved
+            # Re-apply the filter so loans settled meanwhile are left alone.
+            moved += queryset.filter(pk__in=[pk for pk, _ in rows]).update(aging_bucket=bucket)
+            bump_versions(borrower_id for _, borrower_id in rows)
+
+
+def sweep_overdue(today=None, chunk_size=CHUNK_SIZE):
+    """
+    Bring every loan's ``aging_bucket`` up to date for ``today`` (default: the
+    current local date). Returns ``{bucket: loans moved into it}``.
+    """
+    today = today or timezone.localdate()
+    active = Loan.objects.filter(status='Active')
+    moved = {}
+    for bucket, in_bucket in bucket_filters(today):
+        moved[bucket] = _move(active.filter(in_bucket).exclude(aging_bucket=bucket), bucket, chunk_size)
+    # Paid (or otherwise closed) loans are no longer overdue.
+    settled = Loan.objects.filter(aging_bucket__gt=Loan.CURRENT).exclude(status='Active')
+    moved[Loan.CURRENT] += _move(settled, Loan.CURRENT, chunk_size)
+    return moved
+
+
+def aging_summary():
+    """Overdue Active loans and their outstanding balance per bucket (lazy)."""
+    return (
+        Loan.objects.filter(aging_bucket__gt=Loan.CURRENT, status='Active')
+        .values('aging_bucket')
+        .annotate(loans=Count('id'), outstanding=Sum(F('amount') - F('amount_repaid')))
+        .order_by('aging_bucket')
+    )
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from . import lookups, signals  # noqa: F401
+
+        from django.conf import settings
+        if getattr(settings, 'SIMULATED_DB_LATENCY_MS', 0):
+            from django.db.backends.signals import connection_created
+            from .benchmarks import add_simulated_latency
+            connection_created.connect(add_simulated_latency)
@@ -0,0 +1,115 @@
+"""
+Hot/cold archival of closed loans.
+
+``archive_closed_loans`` moves Paid and Rejected loans closed before a cutoff,
+with their repayments, from ``Loan`` / ``Repayment`` into ``ArchivedLoan`` /
+``ArchivedRepayment``, so the tables every request touches only hold recent
+history. A loan closes when it is rejected (``decided_at``) or repaid in full
+(``last_repayment_at``). Each batch is one transaction: ``INSERT ... SELECT``
+into the archive, then a plain ``DELETE`` from the live tables. Rows keep
+their ids, so ``restore_loans`` is the same copy in the other direction.
+
+Moving a loan does not change any portfolio total: ``PortfolioStats``,
+rollups and credit-score history all count archived loans too, so the deletes
+deliberately bypass the ``core.signals`` handlers. Staff pages and exports
+read the archive only when asked (``?archived=1``, ``--include-archived``).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q, Value
+from django.utils import timezone
+
+from .models import ArchivedLoan, ArchivedRepayment, Loan, Repayment
+from .versions import bump_versions
+
+# Loans closed longer ago than this are archived by default.
+ARCHIVE_AFTER_DAYS = 365
+BATCH_SIZE = 1000
+
+
+def closed_before(cutoff):
+    """Closed loans whose last status change is older than ``cutoff``."""
+    return (
+        Q(status='Rejected', decided_at__lt=cutoff)
+        | Q(status='Paid', last_repayment_at__lt=cutoff)
+        # Marked Paid without any repayment on record (e.g. by staff through the admin).
+        | Q(status='Paid', last_repayment_at__isnull=True, decided_at__lt=cutoff)
+        # Decided before decision times were recorded: the application date is the best bound there is.
+        | Q(status='Rejected', decided_at__isnull=True, created_at__lt=cutoff)
+        | Q(status='Paid', last_repayment_at__isnull=True, decided_at__isnull=True, created_at__lt=cutoff)
+    )
+
+
+def default_cutoff():
+    return timezone.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def _copy(queryset, target, **extra):
+    """``INSERT INTO target SELECT ...`` of every column ``queryset``'s model shares with ``target``."""
+    target_fields = {field.attname for field in target._meta.concrete_fields}
+    columns = [field.attname for field in queryset.model._meta.concrete_fields if field.attname in target_fields]
+    queryset = queryset.order_by().annotate(**{name: Value(value) for name, value in extra.items()})
+    # values() selects model columns first and annotations after, matching this column list.
+    select, params = queryset.values(*columns, *extra).query.get_compiler(connection=connection).as_sql()
+    target_columns = ', '.join(
+        connection.ops.quote_name(target._meta.get_field(name).column) for name in [*columns, *extra]
+    )
+    table = connection.ops.quote_name(target._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({target_columns}) {select}', params)
+        return cursor.rowcount
+
+
+def _delete(queryset):
+    # _raw_delete issues one DELETE without collecting rows or sending signals:
+    # the rows live on in the other table, so the handlers must not count them out.
+    return queryset._raw_delete(queryset.db)
+
+
+def _move_batch(loans, loan_target, repayments, repayment_target, batch_size, **extra):
+    """Move up to ``batch_size`` loans of ``loans`` and their repayments; returns the counts moved."""
+    with transaction.atomic():
+        rows = list(loans.select_for_update().order_by().values_list('pk', 'borrower_id')[:batch_size])
+        if not rows:
+            return 0, 0
+        ids = [pk for pk, _ in rows]
+        moved_loans = _copy(loans.model.objects.filter(pk__in=ids), loan_target, **extra)
+        moved_repayments = _copy(repayments.filter(loan_id__in=ids), repayment_target)
+        # Children first: the foreign keys are checked per statement on some backends.
+        _delete(repayments.filter(loan_id__in=ids))
+        _delete(loans.model.objects.filter(pk__in=ids))
+        bump_versions(borrower_id for _, borrower_id in rows)
+    return moved_loans, moved_repayments
+
+
+def _move(loans, loan_target, repayments, repayment_target, batch_size, **extra):
+    total_loans = total_repayments = 0
+    while True:
+        moved_loans, moved_repayments = _move_batch(
+            loans, loan_target, repayments, repayment_target, batch_size, **extra,
+        )
+        if not moved_loans:
+            return total_loans, total_repayments
+        total_loans += moved_loans
+        total_repayments += moved_repayments
+
+
+def archive_closed_loans(cutoff=None, batch_size=BATCH_SIZE):
+    """
+    Archive the loans closed before ``cutoff`` (default: ``ARCHIVE_AFTER_DAYS``
+    ago), ``batch_size`` loans per transaction. Returns ``(loans, repayments)`` moved.
+    """
+    loans = Loan.objects.filter(closed_before(cutoff or default_cutoff()))
+    return _move(
+        loans, ArchivedLoan, Repayment.objects.all(), ArchivedRepayment, batch_size, archived_at=timezone.now(),
+    )
+
+
+def restore_loans(queryset=None, batch_size=BATCH_SIZE):
+    """
+    Move the archived loans of ``queryset`` (default: all) back into the live
+    tables with their repayments. Returns ``(loans, repayments)`` moved.
+    """
+    loans = queryset if queryset is not None else ArchivedLoan.objects.all()
+    return _move(loans, Loan, ArchivedRepayment.objects.all(), Repayment, batch_size)
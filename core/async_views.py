@@ -0,0 +1,117 @@
+"""
+Async twins of the read-heavy views, used when ``settings.ASYNC_VIEWS`` is on
+(ASGI deployments, see gunicorn.conf.py).
+
+Queries go through the async ORM and independent ones are awaited together.
+Templates are rendered with ``sync_to_async`` because context processors and
+the messages framework may still touch the session or user lazily.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+
+from .aging import aging_summary
+from .borrowers import aget_borrower_state
+from .instrumentation import query_budget
+from .models import Loan, Repayment
+from .pagination import akeyset_paginate, akeyset_paginate_many, get_page_size
+from .replicas import reporting_reads
+from .versions import PORTFOLIO, adata_version, conditional_page, own_borrower_key, portfolio_key
+from .stats import aget_portfolio_stats
+from .views import LOAN_ORDERING, include_archived, loan_list_query, user_list_query
+
+async def arender(request, template_name, context):
+    # Hand templates the user already resolved by the async auth check;
+    # the lazy request.user would otherwise load it again.
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@query_budget(3)
+@login_required
+@conditional_page(own_borrower_key)
+async def dashboard(request):
+    state = await aget_borrower_state(request)
+    return await arender(request, 'core/dashboard.html', {
+        'profile': state.profile,
+        'active_loan': state.active_loan,
+        'pending_loan': state.pending_loan,
+    })
+
+
+@query_budget(6)
+@staff_member_required
+@reporting_reads
+@conditional_page(portfolio_key)
+async def admin_dashboard(request):
+    recent_repayments = Repayment.objects.select_related('loan__borrower').order_by('-date')[:10]
+    stats, pending_loans, recent_repayments, aging, portfolio_version = await asyncio.gather(
+        aget_portfolio_stats(),
+        akeyset_paginate(
+            Loan.objects.select_related('borrower').filter(status='Pending'),
+            LOAN_ORDERING,
+            page_size=get_page_size(request),
+        ),
+        _alist(recent_repayments),
+        _alist(aging_summary()),
+        adata_version(request, PORTFOLIO),
+    )
+    return await arender(request, 'core/admin_dashboard.html', {
+        'total_users': stats.total_users,
+        'active_loans_count': stats.active_loans,
+        'pending_loans_count': stats.pending_loans,
+        'total_repaid': stats.total_repaid,
+        'pending_loans': pending_loans,
+        'recent_repayments': recent_repayments,
+        'aging_summary': aging,
+        'portfolio_version': portfolio_version,
+    })
+
+
+@query_budget(4)
+@staff_member_required
+@reporting_reads
+async def admin_users(request):
+    queryset, ordering = user_list_query(request)
+    profiles = await akeyset_paginate(
+        queryset,
+        ordering,
+        cursor=request.GET.get('after'),
+        page_size=get_page_size(request),
+    )
+    return await arender(request, 'core/admin_users.html', {
+        'profiles': profiles,
+        'current_verified': request.GET.get('verified'),
+        'current_sort': request.GET.get('sort'),
+        'min_balance': request.GET.get('min_balance', ''),
+        'next_query': profiles.next_query(request.GET),
+    })
+
+
+@query_budget(5)
+@staff_member_required
+@reporting_reads
+@conditional_page(portfolio_key)
+async def admin_loans(request):
+    querysets, ordering = loan_list_query(request)
+    loans = await akeyset_paginate_many(
+        querysets,
+        ordering,
+        cursor=request.GET.get('after'),
+        page_size=get_page_size(request),
+    )
+    return await arender(request, 'core/admin_loans.html', {
+        'loans': loans,
+        'current_status': request.GET.get('status'),
+        'current_sort': request.GET.get('sort'),
+        'include_archived': include_archived(request),
+        'next_query': loans.next_query(request.GET),
+        'portfolio_version': await adata_version(request, PORTFOLIO),
+    })
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
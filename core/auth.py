@@ -0,0 +1,86 @@
+"""
+Cache-backed resolution of the authenticated user.
+
+``CachedModelBackend`` serves ``request.user`` (with its profile) from the
+default cache instead of querying ``auth_user`` on every request; together
+with ``cached_db`` sessions an authenticated GET starts without touching the
+database. Entries are keyed by a per-user version that ``core.signals`` bumps
+whenever the user or their profile is saved or deleted, so changes such as
+revoking staff rights apply on the next request. Code that changes users or
+profiles with ``QuerySet.update()`` must call ``invalidate_user`` itself.
+
+The cached copy leaves out the password hash, which would otherwise end up
+in the cache's storage (files on local disk with ``FileBasedCache``); the
+session auth hashes Django checks on every request are computed before it is
+dropped (``CachedUser``).
+
+With several worker processes the cache has to be shared (file-based,
+database or Redis); a per-process local-memory cache only suits one worker.
+Invalidation only reaches processes that share the cache: a file-based cache
+is per machine, so users or profiles changed elsewhere (e.g. by a cron job on
+another instance) stay stale in it for up to ``settings.USER_CACHE_TIMEOUT``.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CachedUser
+
+
+def _version_key(user_id):
+    return f'auth:user-version:{user_id}'
+
+
+def _user_key(user_id, version):
+    return f'auth:user:{user_id}:{version}'
+
+
+def _user_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock rather than 1 so an evicted version counter
+        # can never point back at an entry cached before the eviction.
+        version = time.time_ns()
+        cache.add(_version_key(user_id), version, timeout=None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def _bump_version(user_id):
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def invalidate_user(user_id):
+    """
+    Drop the cached copy of a user, now and again once the current transaction
+    commits so a request that read the old row meanwhile cannot keep it.
+    """
+    _bump_version(user_id)
+    transaction.on_commit(lambda: _bump_version(user_id))
+
+
+def get_cached_user(user_id):
+    """The user with ``user_id`` and their profile, from the cache when possible."""
+    key = _user_key(user_id, _user_version(user_id))
+    user = cache.get(key)
+    if user is None:
+        try:
+            user = CachedUser.objects.select_related('profile').get(pk=user_id).drop_password()
+        except CachedUser.DoesNotExist:
+            return None
+        cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` whose session lookups go through ``get_cached_user``."""
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
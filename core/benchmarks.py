@@ -0,0 +1,585 @@
+"""
+View-level benchmarks: drive every URL in ``core.urls`` through the Django test
+client against the current database and report latency percentiles and query
+counts per view. Everything runs inside a transaction that is rolled back, so
+benchmarking a seeded database (see ``seed_loanbook``) leaves it untouched.
+
+``run_render_benchmarks`` times template rendering alone for the staff pages,
+re-parsing templates on every render versus the cached loader with and without
+warm fragment caches.
+
+``run_scoring_benchmark`` scores a synthetic pending queue with the NumPy batch
+scorer and with an equivalent per-loan Python loop.
+
+``run_archive_benchmark`` times the hot-path views with a large closed-loan
+history in the live tables and again after archiving it.
+
+``run_search_benchmark`` times the staff borrower search over a large book of
+profiles against the ``icontains`` scan it replaces.
+"""
+import math
+import random
+import re
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries, transaction
+from django.db.models import F, Q
+from django.http import QueryDict
+from django.template import Engine, RequestContext, engines
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, scoring
+from .search import OPEN_STATUSES, search_borrowers
+from .models import Loan, Profile, Repayment
+
+
+class Scenario:
+    def __init__(self, name, role, method='get', args=None, data=None):
+        self.name = name
+        self.role = role
+        self.method = method
+        self.args = args or (lambda fixtures: [])
+        self.data = data or (lambda fixtures: {})
+
+
+# One scenario per URL name in core/urls.py (enforced by the test suite).
+SCENARIOS = [
+    Scenario('dashboard', 'borrower'),
+    Scenario('register', None),
+    Scenario('register_admin', None),
+    Scenario('verify_profile', 'borrower'),
+    Scenario('apply_loan', 'applicant'),
+    Scenario('repay_loan', 'borrower'),
+    Scenario('admin_dashboard', 'staff'),
+    Scenario('approve_loan', 'staff', args=lambda f: [f['pending_loan'].pk]),
+    Scenario('reject_loan', 'staff', args=lambda f: [f['pending_loan'].pk]),
+    Scenario('bulk_decide_loans', 'staff', method='post',
+             data=lambda f: {'action': 'approve', 'scope': 'selected', 'loan_ids': [f['pending_loan'].pk]}),
+    Scenario('admin_users', 'staff'),
+    Scenario('borrower_search', 'staff', data=lambda f: {'q': 'bench', 'format': 'json'}),
+    Scenario('verify_user_admin', 'staff', args=lambda f: [f['applicant'].pk]),
+    Scenario('admin_loans', 'staff'),
+    Scenario('admin_create_loan', 'staff'),
+    Scenario('admin_create_user', 'staff'),
+    Scenario('export_ledger', 'staff', args=lambda f: ['repayments']),
+    Scenario('import_repayments', 'staff'),
+    Scenario('admin_trends', 'staff'),
+    Scenario('admin_trends_data', 'staff'),
+    Scenario('admin_risk', 'staff'),
+    Scenario('loan_events', 'staff', data=lambda f: {'after': 0, 'limit': 500}),
+]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _create_fixtures():
+    """Benchmark users with a known loan state; rolled back with everything else."""
+    staff = User.objects.create_user('bench-staff', is_staff=True, is_superuser=True)
+    borrower = User.objects.create_user('bench-borrower')
+    Profile.objects.create(user=borrower, verified_status=True, monthly_income=5000)
+    Loan.objects.create(borrower=borrower, amount=800, term_days=30, status='Active')
+    applicant = User.objects.create_user('bench-applicant')
+    Profile.objects.create(user=applicant, verified_status=True, monthly_income=5000)
+    waiting = User.objects.create_user('bench-waiting')
+    Profile.objects.create(user=waiting, verified_status=True)
+    pending_loan = Loan.objects.create(borrower=waiting, amount=4000, term_days=30, status='Pending')
+    return {
+        'staff': staff,
+        'borrower': borrower,
+        'applicant': applicant,
+        'pending_loan': pending_loan,
+    }
+
+
+def _request(client, scenario, url, fixtures):
+    response = getattr(client, scenario.method)(url, scenario.data(fixtures))
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def run_benchmarks(iterations=20, warmup=2, names=None, host='localhost'):
+    """Return ``{url_name: {...stats...}}`` for the selected scenarios."""
+    scenarios = [s for s in SCENARIOS if names is None or s.name in names]
+    results = {}
+    with transaction.atomic():
+        fixtures = _create_fixtures()
+        clients = {}
+        for role in {s.role for s in scenarios}:
+            clients[role] = Client(HTTP_HOST=host)
+            if role:
+                clients[role].force_login(fixtures[role])
+
+        for scenario in scenarios:
+            client = clients[scenario.role]
+            url = reverse(scenario.name, args=scenario.args(fixtures))
+            timings, queries, statuses = [], [], set()
+            for i in range(warmup + iterations):
+                # Each request runs in a savepoint that is rolled back, so writes
+                # (approve, verify, ...) see the same starting state every time.
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        response = _request(client, scenario, url, fixtures)
+                        elapsed = (time.perf_counter() - start) * 1000
+                    transaction.set_rollback(True)
+                if i < warmup:
+                    continue
+                timings.append(elapsed)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+
+            results[scenario.name] = {
+                'method': scenario.method.upper(),
+                'url': url,
+                'status': sorted(statuses),
+                'requests': len(timings),
+                'mean_ms': round(statistics.fmean(timings), 3),
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+                'queries': max(queries),
+                'queries_mean': round(statistics.fmean(queries), 2),
+            }
+        transaction.set_rollback(True)
+    return results
+
+
+RENDER_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]*"')
+
+
+def _render_engine(cached):
+    """A standalone engine configured like the project's, with or without the cached loader."""
+    base = engines['django'].engine
+    loaders = [('django.template.loaders.cached.Loader', RENDER_LOADERS)] if cached else RENDER_LOADERS
+    return Engine(
+        dirs=base.dirs,
+        context_processors=base.context_processors,
+        loaders=loaders,
+        string_if_invalid=base.string_if_invalid,
+        libraries=base.libraries,
+    )
+
+
+def _render_contexts(page_size):
+    """Template contexts of the staff pages, evaluated up front so only rendering is timed."""
+    from .pagination import keyset_paginate
+    from .stats import get_portfolio_stats
+    from .views import LOAN_ORDERING
+
+    stats = get_portfolio_stats()
+    loans = keyset_paginate(Loan.objects.select_related('borrower'), LOAN_ORDERING, page_size=page_size)
+    pending = keyset_paginate(
+        Loan.objects.select_related('borrower').filter(status='Pending'), LOAN_ORDERING, page_size=page_size,
+    )
+    return {
+        'core/admin_loans.html': {
+            'loans': loans,
+            'current_status': None,
+            'next_query': loans.next_query(QueryDict()),
+        },
+        'core/admin_dashboard.html': {
+            'total_users': stats.total_users,
+            'active_loans_count': stats.active_loans,
+            'pending_loans_count': stats.pending_loans,
+            'total_repaid': stats.total_repaid,
+            'pending_loans': pending,
+            'recent_repayments': list(Repayment.objects.select_related('loan__borrower').order_by('-date')[:10]),
+        },
+    }
+
+
+def run_render_benchmarks(iterations=20, warmup=2, page_size=500):
+    """
+    Return ``{template: {mode: {...stats...}}}`` for rendering the staff pages:
+
+    * ``reparse``: templates loaded and parsed on every render, fragments missed
+    * ``cached_loader``: parsed once, fragments missed (a new version each time)
+    * ``cached_fragments``: parsed once, fragments served from the cache
+
+    Raises ``AssertionError`` if the cached output differs from the reparsed one.
+    """
+    results = {}
+    with transaction.atomic():
+        staff = _create_fixtures()['staff']
+        contexts = _render_contexts(page_size)
+        request = RequestFactory().get(f'/?page_size={page_size}')
+        request.user = staff
+        engine = _render_engine(cached=True)
+        modes = {
+            'reparse': lambda: (_render_engine(cached=False), uuid.uuid4().hex),
+            'cached_loader': lambda: (engine, uuid.uuid4().hex),
+            'cached_fragments': lambda: (engine, 'render-benchmark'),
+        }
+        for name, context in contexts.items():
+            results[name] = {}
+            outputs = {}
+            for mode, setup in modes.items():
+                timings = []
+                for i in range(warmup + iterations):
+                    render_engine, version = setup()
+                    start = time.perf_counter()
+                    html = render_engine.get_template(name).render(
+                        RequestContext(request, {**context, 'portfolio_version': version}),
+                    )
+                    elapsed = (time.perf_counter() - start) * 1000
+                    if i >= warmup:
+                        timings.append(elapsed)
+                outputs[mode] = CSRF_TOKEN.sub('', html)
+                results[name][mode] = {
+                    'renders': len(timings),
+                    'bytes': len(html),
+                    'mean_ms': round(statistics.fmean(timings), 3),
+                    'p50_ms': round(percentile(timings, 50), 3),
+                    'p95_ms': round(percentile(timings, 95), 3),
+                }
+            assert len(set(outputs.values())) == 1, f'{name}: cached output differs from a fresh render'
+        transaction.set_rollback(True)
+    return results
+
+
+def score_loan_python(amount, term_days, income, paid, late, rejected):
+    """Per-loan equivalent of ``scoring.compute_scores``: the loop the batch scorer replaces."""
+    installment = amount * 30 / max(term_days, 1)
+    dti = installment / income if income > 0 else math.inf
+    affordability = min(max(1 - dti / scoring.MAX_DTI, 0), 1)
+    on_time = paid - late
+    z = (
+        scoring.RISK_INTERCEPT
+        + scoring.RISK_DTI * min(dti, 2)
+        + scoring.RISK_LATE * late
+        + scoring.RISK_ON_TIME * math.log1p(on_time)
+        + scoring.RISK_REJECTED * rejected
+        + scoring.RISK_NO_HISTORY * (paid == 0)
+    )
+    risk = 1 / (1 + math.exp(-z))
+    flags = 0
+    if income <= 0:
+        flags |= scoring.NO_INCOME
+    elif dti > scoring.HIGH_DTI_RATIO:
+        flags |= scoring.HIGH_DTI
+    if late:
+        flags |= scoring.LATE_HISTORY
+    if not paid:
+        flags |= scoring.NO_HISTORY
+    if rejected:
+        flags |= scoring.PRIOR_REJECTION
+    if on_time >= 2 and not late:
+        flags |= scoring.GOOD_HISTORY
+    return round(100 * affordability * (1 - risk)), flags
+
+
+def _create_pending_queue(loans, seed=0):
+    """``loans`` borrowers with a profile, some history and one Pending loan each."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    users = User.objects.bulk_create(
+        (User(username=f'score-bench-{i}') for i in range(loans)), batch_size=1000,
+    )
+    if not users or users[0].pk is None:
+        users = list(User.objects.filter(username__startswith='score-bench-').order_by('pk'))
+    Profile.objects.bulk_create(
+        (Profile(user=user, verified_status=True, monthly_income=rng.choice([None, *range(500, 20000, 250)]))
+         for user in users),
+        batch_size=1000,
+    )
+    history = []
+    for user in users:
+        for _ in range(rng.choice([0, 0, 1, 2, 3])):
+            due = (now - timedelta(days=rng.randrange(60, 700))).date()
+            status = rng.choice(['Paid', 'Paid', 'Paid', 'Rejected'])
+            late = rng.random() < 0.2
+            history.append(Loan(
+                borrower=user, amount=rng.randrange(100, 5000), term_days=30, status=status, due_date=due,
+                decided_at=now, last_repayment_at=now.replace(
+                    year=due.year, month=due.month, day=due.day,
+                ) + timedelta(days=10 if late else -5) if status == 'Paid' else None,
+            ))
+    Loan.objects.bulk_create(history, batch_size=1000)
+    Loan.objects.bulk_create(
+        (Loan(borrower=user, amount=rng.randrange(100, 5000), term_days=rng.choice([7, 14, 30, 60, 90]))
+         for user in users),
+        batch_size=1000,
+    )
+
+
+def run_scoring_benchmark(loans=100_000, seed=0):
+    """
+    Score ``loans`` synthetic pending loans and return timings for loading,
+    scoring with NumPy versus a per-loan Python loop, and saving. Rolled back.
+
+    Raises ``AssertionError`` if the two scorers disagree.
+    """
+    with transaction.atomic():
+        start = time.perf_counter()
+        _create_pending_queue(loans, seed)
+        setup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = scoring.load_batch()
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scores, flags = scoring.compute_scores(batch)
+        numpy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [
+            score_loan_python(*row) for row in zip(
+                batch.amount.tolist(), batch.term_days.tolist(), batch.income.tolist(),
+                batch.paid.tolist(), batch.late.tolist(), batch.rejected.tolist(),
+            )
+        ]
+        python_seconds = time.perf_counter() - start
+        assert expected == list(zip(scores.tolist(), flags.tolist())), 'NumPy and Python scores differ'
+
+        start = time.perf_counter()
+        saved = scoring.save_scores(batch, scores, flags)
+        save = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return {
+        'loans': len(batch),
+        'saved': saved,
+        'setup_s': round(setup, 3),
+        'load_s': round(load, 3),
+        'score_numpy_s': round(numpy_seconds, 4),
+        'score_python_s': round(python_seconds, 4),
+        'speedup': round(python_seconds / numpy_seconds, 1) if numpy_seconds else None,
+        'save_s': round(save, 3),
+    }
+
+
+# Views every borrower or staff request goes through; their tables are the ones archival shrinks.
+HOT_PATH = ['dashboard', 'apply_loan', 'repay_loan', 'admin_dashboard', 'admin_loans', 'approve_loan']
+
+
+def _create_closed_history(rows, seed=0, chunk_size=5000):
+    """
+    About ``rows`` loans and repayments closed one to three years ago, spread
+    over ``rows // 500`` borrowers; four loans in five are Paid with one repayment.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    users = User.objects.bulk_create(
+        (User(username=f'archive-bench-{i}') for i in range(max(1, rows // 500))), batch_size=1000,
+    )
+    if not users or users[0].pk is None:
+        users = list(User.objects.filter(username__startswith='archive-bench-').order_by('pk'))
+    created = 0
+    while created < rows:
+        closed = now - timedelta(days=rng.randrange(400, 1100), seconds=rng.randrange(86400))
+        # 1.8 rows per loan on average: the loan and, four times in five, its repayment.
+        count = min(chunk_size, max(1, (rows - created) * 5 // 9))
+        loans = Loan.objects.bulk_create(
+            [
+                Loan(
+                    borrower=rng.choice(users), amount=rng.randrange(100, 5000), term_days=30,
+                    status='Paid' if rng.random() < 0.8 else 'Rejected',
+                    due_date=closed.date(), decided_at=closed - timedelta(days=30),
+                )
+                for _ in range(count)
+            ],
+            batch_size=1000,
+        )
+        paid = [loan for loan in loans if loan.status == 'Paid']
+        repayments = Repayment.objects.bulk_create(
+            [Repayment(loan=loan, amount=loan.amount) for loan in paid], batch_size=1000,
+        )
+        # auto_now_add stamped the rows with today; move them back to when they happened.
+        Loan.objects.filter(pk__in=[loan.pk for loan in loans]).update(created_at=closed - timedelta(days=31))
+        Loan.objects.filter(pk__in=[loan.pk for loan in paid]).update(amount_repaid=F('amount'), last_repayment_at=closed)
+        Repayment.objects.filter(pk__in=[repayment.pk for repayment in repayments]).update(date=closed)
+        created += len(loans) + len(repayments)
+    return created
+
+
+def _table_sizes():
+    return {'loans': Loan.objects.count(), 'repayments': Repayment.objects.count()}
+
+
+def run_archive_benchmark(history=1_000_000, iterations=20, warmup=2, names=None, seed=0):
+    """
+    Benchmark the hot-path views (``HOT_PATH`` unless ``names`` is given) with
+    about ``history`` rows of closed loans and repayments in the live tables,
+    then again after ``archive_closed_loans`` has moved them out. Rolled back.
+    """
+    names = names or HOT_PATH
+    with transaction.atomic():
+        start = time.perf_counter()
+        rows = _create_closed_history(history, seed)
+        setup = time.perf_counter() - start
+
+        before = _table_sizes()
+        # With DEBUG on, the setup filled the bounded query log, which would hide the per-view counts.
+        reset_queries()
+        live = run_benchmarks(iterations=iterations, warmup=warmup, names=names)
+
+        start = time.perf_counter()
+        loans, repayments = archive.archive_closed_loans()
+        archive_seconds = time.perf_counter() - start
+
+        after = _table_sizes()
+        reset_queries()
+        archived = run_benchmarks(iterations=iterations, warmup=warmup, names=names)
+        transaction.set_rollback(True)
+
+    views = {}
+    for name in names:
+        views[name] = {
+            'p50_ms': [live[name]['p50_ms'], archived[name]['p50_ms']],
+            'p95_ms': [live[name]['p95_ms'], archived[name]['p95_ms']],
+            'queries': [live[name]['queries'], archived[name]['queries']],
+        }
+    return {
+        'history_rows': rows,
+        'setup_s': round(setup, 3),
+        'archive_s': round(archive_seconds, 3),
+        'archived': {'loans': loans, 'repayments': repayments},
+        'live_tables': {'before': before, 'after': after},
+        # [with the history in the live tables, after archiving it]
+        'views': views,
+    }
+
+
+def _create_borrower_book(profiles, seed=0, chunk_size=10_000):
+    """
+    ``profiles`` borrowers with a phone number and national ID in the formats
+    ``seed_loanbook`` uses; one in ten has an Active loan. Returns their
+    ``(username, phone_number, national_id)``.
+    """
+    rng = random.Random(seed)
+    borrowers = []
+    for offset in range(0, profiles, chunk_size):
+        users = User.objects.bulk_create(
+            [User(username=f'search-bench-{i}') for i in range(offset, min(offset + chunk_size, profiles))],
+            batch_size=1000,
+        )
+        if not users or users[0].pk is None:
+            users = list(User.objects.filter(username__in=[user.username for user in users]))
+        batch = [
+            Profile(
+                user=user,
+                national_id=f'{rng.randrange(10 ** 7, 10 ** 8)}',
+                phone_number=f'07{rng.randrange(10 ** 8):08d}',
+                verified_status=True,
+            ).set_lookup_keys()
+            for user in users
+        ]
+        Profile.objects.bulk_create(batch, batch_size=1000)
+        Loan.objects.bulk_create(
+            [
+                Loan(borrower=user, amount=rng.randrange(100, 5000), term_days=30, status='Active')
+                for user in users if rng.random() < 0.1
+            ],
+            batch_size=1000,
+        )
+        borrowers.extend((p.user.username, p.phone_number, p.national_id) for p in batch)
+    return borrowers
+
+
+def _search_terms(borrowers, rng):
+    """One search of each kind, for a randomly picked borrower."""
+    username, phone, national_id = rng.choice(borrowers)
+    return {
+        # As staff type it from a receipt: international format with spaces.
+        'phone_exact': f'+254 {phone[1:4]} {phone[4:7]} {phone[7:]}',
+        'phone_prefix': phone[:6],
+        'national_id_exact': national_id,
+        'national_id_prefix': national_id[:4],
+        'username_prefix': username[:-2],
+        'no_match': 'zz-nobody',
+    }
+
+
+def _scan_search(query, limit):
+    """The search without lookup keys: substring matches over the raw columns."""
+    matches = list(
+        Profile.objects.select_related('user').filter(
+            Q(phone_number__icontains=query) | Q(national_id__icontains=query) | Q(user__username__icontains=query)
+        )[:limit]
+    )
+    open_loans = list(Loan.objects.filter(
+        borrower_id__in=[profile.user_id for profile in matches], status__in=OPEN_STATUSES,
+    ))
+    return matches, open_loans
+
+
+def _time_search(search, terms, kind, limit):
+    timings, queries = [], []
+    for term in terms:
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            search(term[kind], limit)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'queries': max(queries),
+    }
+
+
+def run_search_benchmark(profiles=1_000_000, iterations=50, scan_iterations=3, limit=10, seed=0):
+    """
+    Time ``search_borrowers`` for each kind of search term over ``profiles``
+    synthetic borrowers, and the ``icontains`` scan over the raw columns for
+    comparison (``scan_iterations`` runs each; 0 skips it). Rolled back.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        start = time.perf_counter()
+        borrowers = _create_borrower_book(profiles, seed)
+        setup = time.perf_counter() - start
+        # Fresh statistics, as a production database would have.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        reset_queries()
+
+        terms = [_search_terms(borrowers, rng) for _ in range(iterations)]
+        for term in terms[:3]:
+            search_borrowers(term['phone_prefix'], limit)  # warm up
+        searches = {}
+        for kind in terms[0]:
+            searches[kind] = {'indexed': _time_search(search_borrowers, terms, kind, limit)}
+            if scan_iterations:
+                searches[kind]['scan'] = _time_search(_scan_search, terms[:scan_iterations], kind, limit)
+        transaction.set_rollback(True)
+    return {
+        'profiles': len(borrowers),
+        'setup_s': round(setup, 3),
+        'limit': limit,
+        'searches': searches,
+    }
+
+
+def _simulated_latency(execute, sql, params, many, context):
+    time.sleep(settings.SIMULATED_DB_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+def add_simulated_latency(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver that delays every query by
+    ``settings.SIMULATED_DB_LATENCY_MS``, to stand in for a slow database when
+    comparing deployments with ``benchmark_concurrency``. Off unless set.
+    """
+    connection.execute_wrappers.append(_simulated_latency)
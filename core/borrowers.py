@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.db.models import FilteredRelation, Q
+
+from .models import Loan, Profile
+
+
+class BorrowerState:
+    """Everything the borrower-facing views need about the current user."""
+
+    def __init__(self, user, profile, open_loan):
+        self.user = user
+        self.profile = profile
+        self.open_loan = open_loan
+
+    @property
+    def verified(self):
+        return self.profile.verified_status
+
+    @property
+    def active_loan(self):
+        if self.open_loan and self.open_loan.status == 'Active':
+            return self.open_loan
+        return None
+
+    @property
+    def pending_loan(self):
+        if self.open_loan and self.open_loan.status == 'Pending':
+            return self.open_loan
+        return None
+
+
+def _borrower_state_queryset(user):
+    return (
+        User.objects.filter(pk=user.pk)
+        .annotate(open_loan=FilteredRelation('loan', condition=Q(loan__status__in=['Pending', 'Active'])))
+        .select_related('profile', 'open_loan')
+    )
+
+
+def load_borrower_state(user):
+    """
+    Fetch the profile and the open (Pending/Active) loan of ``user`` in one query.
+
+    one_open_loan_per_borrower guarantees the join yields a single row. A
+    missing profile is returned unsaved rather than created, so GETs never write.
+    """
+    return _make_state(user, _borrower_state_queryset(user).get())
+
+
+async def aload_borrower_state(user):
+    return _make_state(user, await _borrower_state_queryset(user).aget())
+
+
+def _make_state(user, row):
+    try:
+        profile = row.profile
+    except Profile.DoesNotExist:
+        profile = Profile(user=user)
+    else:
+        profile.user = user
+    # select_related leaves the attribute unset when the LEFT JOIN finds no loan
+    open_loan = getattr(row, 'open_loan', None)
+    if open_loan is not None:
+        open_loan.borrower = user
+    return BorrowerState(user, profile, open_loan)
+
+
+def get_borrower_state(request):
+    """``load_borrower_state`` for ``request.user``, memoized on the request."""
+    if not hasattr(request, '_borrower_state'):
+        request._borrower_state = load_borrower_state(request.user)
+    return request._borrower_state
+
+
+async def aget_borrower_state(request):
+    if not hasattr(request, '_borrower_state'):
+        request._borrower_state = await aload_borrower_state(await request.auser())
+    return request._borrower_state
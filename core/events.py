@@ -0,0 +1,125 @@
+"""
+Append-only log of loan and borrower state changes, and its change feed.
+
+Every view or job that changes a loan's status, records a repayment or
+verifies a borrower appends ``LoanEvent`` rows with ``record_events`` inside
+the transaction that makes the change, so an event exists exactly when the
+change was committed. Downstream systems (accounting, SMS) read the log in id
+order from the last id they processed, either over HTTP (``loan_events``,
+``?after=<id>&limit=``) or with ``tail_events``; each read is one range scan
+of the primary key. Changes made through the Django admin are not logged.
+
+Ids are allocated when a row is inserted but become visible when its
+transaction commits, so on databases with concurrent writers an event can
+appear after a later id has already been read. The feed therefore holds back
+events younger than ``settings.EVENT_FEED_SETTLE_SECONDS``, and every event
+after the first such one, whatever its age.
+"""
+import hmac
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import LoanEvent
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def loan_event(kind, loan, actor=None, amount=None, **data):
+    """
+    Unsaved event for ``loan`` as it stands after the change. ``amount``
+    defaults to the loan amount; ``data`` adds kind-specific details.
+    """
+    return LoanEvent(
+        kind=kind,
+        loan_id=loan.pk,
+        borrower_id=loan.borrower_id,
+        actor_id=actor.pk if actor is not None else None,
+        amount=loan.amount if amount is None else amount,
+        data={'status': loan.status, 'balance': loan.balance, **data},
+    )
+
+
+def opened_loan_events(kind, loan, actor=None):
+    """``kind`` (applied or created) for a new loan, plus approved if it started out Active."""
+    events = [loan_event(kind, loan, actor)]
+    if loan.status == 'Active':
+        events.append(loan_event(LoanEvent.APPROVED, loan, actor))
+    return events
+
+
+def verified_event(user, actor=None):
+    return LoanEvent(kind=LoanEvent.VERIFIED, borrower_id=user.pk, actor_id=actor.pk if actor is not None else None)
+
+
+def record_events(events):
+    """Append ``events``; must run inside the transaction that makes the change they describe."""
+    events = list(events)
+    if not events:
+        return []
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError('Loan events must be recorded in the transaction that makes the change')
+    return LoanEvent.objects.bulk_create(events)
+
+
+def events_after(after=0, limit=DEFAULT_LIMIT, kinds=None, settle_seconds=None):
+    """
+    Up to ``limit`` events with an id above ``after``, oldest first, stopping
+    before the first event (of any kind) that has not settled yet, so a
+    consumer's cursor never moves past one.
+    """
+    events = LoanEvent.objects.filter(pk__gt=after)
+    if settle_seconds is None:
+        settle_seconds = settings.EVENT_FEED_SETTLE_SECONDS
+    if settle_seconds:
+        unsettled = LoanEvent.objects.filter(
+            pk__gt=after, created_at__gt=timezone.now() - timedelta(seconds=settle_seconds),
+        ).order_by('pk').values('pk')[:1]
+        # Evaluated once as part of the same statement; with nothing unsettled every row passes.
+        events = events.filter(pk__lt=Coalesce(Subquery(unsettled), F('pk') + 1))
+    if kinds:
+        events = events.filter(kind__in=kinds)
+    return list(events.order_by('pk')[:limit])
+
+
+def event_json(event):
+    return {
+        'id': event.pk,
+        'kind': event.kind,
+        'created_at': event.created_at,
+        'loan_id': event.loan_id,
+        'borrower_id': event.borrower_id,
+        'actor_id': event.actor_id,
+        'amount': event.amount,
+        'data': event.data,
+    }
+
+
+def _has_feed_token(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    return any(hmac.compare_digest(token.encode(), valid.encode()) for valid in settings.EVENT_FEED_TOKENS)
+
+
+def feed_auth_required(view):
+    """
+    Let staff sessions and ``Authorization: Bearer <token>`` requests with a
+    token from ``settings.EVENT_FEED_TOKENS`` through; answer anyone else with
+    a JSON 401 rather than a login redirect.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if _has_feed_token(request) or (request.user.is_active and request.user.is_staff):
+            return view(request, *args, **kwargs)
+        response = JsonResponse({'error': 'Staff login or an event feed token is required.'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return wrapper
@@ -1,7 +1,13 @@
+from datetime import timedelta
+
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Profile, Loan, Repayment
+from django.utils import timezone
+from .events import DEFAULT_LIMIT as EVENT_FEED_LIMIT, MAX_LIMIT as EVENT_FEED_MAX_LIMIT
+from .models import LoanEvent, Profile, Loan, Repayment
+from .search import DEFAULT_RESULTS, MAX_RESULTS
+from .simulation import DEFAULT_SCENARIOS, MAX_SCENARIOS
 
 class UserRegisterForm(UserCreationForm):
     class Meta:
@@ -50,3 +56,116 @@ class AdminUserForm(UserCreationForm):
         super().__init__(*args, **kwargs)
         self.fields['password1'].widget.attrs.update({'class': 'form-control'})
         self.fields['password2'].widget.attrs.update({'class': 'form-control'})
+
+class LoanIdListField(forms.Field):
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return [int(pk) for pk in value]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Enter a list of loan IDs.')
+
+class BulkLoanDecisionForm(forms.Form):
+    DECISIONS = {'approve': 'Active', 'reject': 'Rejected'}
+
+    action = forms.ChoiceField(choices=[('approve', 'Approve'), ('reject', 'Reject')])
+    scope = forms.ChoiceField(choices=[('selected', 'Selected loans'), ('filter', 'All pending under amount')], initial='selected')
+    loan_ids = LoanIdListField(required=False)
+    max_amount = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2,
+                                    widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('scope') == 'filter':
+            if cleaned_data.get('max_amount') is None:
+                self.add_error('max_amount', 'Enter the amount limit.')
+        elif not cleaned_data.get('loan_ids'):
+            self.add_error('loan_ids', 'Select at least one loan.')
+        return cleaned_data
+
+    @property
+    def new_status(self):
+        return self.DECISIONS[self.cleaned_data['action']]
+
+class LedgerExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    status = forms.ChoiceField(choices=[('', 'Any')] + Loan.STATUS_CHOICES, required=False)
+    gzip = forms.BooleanField(required=False)
+    archived = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('The start date must not be after the end date.')
+        return cleaned_data
+
+    def filters(self):
+        return {key: self.cleaned_data[key] or None for key in ('start', 'end', 'status')}
+
+class TrendsForm(forms.Form):
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 3660
+
+    def clean(self):
+        cleaned_data = super().clean()
+        end = cleaned_data.get('end') or timezone.localdate()
+        start = cleaned_data.get('start') or end - timedelta(days=self.DEFAULT_DAYS - 1)
+        if start > end:
+            raise forms.ValidationError('The start date must not be after the end date.')
+        if (end - start).days >= self.MAX_DAYS:
+            raise forms.ValidationError(f'Pick a range of at most {self.MAX_DAYS} days.')
+        cleaned_data['start'], cleaned_data['end'] = start, end
+        return cleaned_data
+
+class SimulationForm(forms.Form):
+    scenarios = forms.IntegerField(required=False, min_value=100, max_value=MAX_SCENARIOS,
+                                   widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+    seed = forms.IntegerField(required=False, min_value=0,
+                              widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('scenarios') is None:
+            cleaned_data['scenarios'] = DEFAULT_SCENARIOS
+        if cleaned_data.get('seed') is None:
+            cleaned_data['seed'] = 0
+        return cleaned_data
+
+class BorrowerSearchForm(forms.Form):
+    # Rendered by core/borrower_search_form.html, which also serves the admin_users page.
+    q = forms.CharField(required=False, max_length=64)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=MAX_RESULTS)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['q'] = (cleaned_data.get('q') or '').strip()
+        if cleaned_data.get('limit') is None:
+            cleaned_data['limit'] = DEFAULT_RESULTS
+        return cleaned_data
+
+class EventFeedForm(forms.Form):
+    after = forms.IntegerField(required=False, min_value=0)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=EVENT_FEED_MAX_LIMIT)
+    kind = forms.MultipleChoiceField(required=False, choices=LoanEvent.KIND_CHOICES)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('after') is None:
+            cleaned_data['after'] = 0
+        if cleaned_data.get('limit') is None:
+            cleaned_data['limit'] = EVENT_FEED_LIMIT
+        return cleaned_data
+
+class RepaymentImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with reference, phone and amount columns',
+                           widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}))
@@ -0,0 +1,56 @@
+"""
+Canonical forms of the borrower identifiers staff search by.
+
+People write the same phone number as ``0712 345 678``, ``+254712345678`` or
+``254-712-345678``, and national IDs with or without spaces and dashes.
+``Profile`` stores each identifier once more in canonical form
+(``phone_key``, ``national_id_key``), so lookups are one indexed equality or
+range comparison however the number was typed; usernames are kept lower-cased
+(``username_key``) for the same reason. Prefixes of an identifier
+normalize to prefixes of its key, which is what the typeahead relies on.
+"""
+import re
+
+from django.conf import settings
+
+_NON_DIGITS = re.compile(r'\D')
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Za-z]')
+# What a phone number may look like when typed: digits and the usual separators.
+PHONE_LIKE = re.compile(r'\+?[\d\s().-]+')
+
+
+def normalize_phone(value, country_code=None):
+    """
+    ``value`` as international digits without the ``+`` (``254712345678``),
+    or ``None`` when it holds no digits. Numbers in national format (a leading
+    trunk ``0``, or no prefix at all) get ``country_code``, by default
+    ``settings.PHONE_COUNTRY_CODE``.
+    """
+    if not value:
+        return None
+    country_code = country_code or settings.PHONE_COUNTRY_CODE
+    value = value.strip()
+    digits = _NON_DIGITS.sub('', value)
+    if not digits:
+        return None
+    if value.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:] or None
+    if digits.startswith('0'):
+        return country_code + digits[1:]
+    if digits.startswith(country_code) or country_code.startswith(digits):
+        return digits
+    return country_code + digits
+
+
+def normalize_national_id(value):
+    """``value`` upper-cased with everything but letters and digits removed, or ``None`` if nothing is left."""
+    if not value:
+        return None
+    return _NON_ALPHANUMERIC.sub('', value).upper() or None
+
+
+def normalize_username(value):
+    """``value`` lower-cased, so staff find ``Mary.W`` by typing ``mary``; ``None`` if empty."""
+    return value.lower() if value else None
@@ -0,0 +1,214 @@
+"""
+Bulk import of mobile-money settlement files into ``Repayment``.
+
+The file is CSV with a header row containing ``reference``, ``phone`` and
+``amount`` columns. Rows are matched to the borrower's Active loan through
+``Profile.phone_key`` (so ``0712 345 678`` and ``+254712345678`` find the
+same borrower) and inserted with ``bulk_create`` in batches; each batch is
+one transaction. ``Repayment.reference`` is unique, so running the
+same file twice imports nothing the second time, and a batch that loses a
+race with another import of the same references is retried.
+"""
+import csv
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import stats
+from .events import loan_event, record_events
+from .identifiers import normalize_phone
+from .models import ArchivedRepayment, Loan, LoanEvent, Profile, Repayment
+from .versions import bump_versions
+
+BATCH_SIZE = 2000
+REQUIRED_COLUMNS = ('reference', 'phone', 'amount')
+# Times a batch is retried after a concurrent import committed one of its references first.
+CONFLICT_RETRIES = 3
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.imported_amount = Decimal('0')
+        self.duplicates = 0
+        self.loans_closed = 0
+        # (line number, reference, reason) for every row that was not imported
+        self.problems = []
+
+    def reject(self, line, reference, reason):
+        self.problems.append((line, reference, reason))
+
+    def merge(self, other):
+        self.imported += other.imported
+        self.imported_amount += other.imported_amount
+        self.duplicates += other.duplicates
+        self.loans_closed += other.loans_closed
+        self.problems.extend(other.problems)
+
+    @property
+    def rejected(self):
+        return len(self.problems)
+
+    def summary(self):
+        return (
+            f'{self.imported} repayment(s) imported totalling {self.imported_amount}, '
+            f'{self.loans_closed} loan(s) paid off, {self.duplicates} duplicate(s) skipped, '
+            f'{self.rejected} line(s) rejected'
+        )
+
+
+def _parse(reader, report):
+    """Yield (line, reference, phone, amount) for well-formed rows; reject the rest."""
+    for line, row in enumerate(reader, start=2):
+        reference = (row.get('reference') or '').strip()
+        phone = (row.get('phone') or '').strip()
+        if not reference or not phone:
+            report.reject(line, reference, 'missing reference or phone')
+            continue
+        if len(reference) > Repayment._meta.get_field('reference').max_length:
+            report.reject(line, reference, 'reference too long')
+            continue
+        try:
+            amount = Decimal((row.get('amount') or '').strip()).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            report.reject(line, reference, 'invalid amount')
+            continue
+        if amount <= 0:
+            report.reject(line, reference, 'amount must be positive')
+            continue
+        yield line, reference, phone, amount
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _import_batch(batch, seen_references, actor=None):
+    """
+    Import ``batch`` in one transaction. Returns its ``ImportReport`` and the
+    references it imported, for the caller to keep once the transaction commits.
+    """
+    report = ImportReport()
+    imported_references = set()
+    references = [reference for _, reference, _, _ in batch]
+    phones = {phone: normalize_phone(phone) for _, _, phone, _ in batch}
+
+    with transaction.atomic():
+        # Settlements of archived loans (core.archive) count as imported too.
+        existing = set(
+            Repayment.objects.filter(reference__in=references).values_list('reference', flat=True).union(
+                ArchivedRepayment.objects.filter(reference__in=references).values_list('reference', flat=True),
+            )
+        )
+
+        borrowers = defaultdict(list)
+        keys = set(phones.values()) - {None}
+        for key, user_id in Profile.objects.filter(phone_key__in=keys).values_list('phone_key', 'user_id'):
+            borrowers[key].append(user_id)
+        user_ids = {ids[0] for ids in borrowers.values() if len(ids) == 1}
+        loans = {
+            loan.borrower_id: loan
+            for loan in Loan.objects.select_for_update().filter(borrower_id__in=user_ids, status='Active')
+        }
+
+        now = timezone.now()
+        repayments = []
+        # (repayment, loan, balance after it) for the event log
+        received = []
+        touched = {}
+        for line, reference, phone, amount in batch:
+            if reference in existing:
+                report.duplicates += 1
+                continue
+            if reference in seen_references or reference in imported_references:
+                report.reject(line, reference, 'reference repeated in file')
+                continue
+            ids = borrowers.get(phones[phone])
+            if not ids:
+                report.reject(line, reference, 'no borrower with this phone number')
+                continue
+            if len(ids) > 1:
+                report.reject(line, reference, 'phone number matches several borrowers')
+                continue
+            loan = loans.get(ids[0])
+            if loan is None:
+                report.reject(line, reference, 'borrower has no active loan')
+                continue
+            if loan.balance <= 0:
+                # An earlier row of this file cleared it.
+                report.reject(line, reference, 'loan already paid off')
+                continue
+            imported_references.add(reference)
+            repayments.append(Repayment(loan=loan, amount=amount, reference=reference))
+            loan.amount_repaid += amount
+            loan.last_repayment_at = now
+            touched[loan.pk] = loan
+            received.append((repayments[-1], loan, loan.balance))
+
+        if not repayments:
+            return report, imported_references
+        # Signals do not fire for bulk_create, so the denormalized totals are maintained here.
+        Repayment.objects.bulk_create(repayments, batch_size=BATCH_SIZE)
+        Loan.objects.bulk_update(touched.values(), ['amount_repaid', 'last_repayment_at'], batch_size=BATCH_SIZE)
+
+        paid_off = [loan for loan in touched.values() if loan.balance <= 0]
+        if paid_off:
+            Loan.objects.filter(pk__in=[loan.pk for loan in paid_off], status='Active').update(status='Paid')
+            stats.record_loan_transition('Active', 'Paid', count=len(paid_off),
+                                         amount=sum(loan.amount for loan in paid_off))
+        events = [
+            loan_event(
+                LoanEvent.REPAID, loan, actor, amount=repayment.amount, balance=balance,
+                repayment_id=repayment.pk, reference=repayment.reference, status='Active',
+            )
+            for repayment, loan, balance in received
+        ]
+        for loan in paid_off:
+            loan.status = 'Paid'
+            events.append(loan_event(LoanEvent.PAID_OFF, loan, actor))
+        record_events(events)
+
+        total = sum(repayment.amount for repayment in repayments)
+        stats.record_repaid(total)
+        bump_versions(loan.borrower_id for loan in touched.values())
+        report.imported += len(repayments)
+        report.imported_amount += total
+        report.loans_closed += len(paid_off)
+    return report, imported_references
+
+
+def import_repayments(lines, batch_size=BATCH_SIZE, actor=None):
+    """
+    Import settlement rows from an iterable of CSV text lines and return an
+    ``ImportReport``. ``actor`` is the staff member the events are logged for.
+    """
+    report = ImportReport()
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        report.reject(1, '', f"missing column(s): {', '.join(missing)}")
+        return report
+
+    seen_references = set()
+    for batch in _batches(_parse(reader, report), batch_size):
+        for attempt in range(CONFLICT_RETRIES + 1):
+            try:
+                batch_report, imported_references = _import_batch(batch, seen_references, actor)
+                break
+            except IntegrityError:
+                # A reference was committed by another import after this batch looked for it;
+                # the next attempt counts it as a duplicate.
+                if attempt == CONFLICT_RETRIES:
+                    raise
+        report.merge(batch_report)
+        seen_references |= imported_references
+    return report
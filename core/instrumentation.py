@@ -0,0 +1,200 @@
+"""
+Per-request query and latency instrumentation.
+
+``RequestInstrumentationMiddleware`` (enabled with ``settings.REQUEST_INSTRUMENTATION``)
+records, for each resolved URL name, the SQL query count, total DB time,
+repeated queries and template render time. It adds a ``Server-Timing``
+header and logs requests that exceed their budget. Views declare a query
+budget with ``@query_budget(n)``; the latency budget is global
+(``settings.REQUEST_LATENCY_BUDGET_MS``).
+
+Render time is measured by wrapping the Django template backend's
+``Template.render`` only while an instrumented request is in flight
+(``timing_renders``); outside those requests, and with instrumentation off,
+templates render unpatched.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger('core.instrumentation')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def query_budget(queries):
+    """Declare the maximum number of SQL queries one request to the view may run."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    return getattr(view, 'query_budget', getattr(settings, 'DEFAULT_QUERY_BUDGET', None))
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = []  # (sql, params, duration in seconds)
+        self.render_time = 0.0
+        self._render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(); times every query.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, time.perf_counter() - start))
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    @property
+    def duplicate_queries(self):
+        """Queries repeated with identical SQL and parameters."""
+        counts = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return sum(count - 1 for count in counts.values())
+
+    @property
+    def similar_queries(self):
+        """Queries repeated with the same SQL but any parameters -- the N+1 signature."""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return sum(count - 1 for count in counts.values())
+
+
+_original_render = DjangoTemplate.render
+_render_lock = threading.Lock()
+_render_timers = 0
+
+
+def _instrumented_render(self, context=None, request=None):
+    metrics = _current.get()
+    if metrics is None:
+        return _original_render(self, context, request)
+    metrics._render_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        metrics._render_depth -= 1
+        if not metrics._render_depth:
+            metrics.render_time += time.perf_counter() - start
+
+
+@contextmanager
+def timing_renders():
+    """Time template renders for the instrumented requests running until the block exits."""
+    global _render_timers
+    with _render_lock:
+        if not _render_timers:
+            DjangoTemplate.render = _instrumented_render
+        _render_timers += 1
+    try:
+        yield
+    finally:
+        with _render_lock:
+            _render_timers -= 1
+            if not _render_timers:
+                DjangoTemplate.render = _original_render
+
+
+def _server_timing(metrics, total):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.query_count} queries"',
+        f'render;dur={metrics.render_time * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _install(stack, metrics):
+        stack.enter_context(timing_renders())
+        # Connections are per thread, so this must run where the queries will.
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self._install(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        stack = ExitStack()
+        try:
+            # The async ORM runs queries on the request's thread-sensitive executor.
+            await sync_to_async(self._install)(stack, metrics)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        request.metrics = metrics
+        response['Server-Timing'] = _server_timing(metrics, total)
+        self.check_budgets(request, metrics, total)
+        return response
+
+    def check_budgets(self, request, metrics, total):
+        match = request.resolver_match
+        if match is None:
+            return
+        budget = get_query_budget(match.func)
+        latency_budget = getattr(settings, 'REQUEST_LATENCY_BUDGET_MS', None)
+        over_queries = budget is not None and metrics.query_count > budget
+        over_latency = latency_budget is not None and total * 1000 > latency_budget
+        log = logger.warning if over_queries or over_latency else logger.debug
+        log(
+            '%s %s: %d queries (budget %s, %d duplicate, %d similar), db %.1fms, render %.1fms, total %.1fms',
+            request.method, match.view_name, metrics.query_count, budget, metrics.duplicate_queries,
+            metrics.similar_queries, metrics.db_time * 1000, metrics.render_time * 1000, total * 1000,
+            extra={
+                'view': match.view_name,
+                'queries': metrics.query_count,
+                'query_budget': budget,
+                'duplicate_queries': metrics.duplicate_queries,
+                'db_ms': round(metrics.db_time * 1000, 3),
+                'render_ms': round(metrics.render_time * 1000, 3),
+                'total_ms': round(total * 1000, 3),
+            },
+        )
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import stats
+from .events import loan_event, record_events
+from .models import Loan, LoanEvent
+from .versions import bump_versions
+
+
+def decide_pending_loans(queryset, new_status, actor=None):
+    """
+    Move every Pending loan in ``queryset`` to ``new_status`` with one conditional UPDATE.
+
+    Loans that are no longer Pending (e.g. decided by another staff member in
+    the meantime) are left untouched. Each loan changed gets an approved or
+    rejected event by ``actor``. Returns the number of loans changed.
+    """
+    pending = queryset.filter(status='Pending').select_related(None).order_by()
+    kind = LoanEvent.APPROVED if new_status == 'Active' else LoanEvent.REJECTED
+    with transaction.atomic():
+        # Lock the rows so the amounts describe exactly what the UPDATE changes.
+        rows = list(pending.select_for_update().order_by('pk').values_list('pk', 'amount', 'borrower_id'))
+        if not rows:
+            return 0
+        now = timezone.now()
+        changed = pending.update(status=new_status, decided_at=now)
+        if changed != len(rows):
+            # Another writer decided some of them first; count and log only the loans this UPDATE moved.
+            rows = Loan.objects.filter(pk__in=[pk for pk, _, _ in rows], status=new_status, decided_at=now)
+            rows = list(rows.order_by('pk').values_list('pk', 'amount', 'borrower_id'))
+        stats.record_loan_transition('Pending', new_status, count=len(rows), amount=sum(amount for _, amount, _ in rows))
+        record_events(
+            loan_event(kind, Loan(pk=pk, amount=amount, borrower_id=borrower_id, status=new_status), actor)
+            for pk, amount, borrower_id in rows
+        )
+        bump_versions(borrower_id for _, _, borrower_id in rows)
+    return changed
@@ -0,0 +1,42 @@
+"""
+Text lookups that can use a plain B-tree index, for staff search.
+
+``startswith`` / ``istartswith`` compile to ``LIKE``, which SQLite only serves
+from an index declared ``COLLATE NOCASE`` and PostgreSQL only with
+``text_pattern_ops`` (or the C collation), so prefix searches over large
+tables end up scanning them.
+
+``Prefix`` is written as a range instead, which is only a prefix match when the
+column compares code point by code point. SQLite's default BINARY collation
+does; PostgreSQL columns use the database's locale collation, which orders
+punctuation and case differently, so there the comparison is made
+``COLLATE "C"`` and served from the matching expression indexes created by
+migration 0019.
+"""
+from django.db.models import CharField, Lookup
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+@CharField.register_lookup
+class Prefix(Lookup):
+    """
+    ``field__prefix='ab'``: case-sensitive prefix match written as the range
+    ``'ab' <= field < 'ac'``, which any index on the column can seek (on
+    PostgreSQL, an index on ``field COLLATE "C"``).
+    """
+    lookup_name = 'prefix'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection, collation=None):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        if collation:
+            lhs = f'{lhs} COLLATE {connection.ops.quote_name(collation)}'
+        prefix = str(self.rhs)
+        if not prefix or prefix[-1] == MAX_CHAR:
+            return f'{lhs} >= %s', [*lhs_params, prefix]
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return f'({lhs} >= %s AND {lhs} < %s)', [*lhs_params, prefix, *lhs_params, upper]
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(compiler, connection, collation='C')
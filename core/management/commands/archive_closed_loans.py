@@ -0,0 +1,32 @@
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.archive import ARCHIVE_AFTER_DAYS, BATCH_SIZE, archive_closed_loans
+
+class Command(BaseCommand):
+    help = (
+        'Move Paid and Rejected loans closed before a cutoff, with their repayments, into the archive tables, '
+        'one transaction per batch. Staff pages and exports only show them on request; '
+        'restore_archived_loans moves them back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=date.fromisoformat, help='Archive loans closed before this date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--older-than', type=int, default=ARCHIVE_AFTER_DAYS, metavar='DAYS',
+            help=f'Archive loans closed more than this many days ago (default: {ARCHIVE_AFTER_DAYS})',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Loans moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['before']:
+            cutoff = timezone.make_aware(datetime.combine(options['before'], time.min))
+        else:
+            cutoff = timezone.now() - timedelta(days=options['older_than'])
+        loans, repayments = archive_closed_loans(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {loans} loan(s) and {repayments} repayment(s) closed before {cutoff:%Y-%m-%d %H:%M}'
+        ))
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import HOT_PATH, SCENARIOS, run_archive_benchmark
+
+class Command(BaseCommand):
+    help = (
+        'Create a synthetic closed-loan history (rolled back afterwards), benchmark the hot-path views with it '
+        'in the live tables and again after archive_closed_loans has moved it out, and report JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=1_000_000, help='Rows of closed loans and repayments')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--view', action='append', dest='views', help=f'Only benchmark this URL name (repeatable; default: {", ".join(HOT_PATH)})')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        unknown = set(options['views'] or []) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            raise CommandError(f"Unknown view(s): {', '.join(sorted(unknown))}")
+        if options['history'] < 1 or options['iterations'] < 1:
+            raise CommandError('--history and --iterations must be at least 1')
+        report = run_archive_benchmark(
+            history=options['history'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            names=options['views'],
+            seed=options['seed'],
+        )
+        self.stdout.write(json.dumps(report, indent=2))
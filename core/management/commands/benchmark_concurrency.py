@@ -0,0 +1,93 @@
+import http.cookiejar
+import json
+import re
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import percentile
+
+class Command(BaseCommand):
+    help = (
+        'Fire many simultaneous requests at one or more running deployments and compare throughput and latency. '
+        'Example: start "gunicorn -b :8001" and "SERVER_MODE=asgi gunicorn -b :8002" with '
+        'SIMULATED_DB_LATENCY_MS=50, then run '
+        'benchmark_concurrency http://localhost:8001 http://localhost:8002 --path /staff/loans/ --username admin --password ...'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_urls', nargs='+', help='Base URL of each deployment to compare')
+        parser.add_argument('--path', default='/', help='Path to request on every deployment')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=512)
+        parser.add_argument('--timeout', type=float, default=60)
+        parser.add_argument('--username', help='Log in through /accounts/login/ first')
+        parser.add_argument('--password')
+
+    def handle(self, *args, **options):
+        report = {}
+        for base_url in options['base_urls']:
+            report[base_url] = self.run(base_url.rstrip('/'), options)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def login(self, base_url, options):
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        if not options['username']:
+            return jar
+        login_url = f'{base_url}/accounts/login/'
+        page = opener.open(login_url, timeout=options['timeout']).read().decode()
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page)
+        if not token:
+            raise CommandError(f'No CSRF token on {login_url}')
+        data = urllib.parse.urlencode({
+            'username': options['username'],
+            'password': options['password'] or '',
+            'csrfmiddlewaretoken': token.group(1),
+        }).encode()
+        request = urllib.request.Request(login_url, data=data, headers={'Referer': login_url})
+        opener.open(request, timeout=options['timeout'])
+        if not any(cookie.name == 'sessionid' for cookie in jar):
+            raise CommandError(f'Login to {base_url} failed')
+        return jar
+
+    def run(self, base_url, options):
+        jar = self.login(base_url, options)
+        url = base_url + options['path']
+
+        def fetch(_):
+            # One opener per request: the handlers are not thread-safe, the cookies are read-only here.
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+            start = time.perf_counter()
+            try:
+                with opener.open(url, timeout=options['timeout']) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                ok = False
+            return ok, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        timings = [ms for ok, ms in results if ok]
+        stats = {
+            'requests': len(results),
+            'errors': len(results) - len(timings),
+            'concurrency': options['concurrency'],
+            'throughput_rps': round(len(timings) / elapsed, 2),
+        }
+        if timings:
+            stats.update({
+                'mean_ms': round(statistics.fmean(timings), 2),
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+            })
+        return stats
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import run_render_benchmarks
+from core.models import Loan
+from core.pagination import MAX_PAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Time rendering of the staff dashboard and loan list: re-parsing templates per render versus the '
+        'cached loader, with fragment caches cold and warm. Seed a large book first '
+        '(seed_loanbook --users 3500 gives roughly 10k loans) and report JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--page-size', type=int, default=MAX_PAGE_SIZE, help='Rows per page rendered')
+        parser.add_argument('--output', '-o', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        if not 1 <= options['page_size'] <= MAX_PAGE_SIZE:
+            raise CommandError(f'--page-size must be between 1 and {MAX_PAGE_SIZE}')
+
+        report = {
+            'loans': Loan.objects.count(),
+            'page_size': options['page_size'],
+            'templates': run_render_benchmarks(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                page_size=options['page_size'],
+            ),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import run_scoring_benchmark
+
+class Command(BaseCommand):
+    help = (
+        'Score a synthetic queue of pending loans (created and rolled back inside one transaction) with the '
+        'NumPy batch scorer and a per-loan Python loop, and report the timings as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['loans'] < 1:
+            raise CommandError('--loans must be at least 1')
+        self.stdout.write(json.dumps(run_scoring_benchmark(loans=options['loans'], seed=options['seed']), indent=2))
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import run_search_benchmark
+from core.search import MAX_RESULTS
+
+class Command(BaseCommand):
+    help = (
+        'Create synthetic borrower profiles (rolled back afterwards) and time the staff borrower search '
+        'for each kind of term, against an icontains scan of the same columns; reports JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1_000_000)
+        parser.add_argument('--iterations', type=int, default=50, help='Searches of each kind')
+        parser.add_argument('--scan-iterations', type=int, default=3,
+                            help='Runs of the icontains scan per kind (0 to skip it)')
+        parser.add_argument('--limit', type=int, default=10, help='Results per search')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['profiles'] < 1 or options['iterations'] < 1:
+            raise CommandError('--profiles and --iterations must be at least 1')
+        if not 1 <= options['limit'] <= MAX_RESULTS:
+            raise CommandError(f'--limit must be between 1 and {MAX_RESULTS}')
+        if options['scan_iterations'] < 0:
+            raise CommandError('--scan-iterations must not be negative')
+        report = run_search_benchmark(
+            profiles=options['profiles'],
+            iterations=options['iterations'],
+            scan_iterations=options['scan_iterations'],
+            limit=options['limit'],
+            seed=options['seed'],
+        )
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from core.benchmarks import percentile
+from core.models import Loan, Profile, Repayment
+
+PROFILES = ('default', 'tuned')
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure write throughput and "database is locked" errors under multi-process contention, '
+        'with the stock and the tuned SQLite profile (SQLITE_PROFILE). Every profile runs on a fresh '
+        'scratch database; each worker process posts repayments the way repay_loan does.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent writer processes')
+        parser.add_argument('--transactions', type=int, default=200, help='Repayments per worker')
+        # Internal: run as one of the writer processes
+        parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+        parser.add_argument('--setup', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['setup']:
+            return self.create_loans(options['workers'])
+        if options['worker'] is not None:
+            return self.write(options['worker'], options['transactions'])
+
+        report = {}
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as tmp:
+                report[profile] = self.run(profile, os.path.join(tmp, 'bench.sqlite3'), options)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def manage(self, env, *args, **kwargs):
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), *args]
+        return subprocess.Popen(command, env=env, text=True, **kwargs)
+
+    def run(self, profile, path, options):
+        env = {
+            **os.environ,
+            'DATABASE_URL': f'sqlite:///{path}',
+            'SQLITE_PROFILE': profile,
+            'REQUEST_INSTRUMENTATION': '0',
+            'SIMULATED_DB_LATENCY_MS': '0',
+        }
+        for args in (['migrate', '-v', '0'], ['benchmark_sqlite_writes', '--setup', '--workers', str(options['workers'])]):
+            if self.manage(env, *args).wait():
+                raise CommandError(f'{" ".join(args)} failed for profile {profile}')
+
+        workers = [
+            self.manage(
+                env, 'benchmark_sqlite_writes', '--worker', str(i), '--transactions', str(options['transactions']),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            )
+            for i in range(options['workers'])
+        ]
+        # Start every writer together once they have all set Django up.
+        for worker in workers:
+            worker.stdout.readline()
+        start = time.perf_counter()
+        for worker in workers:
+            worker.stdin.write('go\n')
+            worker.stdin.flush()
+        results = [json.loads(worker.communicate()[0]) for worker in workers]
+        elapsed = time.perf_counter() - start
+
+        timings = [ms for result in results for ms in result['timings']]
+        attempted = sum(len(result['timings']) + result['locked'] + result['failed'] for result in results)
+        locked = sum(result['locked'] for result in results)
+        stats = {
+            'workers': options['workers'],
+            'transactions': attempted,
+            'committed': len(timings),
+            'locked_errors': locked,
+            'lock_error_rate': round(locked / attempted, 4) if attempted else 0,
+            'other_errors': sum(result['failed'] for result in results),
+            'throughput_tps': round(len(timings) / elapsed, 2),
+        }
+        if timings:
+            stats.update({
+                'mean_ms': round(statistics.fmean(timings), 2),
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+            })
+        return stats
+
+    def create_loans(self, workers):
+        for i in range(workers):
+            user = User.objects.create_user(f'writer-{i}')
+            Profile.objects.create(user=user, verified_status=True, monthly_income=5000)
+            Loan.objects.create(borrower=user, amount=10 ** 6, term_days=30, status='Active')
+
+    def write(self, worker, transactions):
+        loan_id = Loan.objects.get(borrower__username=f'writer-{worker}').pk
+        connection.close()
+        self.stdout.write('ready')
+        self.stdout.flush()
+        sys.stdin.readline()
+
+        timings, locked, failed = [], 0, 0
+        for _ in range(transactions):
+            start = time.perf_counter()
+            try:
+                # Read, then write, in one transaction: the shape of repay_loan.
+                with transaction.atomic():
+                    loan = Loan.objects.get(pk=loan_id)
+                    Repayment.objects.create(loan=loan, amount=1)
+                    loan.refresh_from_db(fields=['amount_repaid', 'last_repayment_at'])
+            except OperationalError as exc:
+                if 'locked' in str(exc) or 'busy' in str(exc):
+                    locked += 1
+                else:
+                    failed += 1
+            else:
+                timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(json.dumps({'timings': timings, 'locked': locked, 'failed': failed}))
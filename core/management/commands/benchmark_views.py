@@ -0,0 +1,71 @@
+import json
+import platform
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from core.benchmarks import SCENARIOS, run_benchmarks
+from core.models import Loan, Repayment
+
+class Command(BaseCommand):
+    help = 'Benchmark every core view through the test client and report latency percentiles and query counts as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--view', action='append', dest='views', help='Only benchmark this URL name (repeatable)')
+        parser.add_argument('--host', default='localhost', help='Host header to send; must be in ALLOWED_HOSTS')
+        parser.add_argument('--output', '-o', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--compare', help='Previous JSON report to print p95 / query deltas against')
+
+    def handle(self, *args, **options):
+        known = {scenario.name for scenario in SCENARIOS}
+        unknown = set(options['views'] or []) - known
+        if unknown:
+            raise CommandError(f"Unknown view(s): {', '.join(sorted(unknown))}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'users': User.objects.count(),
+                'loans': Loan.objects.count(),
+                'repayments': Repayment.objects.count(),
+            },
+            'views': run_benchmarks(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                names=options['views'],
+                host=options['host'],
+            ),
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                self.print_comparison(json.load(fh)['views'], report['views'])
+
+    def print_comparison(self, before, after):
+        self.stderr.write(f"{'view':<22} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'queries':>9}")
+        for name, stats in after.items():
+            if name not in before:
+                continue
+            old = before[name]
+            change = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            self.stderr.write(
+                f"{name:<22} {old['p95_ms']:>11.2f} {stats['p95_ms']:>10.2f} {change:>+7.1f}% "
+                f"{old['queries']:>4}->{stats['queries']:<4}"
+            )
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from core.exports import LEDGERS, stream_ledger
+from core.forms import LedgerExportForm
+
+class Command(BaseCommand):
+    help = 'Stream loans or repayments as CSV or JSON Lines, optionally gzipped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(LEDGERS))
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--start', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only loans (or repayments of loans) with this status')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument(
+            '--include-archived', dest='archived', action='store_true', help='Also export archived loans and repayments',
+        )
+        parser.add_argument('--output', '-o', help='File to write to (default: stdout)')
+
+    def handle(self, *args, **options):
+        form = LedgerExportForm({
+            key: options[key] for key in ('format', 'start', 'end', 'status', 'gzip', 'archived') if options[key]
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        chunks = stream_ledger(
+            options['kind'], form.cleaned_data['format'], form.cleaned_data['gzip'],
+            include_archived=form.cleaned_data['archived'], **form.filters(),
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        elif form.cleaned_data['gzip']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,31 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from core.imports import BATCH_SIZE, import_repayments
+
+class Command(BaseCommand):
+    help = 'Import a mobile-money settlement CSV (reference, phone, amount) as repayments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Settlement file to import')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--report', help='Write rejected lines to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as settlement:
+                report = import_repayments(settlement, batch_size=options['batch_size'])
+        except OSError as exc:
+            raise CommandError(exc)
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow(['line', 'reference', 'reason'])
+                writer.writerows(report.problems)
+        else:
+            for line, reference, reason in report.problems:
+                self.stdout.write(f'line {line} ({reference or "-"}): {reason}')
+
+        style = self.style.WARNING if report.problems else self.style.SUCCESS
+        self.stdout.write(style(report.summary()))
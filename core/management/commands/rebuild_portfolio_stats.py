@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from core.stats import compute_portfolio_stats, get_portfolio_stats, rebuild_portfolio_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the staff dashboard portfolio counters from the loan, repayment and profile tables'
+
+    def handle(self, *args, **options):
+        before = {field: getattr(get_portfolio_stats(), field) for field in compute_portfolio_stats()}
+        stats = rebuild_portfolio_stats()
+        for field, old in before.items():
+            new = getattr(stats, field)
+            if old != new:
+                self.stdout.write(f'{field}: {old} -> {new}')
+        self.stdout.write(self.style.SUCCESS('Portfolio stats rebuilt'))
@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Abs, Coalesce
+from core.models import Loan, Repayment
+from core.versions import bump_versions
+
+class Command(BaseCommand):
+    help = 'Check Loan.amount_repaid / last_repayment_at against the repayments table and optionally repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite drifted loans from their repayments')
+
+    def handle(self, *args, **options):
+        repayments = Repayment.objects.filter(loan=OuterRef('pk')).order_by().values('loan')
+        actual_total = Coalesce(
+            Subquery(repayments.annotate(total=Sum('amount')).values('total')),
+            0,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+        actual_last = Subquery(repayments.annotate(last=Max('date')).values('last'))
+
+        drifted = (
+            Loan.objects.annotate(
+                actual_total=actual_total,
+                actual_last=actual_last,
+                # SQLite sums decimals as floats, so compare totals to the cent
+                total_drift=Abs(F('amount_repaid') - actual_total),
+            )
+            # lt/gt rather than negated equality so NULLs don't match everything
+            .filter(
+                Q(total_drift__gt=Decimal('0.005'))
+                | Q(last_repayment_at__isnull=True, actual_last__isnull=False)
+                | Q(last_repayment_at__isnull=False, actual_last__isnull=True)
+                | Q(last_repayment_at__lt=F('actual_last'))
+                | Q(last_repayment_at__gt=F('actual_last'))
+            )
+            .order_by('pk')
+        )
+
+        borrower_ids = []
+        for loan in drifted.iterator():
+            borrower_ids.append(loan.borrower_id)
+            self.stdout.write(
+                f'Loan {loan.pk}: stored {loan.amount_repaid} (last {loan.last_repayment_at}), '
+                f'actual {loan.actual_total} (last {loan.actual_last})'
+            )
+
+        count = len(borrower_ids)
+        if not count:
+            self.stdout.write(self.style.SUCCESS('All loan balances are consistent'))
+            return
+
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING(f'{count} loan(s) drifted; re-run with --fix to repair'))
+            return
+
+        with transaction.atomic():
+            fixed = Loan.objects.filter(pk__in=drifted.values('pk')).update(
+                amount_repaid=actual_total, last_repayment_at=actual_last
+            )
+            bump_versions(borrower_ids)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {fixed} loan(s)'))
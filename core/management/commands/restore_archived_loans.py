@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from core.archive import BATCH_SIZE, restore_loans
+from core.models import ArchivedLoan
+
+class Command(BaseCommand):
+    help = 'Move archived loans, with their repayments, back into the live tables under their original ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loan', type=int, action='append', dest='loans', help='Restore this loan id (repeatable)')
+        parser.add_argument('--borrower', action='append', dest='borrowers', help='Restore every archived loan of this username (repeatable)')
+        parser.add_argument('--all', action='store_true', help='Restore the whole archive')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Loans moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if not (options['loans'] or options['borrowers'] or options['all']):
+            raise CommandError('Pass --loan, --borrower or --all')
+        loans = ArchivedLoan.objects.all()
+        if not options['all']:
+            selected = Q()
+            if options['loans']:
+                selected |= Q(pk__in=options['loans'])
+            if options['borrowers']:
+                selected |= Q(borrower__username__in=options['borrowers'])
+            loans = loans.filter(selected)
+        loans, repayments = restore_loans(loans, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Restored {loans} loan(s) and {repayments} repayment(s)'))
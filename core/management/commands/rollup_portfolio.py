@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.models import DailyRollup
+from core.rollups import rollup_portfolio, watermark
+
+class Command(BaseCommand):
+    help = (
+        'Fill the daily portfolio rollups used by the staff trends pages, from the last rolled-up day '
+        'through today; run at least daily. --since backfills or recomputes older days.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='Recompute from this date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=date.fromisoformat, help='Stop at this date instead of today')
+        parser.add_argument('--rebuild', action='store_true', help='Delete every rollup and recompute from the first activity')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            if options['since']:
+                raise CommandError('--rebuild and --since are mutually exclusive')
+            DailyRollup.objects.all().delete()
+        since = options['since'] or watermark()
+        if since is None:
+            self.stdout.write('Nothing to roll up yet')
+            return
+        days = rollup_portfolio(since=since, until=options['until'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {days} day(s) from {since}'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.models import Loan
+from core.scoring import compute_scores, load_batch, save_scores
+
+class Command(BaseCommand):
+    help = 'Score every Pending loan for affordability and risk (see core.scoring) so staff can work the queue by score'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unscored', action='store_true', help='Only score loans that have no score yet')
+
+    def handle(self, *args, **options):
+        queryset = Loan.objects.filter(score__isnull=True) if options['unscored'] else None
+        start = time.perf_counter()
+        batch = load_batch(queryset)
+        loaded = time.perf_counter()
+        scores, flags = compute_scores(batch)
+        computed = time.perf_counter()
+        saved = save_scores(batch, scores, flags)
+        done = time.perf_counter()
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {saved} pending loan(s): load {loaded - start:.2f}s, '
+            f'score {computed - loaded:.3f}s, save {done - computed:.2f}s'
+        ))
@@ -0,0 +1,130 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.models import Loan, Profile, Repayment
+from core.stats import rebuild_portfolio_stats
+from core.versions import bump_versions
+
+BATCH_SIZE = 1000
+CENTS = Decimal('0.01')
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic loan book (users, profiles, loans, repayments) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--loans-per-user', type=int, default=3, help='Maximum loans per borrower')
+        parser.add_argument('--days', type=int, default=730, help='Spread loan history over this many days')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help='Username prefix; must not already be in use')
+        parser.add_argument('--password', default='seedpass123', help='Password for every seeded user')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users with prefix "{prefix}-" already exist; pick another --prefix')
+
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        with transaction.atomic():
+            users = self.create_users(rng, options)
+            loans, repayments = self.create_loans(rng, users, now, options)
+            rebuild_portfolio_stats()
+            bump_versions()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(loans)} loans and {len(repayments)} repayments (seed {options["seed"]})'
+        ))
+
+    def create_users(self, rng, options):
+        password = make_password(options['password'])  # hash once, not per user
+        prefix = options['prefix']
+        users = User.objects.bulk_create(
+            (User(username=f'{prefix}-{i}', email=f'{prefix}-{i}@example.com', password=password)
+             for i in range(options['users'])),
+            batch_size=BATCH_SIZE,
+        )
+        if not users or users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=f'{prefix}-').order_by('pk'))
+        Profile.objects.bulk_create(
+            (Profile(
+                user=user,
+                national_id=f'{rng.randrange(10 ** 7, 10 ** 8)}',
+                phone_number=f'07{rng.randrange(10 ** 8):08d}',
+                monthly_income=Decimal(rng.randrange(200, 20000)),
+                verified_status=rng.random() < 0.85,
+            ).set_lookup_keys() for user in users),
+            batch_size=BATCH_SIZE,
+        )
+        return users
+
+    def create_loans(self, rng, users, now, options):
+        loans = []
+        for user in users:
+            for n in range(rng.randint(0, options['loans_per_user'])):
+                # Only a borrower's most recent loan may still be open.
+                last = n == options['loans_per_user'] - 1 or rng.random() < 0.4
+                status = rng.choice(['Pending', 'Active', 'Paid', 'Rejected'] if last else ['Paid', 'Paid', 'Rejected'])
+                created_at = now - timedelta(seconds=rng.randrange(options['days'] * 86400))
+                term_days = rng.choice([7, 14, 30, 60, 90])
+                loans.append(Loan(
+                    borrower=user,
+                    amount=Decimal(rng.randrange(100, 5000)),
+                    term_days=term_days,
+                    status=status,
+                    created_at=created_at,
+                    due_date=created_at.date() + timedelta(days=term_days),
+                    decided_at=None if status == 'Pending' else created_at,
+                ))
+                if last:
+                    break
+
+        repayments = []
+        for loan in loans:
+            if loan.status == 'Paid':
+                target = loan.amount
+            elif loan.status == 'Active':
+                target = (loan.amount * Decimal(rng.random())).quantize(CENTS)
+            else:
+                continue
+            paid, date = Decimal('0'), loan.created_at
+            while paid < target:
+                amount = min(target - paid, (loan.amount * Decimal(rng.uniform(0.1, 0.6))).quantize(CENTS))
+                if amount <= 0:
+                    break
+                date = min(now, date + timedelta(hours=rng.randrange(1, 24 * 14)))
+                repayments.append(Repayment(loan=loan, amount=amount, date=date))
+                paid += amount
+            loan.amount_repaid = paid
+            loan.last_repayment_at = date if paid else None
+
+        # auto_now_add overrides the generated timestamps on insert; bulk_update
+        # writes them back without going through pre_save.
+        created_at = [loan.created_at for loan in loans]
+        Loan.objects.bulk_create(loans, batch_size=BATCH_SIZE)
+        for loan, value in zip(loans, created_at):
+            loan.created_at = value
+        Loan.objects.bulk_update(loans, ['created_at'], batch_size=BATCH_SIZE)
+
+        # Borrowers joined when they first applied, so rollups see them spread over time.
+        joined = {}
+        for loan in loans:
+            joined[loan.borrower] = min(joined.get(loan.borrower, loan.created_at), loan.created_at)
+        for user, date_joined in joined.items():
+            user.date_joined = date_joined
+        User.objects.bulk_update(list(joined), ['date_joined'], batch_size=BATCH_SIZE)
+
+        dates = [repayment.date for repayment in repayments]
+        for repayment in repayments:
+            repayment.loan_id = repayment.loan.pk
+        Repayment.objects.bulk_create(repayments, batch_size=BATCH_SIZE)
+        for repayment, value in zip(repayments, dates):
+            repayment.date = value
+        Repayment.objects.bulk_update(repayments, ['date'], batch_size=BATCH_SIZE)
+        return loans, repayments
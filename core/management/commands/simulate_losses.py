@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.simulation import DEFAULT_SCENARIOS, MAX_SCENARIOS, run_simulation, simulate_portfolio, synthetic_book
+from core.versions import PORTFOLIO, get_version
+
+class Command(BaseCommand):
+    help = (
+        'Run the Monte Carlo loss simulation over the Active loan book (see core.simulation), optionally '
+        'across several processes, and store the result for the staff risk page'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', type=int, default=DEFAULT_SCENARIOS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=1, help='Processes to spread the scenario blocks over')
+        parser.add_argument('--json', action='store_true', help='Print the full result as JSON')
+        parser.add_argument('--synthetic', type=int, metavar='LOANS',
+                            help='Benchmark on a random book of this many loans instead of the database (not stored)')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['scenarios'] <= MAX_SCENARIOS:
+            raise CommandError(f'--scenarios must be between 1 and {MAX_SCENARIOS}')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        start = time.perf_counter()
+        if options['synthetic']:
+            result = run_simulation(
+                synthetic_book(options['synthetic'], seed=options['seed']),
+                scenarios=options['scenarios'],
+                seed=options['seed'],
+                workers=options['workers'],
+            )
+        else:
+            result = simulate_portfolio(
+                get_version(PORTFOLIO),
+                scenarios=options['scenarios'],
+                seed=options['seed'],
+                workers=options['workers'],
+                refresh=True,
+            )
+        elapsed = time.perf_counter() - start
+        if options['json']:
+            self.stdout.write(json.dumps({**result, 'seconds': round(elapsed, 3)}, indent=2))
+            return
+        self.stdout.write(
+            f"{result['scenarios']} scenarios over {result['loans']} loans in {elapsed:.2f}s\n"
+            f"Exposure {result['exposure']:,.2f}, expected loss {result['expected_loss']:,.2f}, "
+            f"VaR 95% {result['var_95']:,.2f}, VaR 99% {result['var_99']:,.2f}, "
+            f"expected shortfall 99% {result['expected_shortfall_99']:,.2f}"
+        )
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.aging import CHUNK_SIZE, sweep_overdue
+from core.models import Loan
+
+class Command(BaseCommand):
+    help = 'Move Active loans into their overdue aging buckets (1-30, 31-60, 61-90, 90+ days); run daily'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Loans updated per transaction')
+        parser.add_argument('--date', type=date.fromisoformat, help='Age loans as of this date (YYYY-MM-DD) instead of today')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        moved = sweep_overdue(today=options['date'], chunk_size=options['chunk_size'])
+        labels = dict(Loan.AGING_CHOICES)
+        for bucket, count in moved.items():
+            if count:
+                self.stdout.write(f'{labels[bucket]}: {count} loan(s)')
+        self.stdout.write(self.style.SUCCESS(f'Moved {sum(moved.values())} loan(s) between aging buckets'))
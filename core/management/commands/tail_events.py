@@ -0,0 +1,46 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from core.events import MAX_LIMIT, event_json, events_after
+from core.models import LoanEvent
+
+class Command(BaseCommand):
+    help = (
+        'Print loan events after an event id as JSON lines, oldest first. With --follow, keep polling '
+        'for new events; restart from the last id printed to resume without gaps or repeats.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, default=0, help='Last event id already processed')
+        parser.add_argument('--limit', type=int, default=MAX_LIMIT, help='Events read per query')
+        parser.add_argument('--kind', action='append', dest='kinds', choices=[kind for kind, _ in LoanEvent.KIND_CHOICES],
+                            help='Only events of this kind (repeatable)')
+        parser.add_argument('-f', '--follow', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --follow')
+
+    def handle(self, *args, **options):
+        if options['after'] < 0:
+            raise CommandError('--after must not be negative')
+        if not 1 <= options['limit'] <= MAX_LIMIT:
+            raise CommandError(f'--limit must be between 1 and {MAX_LIMIT}')
+        if options['interval'] <= 0:
+            raise CommandError('--interval must be positive')
+
+        after = options['after']
+        while True:
+            events = events_after(after, options['limit'], kinds=options['kinds'])
+            for event in events:
+                self.stdout.write(json.dumps(event_json(event), cls=DjangoJSONEncoder))
+            if events:
+                after = events[-1].pk
+            if len(events) == options['limit']:
+                continue
+            if not options['follow']:
+                return
+            self.stdout.flush()
+            time.sleep(options['interval'])
+            # Long-running: let CONN_MAX_AGE recycle the connection between polls.
+            close_old_connections()
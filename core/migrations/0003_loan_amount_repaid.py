@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:51
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_amount_repaid(apps, schema_editor):
+    Loan = apps.get_model("core", "Loan")
+    Repayment = apps.get_model("core", "Repayment")
+    db_alias = schema_editor.connection.alias
+    repayments = Repayment.objects.filter(loan=OuterRef("pk")).order_by().values("loan")
+    Loan.objects.using(db_alias).update(
+        amount_repaid=Coalesce(
+            Subquery(repayments.annotate(total=Sum("amount")).values("total")),
+            0,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+        last_repayment_at=Subquery(repayments.annotate(last=Max("date")).values("last")),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0002_alter_profile_monthly_income_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loan",
+            name="amount_repaid",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=10
+            ),
+        ),
+        migrations.AddField(
+            model_name="loan",
+            name="last_repayment_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_amount_repaid, migrations.RunPython.noop),
+    ]
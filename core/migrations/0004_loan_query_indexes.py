@@ -0,0 +1,77 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+OPEN_STATUSES = ["Pending", "Active"]
+
+
+def check_open_loans(apps, schema_editor):
+    """
+    Refuse to add one_open_loan_per_borrower over borrowers who already have
+    several open loans, which admin_create_loan used to allow; which of them
+    to close is for staff to decide, not this migration.
+    """
+    Loan = apps.get_model("core", "Loan")
+    open_loans = Loan.objects.using(schema_editor.connection.alias).filter(
+        status__in=OPEN_STATUSES
+    )
+    borrowers = list(
+        open_loans.values("borrower_id")
+        .annotate(loans=models.Count("pk"))
+        .filter(loans__gt=1)
+        .order_by("borrower_id")
+        .values_list("borrower_id", flat=True)
+    )
+    if not borrowers:
+        return
+    loans = open_loans.filter(borrower_id__in=borrowers).order_by("borrower_id", "pk")
+    listing = "\n".join(
+        f"  borrower {loan.borrower_id}: loan {loan.pk} ({loan.status})"
+        for loan in loans.only("borrower_id", "status")
+    )
+    raise RuntimeError(
+        f"{len(borrowers)} borrower(s) have more than one Pending or Active loan:\n"
+        f"{listing}\n"
+        "Reject or close all but one open loan per borrower, then run migrate again."
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0003_loan_amount_repaid"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["borrower", "status"], name="loan_borrower_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["status", "-created_at"], name="loan_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(fields=["-created_at"], name="loan_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="repayment",
+            index=models.Index(fields=["-date"], name="repayment_date_idx"),
+        ),
+        migrations.RunPython(check_open_loans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="loan",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["Pending", "Active"])),
+                fields=("borrower",),
+                name="one_open_loan_per_borrower",
+                violation_error_message="This borrower already has an active or pending loan.",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_loan_query_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="loan",
+            name="loan_status_created_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="loan",
+            name="loan_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"], name="loan_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(fields=["-created_at", "-id"], name="loan_created_idx"),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:56
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def create_portfolio_stats(apps, schema_editor):
+    Loan = apps.get_model("core", "Loan")
+    PortfolioStats = apps.get_model("core", "PortfolioStats")
+    Profile = apps.get_model("core", "Profile")
+    Repayment = apps.get_model("core", "Repayment")
+    db_alias = schema_editor.connection.alias
+
+    values = {"total_disbursed": 0}
+    for row in (
+        Loan.objects.using(db_alias)
+        .order_by()
+        .values("status")
+        .annotate(count=Count("id"), total=Sum("amount"))
+    ):
+        values[f"{row['status'].lower()}_loans"] = row["count"]
+        if row["status"] in ("Active", "Paid"):
+            values["total_disbursed"] += row["total"] or 0
+    values["total_users"] = Profile.objects.using(db_alias).count()
+    values["total_repaid"] = (
+        Repayment.objects.using(db_alias).aggregate(total=Sum("amount"))["total"] or 0
+    )
+    PortfolioStats.objects.using(db_alias).update_or_create(pk=1, defaults=values)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_loan_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PortfolioStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pending_loans", models.PositiveIntegerField(default=0)),
+                ("active_loans", models.PositiveIntegerField(default=0)),
+                ("paid_loans", models.PositiveIntegerField(default=0)),
+                ("rejected_loans", models.PositiveIntegerField(default=0)),
+                ("total_users", models.PositiveIntegerField(default=0)),
+                (
+                    "total_disbursed",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total_repaid",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "portfolio stats",
+            },
+        ),
+        migrations.RunPython(create_portfolio_stats, migrations.RunPython.noop),
+    ]
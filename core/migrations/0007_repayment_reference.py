@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_portfolio_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="repayment",
+            name="reference",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="profile",
+            name="phone_number",
+            field=models.CharField(blank=True, db_index=True, max_length=15, null=True),
+        ),
+    ]
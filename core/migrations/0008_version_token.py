@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0007_repayment_reference"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionToken",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("token", models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_version_token"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loan",
+            name="aging_bucket",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (0, "Current"),
+                    (1, "1–30 days"),
+                    (2, "31–60 days"),
+                    (3, "61–90 days"),
+                    (4, "90+ days"),
+                ],
+                default=0,
+                editable=False,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["status", "due_date"], name="loan_status_due_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                condition=models.Q(("aging_bucket__gt", 0)),
+                fields=["aging_bucket"],
+                name="loan_overdue_idx",
+            ),
+        ),
+    ]
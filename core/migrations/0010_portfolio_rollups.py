@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0009_loan_aging"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyRollup",
+            fields=[
+                ("day", models.DateField(primary_key=True, serialize=False)),
+                ("disbursed_count", models.PositiveIntegerField(default=0)),
+                (
+                    "disbursed_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("repaid_count", models.PositiveIntegerField(default=0)),
+                (
+                    "repaid_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("new_borrowers", models.PositiveIntegerField(default=0)),
+                ("rejected_count", models.PositiveIntegerField(default=0)),
+                ("paid_off_count", models.PositiveIntegerField(default=0)),
+                ("defaulted_count", models.PositiveIntegerField(default=0)),
+                (
+                    "defaulted_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["day"],
+            },
+        ),
+        migrations.AddField(
+            model_name="loan",
+            name="decided_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(fields=["decided_at"], name="loan_decided_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["status", "last_repayment_at"], name="loan_status_repaid_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0011_loan_score"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedLoan",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("term_days", models.IntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Pending", "Pending"),
+                            ("Active", "Active"),
+                            ("Paid", "Paid"),
+                            ("Rejected", "Rejected"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                ("due_date", models.DateField(blank=True, null=True)),
+                ("decided_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "amount_repaid",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                ("last_repayment_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "aging_bucket",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (0, "Current"),
+                            (1, "1–30 days"),
+                            (2, "31–60 days"),
+                            (3, "61–90 days"),
+                            (4, "90+ days"),
+                        ],
+                        default=0,
+                    ),
+                ),
+                ("score", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("score_flags", models.PositiveIntegerField(default=0)),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "borrower",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_loans",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedRepayment",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("date", models.DateTimeField()),
+                (
+                    "reference",
+                    models.CharField(blank=True, max_length=64, null=True, unique=True),
+                ),
+                (
+                    "loan",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="repayments",
+                        to="core.archivedloan",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedloan",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="archived_loan_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedloan",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"], name="archived_loan_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedloan",
+            index=models.Index(fields=["decided_at"], name="archived_loan_decided_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedloan",
+            index=models.Index(
+                fields=["status", "last_repayment_at"], name="archived_loan_repaid_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedloan",
+            index=models.Index(
+                fields=["status", "due_date"], name="archived_loan_due_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedrepayment",
+            index=models.Index(fields=["-date"], name="archived_repayment_date_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0012_loan_archive"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="profile",
+            name="national_id",
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:05
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copies of core.identifiers as of this migration, so replaying it never changes.
+_NON_DIGITS = re.compile(r"\D")
+_NON_ALPHANUMERIC = re.compile(r"[^0-9A-Za-z]")
+
+
+def normalize_phone(value):
+    if not value:
+        return None
+    country_code = settings.PHONE_COUNTRY_CODE
+    value = value.strip()
+    digits = _NON_DIGITS.sub("", value)
+    if not digits:
+        return None
+    if value.startswith("+"):
+        return digits
+    if digits.startswith("00"):
+        return digits[2:] or None
+    if digits.startswith("0"):
+        return country_code + digits[1:]
+    if digits.startswith(country_code) or country_code.startswith(digits):
+        return digits
+    return country_code + digits
+
+
+def normalize_national_id(value):
+    if not value:
+        return None
+    return _NON_ALPHANUMERIC.sub("", value).upper() or None
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    Profile = apps.get_model("core", "Profile")
+    profiles = Profile.objects.using(schema_editor.connection.alias).order_by("pk")
+    last = 0
+    while True:
+        batch = list(
+            profiles.filter(pk__gt=last).only("phone_number", "national_id")[:2000]
+        )
+        if not batch:
+            return
+        for profile in batch:
+            profile.phone_key = normalize_phone(profile.phone_number)
+            profile.national_id_key = normalize_national_id(profile.national_id)
+        profiles.bulk_update(batch, ["phone_key", "national_id_key"])
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0013_profile_national_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="national_id_key",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=20, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="phone_key",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=20, null=True
+            ),
+        ),
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:24
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0014_profile_lookup_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoanEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("applied", "Loan applied for"),
+                            ("approved", "Loan approved"),
+                            ("rejected", "Loan rejected"),
+                            ("created", "Loan created by staff"),
+                            ("repaid", "Repayment received"),
+                            ("paid_off", "Loan paid off"),
+                            ("verified", "Borrower verified"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("loan_id", models.BigIntegerField(blank=True, null=True)),
+                ("borrower_id", models.BigIntegerField(blank=True, null=True)),
+                ("actor_id", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:42
+
+import django.contrib.auth.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("core", "0015_loan_events"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedUser",
+            fields=[],
+            options={
+                "proxy": True,
+                "indexes": [],
+                "constraints": [],
+            },
+            bases=("auth.user",),
+            managers=[
+                ("objects", django.contrib.auth.models.UserManager()),
+            ],
+        ),
+    ]
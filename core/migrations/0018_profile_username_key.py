@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+# A copy of core.identifiers.normalize_username as of this migration,
+# so replaying it never changes.
+def normalize_username(value):
+    return value.lower() if value else None
+
+
+def backfill_username_key(apps, schema_editor):
+    Profile = apps.get_model("core", "Profile")
+    profiles = Profile.objects.using(schema_editor.connection.alias).order_by("pk")
+    last = 0
+    while True:
+        batch = list(
+            profiles.filter(pk__gt=last)
+            .select_related("user")
+            .only("user__username")[:2000]
+        )
+        if not batch:
+            return
+        for profile in batch:
+            profile.username_key = normalize_username(profile.user.username)
+        profiles.bulk_update(batch, ["username_key"])
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0016_cached_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="username_key",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=150, null=True
+            ),
+        ),
+        migrations.RunPython(backfill_username_key, migrations.RunPython.noop),
+    ]
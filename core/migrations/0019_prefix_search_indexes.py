@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:24
+
+from django.db import migrations
+
+# core.lookups.Prefix compares COLLATE "C" on PostgreSQL; a plain index on a column
+# with the locale collation cannot serve that, so each searched column gets one that can.
+# SQLite compares with the BINARY collation its existing indexes already use.
+PREFIX_INDEXES = [
+    ("core_profile_phone_key_c_idx", "core_profile", "phone_key"),
+    ("core_profile_national_id_key_c_idx", "core_profile", "national_id_key"),
+    ("core_profile_username_key_c_idx", "core_profile", "username_key"),
+    ("core_auth_user_username_c_idx", "auth_user", "username"),
+]
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    quote = schema_editor.quote_name
+    for name, table, column in PREFIX_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX {quote(name)} ON {quote(table)} (({quote(column)} COLLATE "C"))'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _, _ in PREFIX_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("core", "0018_profile_username_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
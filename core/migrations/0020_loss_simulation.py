@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0019_prefix_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LossSimulation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.CharField(max_length=32)),
+                ("day", models.DateField()),
+                ("scenarios", models.PositiveIntegerField()),
+                ("seed", models.PositiveBigIntegerField()),
+                ("result", models.JSONField()),
+                ("computed_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("version", "day", "scenarios", "seed"),
+                        name="loss_simulation_run_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,19 +1,172 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, models
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, NullIf, Round
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .identifiers import normalize_national_id, normalize_phone, normalize_username
+
+_MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+_NEVER = Value(datetime(1970, 1, 1, tzinfo=dt_timezone.utc), output_field=models.DateTimeField())
+
+
+def _per_borrower(model, aggregate, **filters):
+    """Scalar subquery: ``aggregate`` over ``model`` rows of the outer row's ``user_id``."""
+    rows = model.objects.filter(borrower=OuterRef('user_id'), **filters).order_by().values('borrower')
+    return Subquery(rows.annotate(value=aggregate).values('value'))
+
+
+class ProfileQuerySet(models.QuerySet):
+    def with_loan_summary(self):
+        """
+        Annotate each profile with its borrower's ``loan_count``, ``outstanding``
+        (balance of the Active loan), ``total_repaid`` and ``last_repayment_at``,
+        archived loans included. Correlated subqueries over loan_borrower_status_idx
+        and the archive's borrower index, so a page of profiles is still one query.
+        """
+        zero = Value(0, output_field=_MONEY)
+        return self.annotate(
+            loan_count=(
+                Coalesce(_per_borrower(Loan, Count('pk')), 0)
+                + Coalesce(_per_borrower(ArchivedLoan, Count('pk')), 0)
+            ),
+            # Rounded to cents: SQLite sums decimals as floats, and keyset cursors compare these values exactly.
+            outstanding=Round(Coalesce(
+                _per_borrower(Loan, Sum(F('amount') - F('amount_repaid'), output_field=_MONEY), status='Active'),
+                zero,
+            ), 2),
+            total_repaid=Round(
+                Coalesce(_per_borrower(Loan, Sum('amount_repaid', output_field=_MONEY)), zero)
+                + Coalesce(_per_borrower(ArchivedLoan, Sum('amount_repaid', output_field=_MONEY)), zero),
+                2,
+            ),
+            # Greatest() is NULL if either side is on some backends; the sentinel stands in for "never".
+            last_repayment_at=NullIf(
+                Greatest(
+                    Coalesce(_per_borrower(Loan, Max('last_repayment_at')), _NEVER),
+                    Coalesce(_per_borrower(ArchivedLoan, Max('last_repayment_at')), _NEVER),
+                ),
+                _NEVER,
+            ),
+        )
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    national_id = models.CharField(max_length=20, null=True, blank=True)
-    phone_number = models.CharField(max_length=15, null=True, blank=True)
+    national_id = models.CharField(max_length=20, null=True, blank=True, db_index=True)
+    phone_number = models.CharField(max_length=15, null=True, blank=True, db_index=True)
     monthly_income = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     verified_status = models.BooleanField(default=False)
+    # Canonical forms of phone_number and national_id (core.identifiers), and the user's username
+    # lower-cased, for staff search and imports. save() keeps them in step (and renaming the user
+    # updates username_key, core.signals); bulk_create() and update() callers use set_lookup_keys().
+    phone_key = models.CharField(max_length=20, null=True, blank=True, editable=False, db_index=True)
+    national_id_key = models.CharField(max_length=20, null=True, blank=True, editable=False, db_index=True)
+    username_key = models.CharField(max_length=150, null=True, blank=True, editable=False, db_index=True)
+
+    objects = ProfileQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
-class Loan(models.Model):
+    def set_lookup_keys(self):
+        self.phone_key = normalize_phone(self.phone_number)
+        self.national_id_key = normalize_national_id(self.national_id)
+        if self._state.adding or Profile.user.is_cached(self):
+            self.username_key = normalize_username(self.user.username)
+        return self
+
+    def save(self, *args, **kwargs):
+        self.set_lookup_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'phone_number', 'national_id'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'phone_key', 'national_id_key'}
+        if update_fields is not None and 'user' in update_fields:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'username_key'}
+        super().save(*args, **kwargs)
+
+class CachedUser(User):
+    """
+    ``User`` as ``core.auth`` caches it: without the password hash, answering
+    Django's per-request session check from hashes computed before it was
+    dropped. Once the password is loaded or set again it is used as usual.
+    """
+    class Meta:
+        proxy = True
+
+    def drop_password(self):
+        self.session_hashes = [self.get_session_auth_hash(), *self.get_session_auth_fallback_hash()]
+        self.usable_password = self.has_usable_password()
+        # Deferred from now on: reading it queries the row, and save() leaves it alone.
+        del self.password
+        return self
+
+    def _password_loaded(self):
+        return 'password' in self.__dict__ or not hasattr(self, 'session_hashes')
+
+    def get_session_auth_hash(self):
+        return super().get_session_auth_hash() if self._password_loaded() else self.session_hashes[0]
+
+    def get_session_auth_fallback_hash(self):
+        if self._password_loaded():
+            return super().get_session_auth_fallback_hash()
+        return iter(self.session_hashes[1:])
+
+    def has_usable_password(self):
+        # The admin asks on every page, for its "change password" link.
+        return super().has_usable_password() if self._password_loaded() else self.usable_password
+
+
+class ConcurrentUpdate(DatabaseError):
+    """The row changed in the database after the instance being saved was loaded."""
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers the ``tracked_fields`` values a row was loaded with and only
+    updates the row while it still has them, so ``core.signals`` can account for
+    a save as a change from exactly those values. An instance whose loaded
+    values are unknown (deferred or built by hand) reads them first. Saving an
+    instance that someone else changed in the meantime raises ``ConcurrentUpdate``.
+    ``derived_fields`` are kept up to date in SQL elsewhere; a save only writes
+    them when its ``update_fields`` names them, never stale values from memory.
+    """
+    tracked_fields = ()
+    derived_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if update_fields is None and self.derived_fields:
+            values = [value for value in values if value[0].name not in self.derived_fields]
+        loaded = getattr(self, '_loaded_values', None) or {}
+        if all(field in loaded for field in self.tracked_fields):
+            expected = {field: loaded[field] for field in self.tracked_fields}
+        else:
+            expected = base_qs.filter(pk=pk_val).values(*self.tracked_fields).first()
+            if expected is None:
+                return False
+        if super()._do_update(base_qs.filter(**expected), using, pk_val, values, update_fields, forced_update):
+            self._loaded_values = {**loaded, **expected}
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentUpdate(f'{self._meta.object_name} {pk_val} changed since it was loaded')
+        return False
+
+
+class LoanQuerySet(models.QuerySet):
+    def with_outstanding(self):
+        return self.annotate(outstanding=models.ExpressionWrapper(
+            F('amount') - F('amount_repaid'),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ))
+
+class Loan(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Active', 'Active'),
@@ -27,27 +180,275 @@ class Loan(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
     due_date = models.DateField(null=True, blank=True)
+    # When the loan left Pending (approved or rejected); loans created Active are decided at creation.
+    # NULL for loans decided before this was recorded.
+    decided_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Maintained by core.signals whenever a Repayment is written or deleted.
+    amount_repaid = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    last_repayment_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # How far past due_date an Active loan is; maintained by core.aging (sweep_overdue).
+    CURRENT, OVERDUE_1_30, OVERDUE_31_60, OVERDUE_61_90, OVERDUE_90_PLUS = range(5)
+    AGING_CHOICES = [
+        (CURRENT, 'Current'),
+        (OVERDUE_1_30, '1–30 days'),
+        (OVERDUE_31_60, '31–60 days'),
+        (OVERDUE_61_90, '61–90 days'),
+        (OVERDUE_90_PLUS, '90+ days'),
+    ]
+    aging_bucket = models.PositiveSmallIntegerField(choices=AGING_CHOICES, default=CURRENT, editable=False)
+    # Credit score (0-100, higher is safer) and the core.scoring reason flags behind it; set by score_pending_loans.
+    score = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    score_flags = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = LoanQuerySet.as_manager()
+    # core.signals turns each save into a change of these for core.stats.
+    tracked_fields = ('status', 'amount')
+    # Written by core.signals with F() updates as repayments change.
+    derived_fields = ('amount_repaid', 'last_repayment_at')
+
+    # Statuses whose amount counts as paid out to the borrower
+    DISBURSED_STATUSES = ('Active', 'Paid')
+    # Statuses a loan can be archived in, see core.archive
+    CLOSED_STATUSES = ('Paid', 'Rejected')
+    is_archived = False
+
+    class Meta:
+        indexes = [
+            # Borrower views: filter(borrower=..., status=...)
+            models.Index(fields=['borrower', 'status'], name='loan_borrower_status_idx'),
+            # Staff views: filter(status=...).order_by('-created_at', '-id') keyset pages
+            models.Index(fields=['status', '-created_at', '-id'], name='loan_status_created_idx'),
+            # admin_loans without a status filter
+            models.Index(fields=['-created_at', '-id'], name='loan_created_idx'),
+            # sweep_overdue: filter(status='Active', due_date__range=...) per aging bucket
+            models.Index(fields=['status', 'due_date'], name='loan_status_due_idx'),
+            # Only overdue loans: the dashboard aging summary and resetting settled loans
+            models.Index(fields=['aging_bucket'], condition=Q(aging_bucket__gt=0), name='loan_overdue_idx'),
+            # rollup_portfolio: decisions and payoffs per day since the watermark
+            models.Index(fields=['decided_at'], name='loan_decided_idx'),
+            models.Index(fields=['status', 'last_repayment_at'], name='loan_status_repaid_idx'),
+            # admin_loans?sort=score: the pending queue, highest score first
+            models.Index(fields=['status', '-score', '-id'], name='loan_status_score_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['borrower'],
+                condition=Q(status__in=['Pending', 'Active']),
+                name='one_open_loan_per_borrower',
+                violation_error_message='This borrower already has an active or pending loan.',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.id and not self.due_date and self.term_days:
             self.due_date = timezone.now().date() + timedelta(days=self.term_days)
+        if self.status != 'Pending' and self.decided_at is None and self._leaving_pending():
+            self.decided_at = timezone.now()
         super().save(*args, **kwargs)
 
+    def _leaving_pending(self):
+        # Loans decided before decision times were recorded have none; saving them later must not make one up.
+        return self._state.adding or getattr(self, '_loaded_values', {}).get('status') == 'Pending'
+
     def __str__(self):
         return f"Loan {self.id} - {self.borrower.username} - {self.status}"
 
     @property
     def total_repaid(self):
-        return self.repayments.aggregate(total=models.Sum('amount'))['total'] or 0
+        return self.amount_repaid
     
     @property
     def balance(self):
-        return self.amount - self.total_repaid
+        return self.amount - self.amount_repaid
 
-class Repayment(models.Model):
+class Repayment(TrackedFieldsMixin, models.Model):
     loan = models.ForeignKey(Loan, related_name='repayments', on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     date = models.DateTimeField(auto_now_add=True)
+    # Provider transaction reference for imported settlements; unique so re-imports are no-ops.
+    reference = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    tracked_fields = ('amount',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date'], name='repayment_date_idx'),
+        ]
 
     def __str__(self):
         return f"Repayment of {self.amount} for Loan {self.loan.id}"
+
+
+class ArchivedLoan(models.Model):
+    """
+    A closed loan moved out of ``Loan`` by core.archive (archive_closed_loans).
+
+    Same id and columns as the live row, so restoring it is a plain copy back.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    borrower = models.ForeignKey(User, related_name='archived_loans', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    term_days = models.IntegerField()
+    status = models.CharField(max_length=10, choices=Loan.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    due_date = models.DateField(null=True, blank=True)
+    decided_at = models.DateTimeField(null=True, blank=True)
+    amount_repaid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    last_repayment_at = models.DateTimeField(null=True, blank=True)
+    aging_bucket = models.PositiveSmallIntegerField(choices=Loan.AGING_CHOICES, default=Loan.CURRENT)
+    score = models.PositiveSmallIntegerField(null=True, blank=True)
+    score_flags = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField()
+
+    objects = LoanQuerySet.as_manager()
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            # admin_loans?archived=1, with and without a status filter
+            models.Index(fields=['-created_at', '-id'], name='archived_loan_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='archived_loan_status_idx'),
+            # rollup_portfolio rebuilds of archived days
+            models.Index(fields=['decided_at'], name='archived_loan_decided_idx'),
+            models.Index(fields=['status', 'last_repayment_at'], name='archived_loan_repaid_idx'),
+            models.Index(fields=['status', 'due_date'], name='archived_loan_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived loan {self.id} - {self.borrower.username} - {self.status}"
+
+    @property
+    def balance(self):
+        return self.amount - self.amount_repaid
+
+class ArchivedRepayment(models.Model):
+    """A repayment of an ``ArchivedLoan``, moved with it."""
+    id = models.BigIntegerField(primary_key=True)
+    loan = models.ForeignKey(ArchivedLoan, related_name='repayments', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    date = models.DateTimeField()
+    # Still unique: import_repayments checks the archive too, so an old settlement file stays a no-op.
+    reference = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date'], name='archived_repayment_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived repayment of {self.amount} for Loan {self.loan_id}"
+
+
+class PortfolioStats(models.Model):
+    """Single-row running totals for the staff dashboard, maintained by core.stats."""
+    pending_loans = models.PositiveIntegerField(default=0)
+    active_loans = models.PositiveIntegerField(default=0)
+    paid_loans = models.PositiveIntegerField(default=0)
+    rejected_loans = models.PositiveIntegerField(default=0)
+    total_users = models.PositiveIntegerField(default=0)
+    total_disbursed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_repaid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'portfolio stats'
+
+    def __str__(self):
+        return f"Portfolio stats as of {self.updated_at}"
+
+
+class VersionToken(models.Model):
+    """Opaque token replaced whenever the data behind ``key`` changes, see core.versions."""
+    key = models.CharField(max_length=64, primary_key=True)
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.key}: {self.token}"
+
+
+class DailyRollup(models.Model):
+    """Portfolio activity for one day, filled in by core.rollups (rollup_portfolio)."""
+    day = models.DateField(primary_key=True)
+    disbursed_count = models.PositiveIntegerField(default=0)
+    disbursed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    repaid_count = models.PositiveIntegerField(default=0)
+    repaid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    new_borrowers = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0)
+    paid_off_count = models.PositiveIntegerField(default=0)
+    defaulted_count = models.PositiveIntegerField(default=0)
+    defaulted_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day']
+
+    def __str__(self):
+        return f"Rollup for {self.day}"
+
+
+class LossSimulation(models.Model):
+    """
+    A ``simulate_losses`` result for the staff risk page, see core.simulation.
+    Stored in the database so every web process can serve it, whatever its cache.
+    """
+    version = models.CharField(max_length=32)
+    day = models.DateField()
+    scenarios = models.PositiveIntegerField()
+    seed = models.PositiveBigIntegerField()
+    result = models.JSONField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'day', 'scenarios', 'seed'], name='loss_simulation_run_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scenarios} scenarios (seed {self.seed}) for {self.day}"
+
+
+class LoanEvent(models.Model):
+    """
+    One state change of a loan or borrower, appended by core.events in the
+    same transaction as the change itself. Never updated or deleted: the
+    increasing id is the cursor of the change feed (``?after=<id>``).
+
+    Loans and users are referenced by id rather than foreign key so events
+    outlive archival and deleted rows.
+    """
+    APPLIED, APPROVED, REJECTED, CREATED, REPAID, PAID_OFF, VERIFIED = (
+        'applied', 'approved', 'rejected', 'created', 'repaid', 'paid_off', 'verified',
+    )
+    KIND_CHOICES = [
+        (APPLIED, 'Loan applied for'),
+        (APPROVED, 'Loan approved'),
+        (REJECTED, 'Loan rejected'),
+        (CREATED, 'Loan created by staff'),
+        (REPAID, 'Repayment received'),
+        (PAID_OFF, 'Loan paid off'),
+        (VERIFIED, 'Borrower verified'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+    loan_id = models.BigIntegerField(null=True, blank=True)
+    borrower_id = models.BigIntegerField(null=True, blank=True)
+    # The staff member who made the change; None when the borrower or the system did.
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Kind-specific details: the loan's status and balance after the change, a repayment's reference.
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"Event {self.id}: {self.kind} (loan {self.loan_id})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Loan events are append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Loan events are append-only')
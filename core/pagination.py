@@ -0,0 +1,194 @@
+import base64
+import json
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import BadRequest, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Unfiltered admin changelists of tables estimated above this many rows are not counted exactly.
+ESTIMATE_ABOVE = 10_000
+
+
+def get_page_size(request):
+    """Page size from ``?page_size=``, falling back to ``settings.STAFF_PAGE_SIZE``."""
+    default = getattr(settings, 'STAFF_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def next_query(self, params):
+        """Query string for the next page, keeping the other GET params (filters, page size)."""
+        if not self.has_next:
+            return ''
+        params = params.copy()
+        params['after'] = self.next_cursor
+        return params.urlencode()
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _field(queryset, name):
+    """The model field or annotation output field ``name`` orders by."""
+    annotation = queryset.query.annotations.get(name)
+    return annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+
+
+def _decode_cursor(queryset, fields, cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [_field(queryset, name).to_python(value) for name, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise BadRequest('Invalid pagination cursor')
+
+
+def _after(ordering, values):
+    """
+    Row-value comparison ``(a, b, ...) > (va, vb, ...)`` expanded into ORs so
+    it works on every backend and can still seek on an index over ``ordering``.
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[i]})
+        for prev, value in zip(ordering[:i], values[:i]):
+            term &= Q(**{prev.lstrip('-'): value})
+        condition |= term
+    return condition
+
+
+def keyset_queryset(queryset, ordering, cursor=None):
+    """``queryset`` ordered by ``ordering`` and restricted to rows after ``cursor``."""
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        fields = [field.lstrip('-') for field in ordering]
+        queryset = queryset.filter(_after(ordering, _decode_cursor(queryset, fields, cursor)))
+    return queryset
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of ``queryset`` ordered by ``ordering``, starting after ``cursor``.
+
+    ``ordering`` must end in a unique column so that the cursor is unambiguous.
+    Unlike OFFSET, each page costs a single index seek no matter how deep it is.
+    """
+    items = list(keyset_queryset(queryset, ordering, cursor)[:page_size + 1])
+    return _make_page(items, ordering, page_size)
+
+
+async def akeyset_paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Async version of ``keyset_paginate``."""
+    items = [obj async for obj in keyset_queryset(queryset, ordering, cursor)[:page_size + 1]]
+    return _make_page(items, ordering, page_size)
+
+
+def keyset_paginate_many(querysets, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    ``keyset_paginate`` over the rows of several querysets, e.g. live and
+    archived loans. Each one seeks on its own index; the pages are merged in
+    Python. The unique column of ``ordering`` must be unique across them too.
+    """
+    items = []
+    for queryset in querysets:
+        items += keyset_queryset(queryset, ordering, cursor)[:page_size + 1]
+    return _make_page(_merge(items, ordering), ordering, page_size)
+
+
+async def akeyset_paginate_many(querysets, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Async version of ``keyset_paginate_many``."""
+    items = []
+    for queryset in querysets:
+        items += [obj async for obj in keyset_queryset(queryset, ordering, cursor)[:page_size + 1]]
+    return _make_page(_merge(items, ordering), ordering, page_size)
+
+
+def _merge(items, ordering):
+    # Stable sorts from the last key to the first give the combined order.
+    for field in reversed(ordering):
+        items.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+    return items
+
+
+def _make_page(items, ordering, page_size):
+    """Build the page from up to ``page_size + 1`` rows; the extra row only signals a next page."""
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = _encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return KeysetPage(items, next_cursor)
+
+
+def estimate_row_count(model, using='default'):
+    """The database statistics' row count for ``model``'s table, or None if there are none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            row = cursor.fetchone()
+            # -1 until the table has been vacuumed or analyzed
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once ANALYZE (or PRAGMA optimize) has run.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Every row of a table's statistics starts with its row count.
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of tables too large to ``COUNT(*)`` on
+    every page. An unfiltered list takes its count from the database
+    statistics once they put the table over ``ESTIMATE_ABOVE`` rows; filtered
+    lists and small tables are counted exactly. With an estimate the last page
+    numbers may be off by however far the statistics are behind.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.has_filters():
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATE_ABOVE:
+                return estimate
+        return super().count
@@ -0,0 +1,106 @@
+"""
+Read-replica routing for the staff reporting views.
+
+When a ``replica`` database is configured (``REPLICA_DATABASE_URL``), reads
+made inside a ``@reporting_reads`` view go to it; every other read, every
+write and anything inside a transaction stays on ``default``. After a request
+writes, ``ReplicaPinningMiddleware`` sets a short-lived cookie that keeps that
+client's reports on the primary for ``settings.REPLICA_PIN_SECONDS``, so a
+staff member who has just approved a loan sees it on the page they are
+redirected to despite replication lag.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+_reporting = ContextVar('reporting_reads', default=False)
+_request = ContextVar('replica_request', default=None)
+
+
+class RequestRouting:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def reporting_reads(view):
+    """Let the view's reads be served by the replica."""
+    if iscoroutinefunction(view):
+        async def wrapper(request, *args, **kwargs):
+            token = _reporting.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _reporting.reset(token)
+    else:
+        def wrapper(request, *args, **kwargs):
+            token = _reporting.set(True)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _reporting.reset(token)
+    return wraps(view)(wrapper)
+
+
+def replica_available():
+    return REPLICA in connections
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _reporting.get() or not replica_available():
+            return None
+        routing = _request.get()
+        if routing is not None and (routing.pinned or routing.wrote):
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        routing = _request.get()
+        if routing is not None:
+            routing.wrote = True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        routing = RequestRouting(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        return self.finish(response, routing)
+
+    async def __acall__(self, request):
+        routing = RequestRouting(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        return self.finish(response, routing)
+
+    def finish(self, response, routing):
+        if routing.wrote and replica_available():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
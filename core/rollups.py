@@ -0,0 +1,171 @@
+"""
+Daily portfolio rollups for trend reporting.
+
+``rollup_portfolio`` aggregates each day's activity into one ``DailyRollup``
+row, so trend pages read a date range by primary key instead of aggregating
+loans and repayments on every view:
+
+* disbursed: loans approved (``decided_at``) that day, Active or since Paid
+* repaid: repayments received that day
+* new_borrowers: users with a profile who joined that day
+* rejected / paid_off: loans rejected or repaid in full that day
+* defaulted: loans that reached the 90+ days overdue bucket that day without
+  having been repaid first
+
+Loans decided before decision times were recorded (``decided_at`` is NULL)
+are in neither the disbursed nor the rejected counts: the days they were
+decided on are not known, so the trends start from complete data instead.
+
+Runs are incremental: they start at the watermark, the latest day already
+rolled up (recomputed, since it may have been partial), and continue to
+today. ``since`` recomputes older days, e.g. after correcting data. Loans
+moved out by ``archive_closed_loans`` are still counted, so rebuilding old
+days gives the same totals before and after archival.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .aging import BUCKET_STARTS
+from .models import ArchivedLoan, ArchivedRepayment, DailyRollup, Loan, Repayment
+
+CENTS = Decimal('0.01')
+# Live and archived (core.archive) loans with their repayments.
+SOURCES = [(Loan, Repayment), (ArchivedLoan, ArchivedRepayment)]
+# Days rolled up per batch of queries and per transaction.
+WINDOW_DAYS = 92
+# First day past due that counts as a default (the 90+ aging bucket).
+DEFAULT_AFTER_DAYS = BUCKET_STARTS[-1][1]
+METRICS = [
+    field.name for field in DailyRollup._meta.concrete_fields if field.name not in ('day', 'updated_at')
+]
+
+
+def _bounds(start, end):
+    """Aware datetimes covering the local days ``start`` through ``end``."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def _per_day(querysets, field, start, end, **aggregates):
+    """``{day: {aggregate: value}}`` over ``querysets``, added up across them."""
+    lower, upper = _bounds(start, end)
+    days = {}
+    for queryset in querysets:
+        rows = (
+            queryset.filter(**{f'{field}__gte': lower, f'{field}__lt': upper})
+            .annotate(day=TruncDate(field))
+            .order_by()
+            .values('day')
+            .annotate(**aggregates)
+        )
+        for row in rows:
+            totals = days.setdefault(row.pop('day'), dict.fromkeys(row, 0))
+            for name, value in row.items():
+                totals[name] += value or 0
+    return days
+
+
+def _defaults(start, end):
+    """``{day: (count, amount)}`` of loans crossing into the 90+ bucket on each day."""
+    overdue = timedelta(days=DEFAULT_AFTER_DAYS)
+    rows = [
+        row
+        for loans, _ in SOURCES
+        for row in loans.objects.filter(
+            status__in=Loan.DISBURSED_STATUSES, due_date__range=(start - overdue, end - overdue),
+        ).values_list('due_date', 'status', 'last_repayment_at', 'amount')
+    ]
+    defaults = {}
+    for due_date, status, last_repayment_at, amount in rows:
+        day = due_date + overdue
+        if status == 'Paid' and last_repayment_at and timezone.localdate(last_repayment_at) < day:
+            continue
+        count, total = defaults.get(day, (0, 0))
+        defaults[day] = (count + 1, total + amount)
+    return defaults
+
+
+def compute_rollups(start, end):
+    """Unsaved ``DailyRollup`` rows for every day from ``start`` to ``end``, inclusive."""
+    loans = [model.objects.all() for model, _ in SOURCES]
+    disbursed = _per_day(
+        [qs.filter(status__in=Loan.DISBURSED_STATUSES) for qs in loans], 'decided_at', start, end,
+        count=Count('id'), amount=Sum('amount'),
+    )
+    rejected = _per_day([qs.filter(status='Rejected') for qs in loans], 'decided_at', start, end, count=Count('id'))
+    paid_off = _per_day([qs.filter(status='Paid') for qs in loans], 'last_repayment_at', start, end, count=Count('id'))
+    repaid = _per_day(
+        [model.objects.all() for _, model in SOURCES], 'date', start, end, count=Count('id'), amount=Sum('amount'),
+    )
+    joined = _per_day([User.objects.filter(profile__isnull=False)], 'date_joined', start, end, count=Count('id'))
+    defaults = _defaults(start, end)
+
+    rollups = []
+    day = start
+    while day <= end:
+        defaulted_count, defaulted_amount = defaults.get(day, (0, 0))
+        rollups.append(DailyRollup(
+            day=day,
+            disbursed_count=disbursed.get(day, {}).get('count', 0),
+            # SQLite sums decimals as floats; round off the noise.
+            disbursed_amount=Decimal(disbursed.get(day, {}).get('amount') or 0).quantize(CENTS),
+            repaid_count=repaid.get(day, {}).get('count', 0),
+            repaid_amount=Decimal(repaid.get(day, {}).get('amount') or 0).quantize(CENTS),
+            new_borrowers=joined.get(day, {}).get('count', 0),
+            rejected_count=rejected.get(day, {}).get('count', 0),
+            paid_off_count=paid_off.get(day, {}).get('count', 0),
+            defaulted_count=defaulted_count,
+            defaulted_amount=Decimal(defaulted_amount).quantize(CENTS),
+        ))
+        day += timedelta(days=1)
+    return rollups
+
+
+def watermark():
+    """First day the next incremental run has to (re)compute, or None if there is no data yet."""
+    latest = DailyRollup.objects.order_by('-day').values_list('day', flat=True).first()
+    if latest is not None:
+        return latest
+    earliest = [User.objects.filter(profile__isnull=False).aggregate(first=Min('date_joined'))['first']]
+    earliest += [loans.objects.aggregate(first=Min('created_at'))['first'] for loans, _ in SOURCES]
+    earliest = [value for value in earliest if value is not None]
+    return timezone.localdate(min(earliest)) if earliest else None
+
+
+def rollup_portfolio(since=None, until=None):
+    """
+    Write the rollups from ``since`` (default: the watermark) through ``until``
+    (default: today). Returns the number of days written.
+    """
+    until = until or timezone.localdate()
+    start = since or watermark()
+    if start is None:
+        return 0
+    written = 0
+    while start <= until:
+        end = min(until, start + timedelta(days=WINDOW_DAYS - 1))
+        with transaction.atomic():
+            rollups = compute_rollups(start, end)
+            DailyRollup.objects.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['day'],
+                update_fields=METRICS + ['updated_at'],
+            )
+        written += len(rollups)
+        start = end + timedelta(days=1)
+    return written
+
+
+def get_rollups(start, end):
+    """The stored rollups for ``start`` through ``end`` (a primary-key range scan)."""
+    return DailyRollup.objects.filter(day__range=(start, end))
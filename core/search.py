@@ -0,0 +1,92 @@
+"""
+Borrower lookup for staff by phone number, national ID or username.
+
+The search term is normalized the way ``Profile`` stores its lookup keys
+(``core.identifiers``) and matched as a prefix (``core.lookups.Prefix``) of
+``phone_key``, ``national_id_key`` and ``username_key``, so none of them is
+case-sensitive. Each of those is
+one range seek on the column's index, read in index order and cut off at the
+result limit, so the cost does not grow with the number of profiles. Exact
+matches rank first, then phone, national ID and username prefix matches. The
+borrowers' open (Pending or Active) loans come from one more query, so a
+search is at most four queries.
+"""
+from .identifiers import PHONE_LIKE, normalize_national_id, normalize_phone, normalize_username
+from .models import Loan, Profile
+
+DEFAULT_RESULTS = 10
+MAX_RESULTS = 50
+# Shorter terms match too much of the book to be worth a query.
+MIN_QUERY_LENGTH = 2
+OPEN_STATUSES = ('Pending', 'Active')
+
+
+class BorrowerMatch:
+    def __init__(self, profile, matched, exact):
+        self.profile = profile
+        self.user = profile.user
+        # Which identifier matched: 'phone', 'national_id' or 'username'
+        self.matched = matched
+        self.exact = exact
+        self.open_loan = None
+
+    def as_json(self):
+        loan = self.open_loan
+        return {
+            'user_id': self.user.pk,
+            'username': self.user.username,
+            'phone_number': self.profile.phone_number,
+            'national_id': self.profile.national_id,
+            'verified': self.profile.verified_status,
+            'matched': self.matched,
+            'exact': self.exact,
+            'open_loan': loan and {
+                'id': loan.pk,
+                'status': loan.status,
+                'amount': loan.amount,
+                'balance': loan.balance,
+                'due_date': loan.due_date,
+            },
+        }
+
+
+def search_keys(query):
+    """``[(matched, field, key), ...]`` to look ``query`` up by, in ranking order."""
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    keys = []
+    if PHONE_LIKE.fullmatch(query):
+        keys.append(('phone', 'phone_key', normalize_phone(query)))
+    keys.append(('national_id', 'national_id_key', normalize_national_id(query)))
+    keys.append(('username', 'username_key', normalize_username(query)))
+    return [(matched, field, key) for matched, field, key in keys if key]
+
+
+def search_borrowers(query, limit=DEFAULT_RESULTS):
+    """Up to ``limit`` ``BorrowerMatch`` objects for ``query``, each with its ``open_loan`` (or ``None``)."""
+    limit = max(1, min(limit, MAX_RESULTS))
+    exact, prefix, seen = [], [], set()
+    for matched, field, key in search_keys(query):
+        profiles = (
+            Profile.objects.select_related('user')
+            .filter(**{f'{field}__prefix': key})
+            # Index order, so the database stops after `limit` entries.
+            .order_by(field, 'pk')[:limit]
+        )
+        for profile in profiles:
+            if profile.pk in seen:
+                continue
+            seen.add(profile.pk)
+            match = BorrowerMatch(profile, matched, exact=getattr(profile, field) == key)
+            (exact if match.exact else prefix).append(match)
+    matches = (exact + prefix)[:limit]
+
+    if matches:
+        loans = Loan.objects.filter(
+            borrower_id__in=[match.user.pk for match in matches], status__in=OPEN_STATUSES,
+        )
+        open_loans = {loan.borrower_id: loan for loan in loans}
+        for match in matches:
+            match.open_loan = open_loans.get(match.user.pk)
+    return matches
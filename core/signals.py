@@ -0,0 +1,145 @@
+from django.contrib.auth.models import User
+from django.db.models import F, Max, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import stats
+from .auth import invalidate_user
+from .identifiers import normalize_username
+from .versions import bump_versions
+from .models import ArchivedLoan, ArchivedRepayment, CachedUser, Loan, Profile, Repayment
+
+
+def sync_loan_repaid(loan_id):
+    """Recompute the denormalized repayment columns of a loan from scratch."""
+    totals = Repayment.objects.filter(loan_id=loan_id).aggregate(total=Sum('amount'), last=Max('date'))
+    Loan.objects.filter(pk=loan_id).update(
+        amount_repaid=totals['total'] or 0,
+        last_repayment_at=totals['last'],
+    )
+
+
+def _loaded(instance, *fields):
+    """Values of ``fields`` as last loaded from the database, or None if unknown."""
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None or any(field not in loaded for field in fields):
+        return None
+    return [loaded[field] for field in fields]
+
+
+def _saved(instance, field, old, update_fields):
+    """The value ``field`` has in the database after a save limited to ``update_fields``."""
+    if update_fields is not None and field not in update_fields:
+        return old
+    return getattr(instance, field)
+
+
+def _remember(instance, *fields, update_fields=None):
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        loaded = instance._loaded_values = {}
+    for field in fields:
+        loaded[field] = _saved(instance, field, loaded.get(field), update_fields)
+
+
+def _borrower_id(repayment):
+    """The repayment's borrower, from its loan if the caller passed one in, else its id alone."""
+    if Repayment.loan.is_cached(repayment):
+        return repayment.loan.borrower_id
+    return Loan.objects.filter(pk=repayment.loan_id).values_list('borrower_id', flat=True).first()
+
+
+@receiver(post_save, sender=Repayment)
+def repayment_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        Loan.objects.filter(pk=instance.loan_id).update(
+            amount_repaid=F('amount_repaid') + instance.amount,
+            last_repayment_at=instance.date,
+        )
+        stats.record_repaid(instance.amount)
+    else:
+        # The amount of an existing repayment may have changed (e.g. through the admin).
+        # Saves only apply while the row still has the loaded amount (TrackedFieldsMixin).
+        sync_loan_repaid(instance.loan_id)
+        old, = _loaded(instance, 'amount')
+        stats.record_repaid(_saved(instance, 'amount', old, update_fields) - old)
+    _remember(instance, 'amount', update_fields=update_fields)
+    bump_versions([_borrower_id(instance)])
+
+
+@receiver(post_delete, sender=Repayment)
+def repayment_deleted(sender, instance, **kwargs):
+    last = Repayment.objects.filter(loan_id=instance.loan_id).aggregate(last=Max('date'))['last']
+    Loan.objects.filter(pk=instance.loan_id).update(
+        amount_repaid=F('amount_repaid') - instance.amount,
+        last_repayment_at=last,
+    )
+    stats.record_repaid(-instance.amount)
+    bump_versions([_borrower_id(instance)])
+
+
+@receiver(post_save, sender=Loan)
+def loan_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.record_loan_change(None, None, instance.status, instance.amount)
+    else:
+        # The UPDATE only matched if the row still had these values (TrackedFieldsMixin),
+        # so concurrent saves of the same loan cannot both count the same transition.
+        old_status, old_amount = _loaded(instance, 'status', 'amount')
+        new_status = _saved(instance, 'status', old_status, update_fields)
+        new_amount = _saved(instance, 'amount', old_amount, update_fields)
+        stats.record_loan_change(old_status, old_amount, new_status, new_amount)
+    _remember(instance, 'status', 'amount', update_fields=update_fields)
+    bump_versions([instance.borrower_id])
+
+
+@receiver(post_delete, sender=Loan)
+def loan_deleted(sender, instance, **kwargs):
+    stats.record_loan_change(instance.status, instance.amount, None, None)
+    bump_versions([instance.borrower_id])
+
+
+# Archived rows still count in the portfolio totals until they are deleted for good,
+# e.g. along with their borrower. core.archive moves rows without these signals.
+@receiver(post_delete, sender=ArchivedLoan)
+def archived_loan_deleted(sender, instance, **kwargs):
+    stats.record_loan_change(instance.status, instance.amount, None, None)
+    bump_versions([instance.borrower_id])
+
+
+@receiver(post_delete, sender=ArchivedRepayment)
+def archived_repayment_deleted(sender, instance, **kwargs):
+    stats.record_repaid(-instance.amount)
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.record_users(1)
+    invalidate_user(instance.user_id)
+    bump_versions([instance.user_id])
+
+
+@receiver(post_delete, sender=Profile)
+def profile_deleted(sender, instance, **kwargs):
+    stats.record_users(-1)
+    invalidate_user(instance.user_id)
+    bump_versions([instance.user_id])
+
+
+# request.user is a CachedUser (core.auth), whose saves are sent for the proxy.
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=CachedUser)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=CachedUser)
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    invalidate_user(instance.pk)
+    if kwargs['signal'] is post_save and not created and (update_fields is None or 'username' in update_fields):
+        username_key = normalize_username(instance.username)
+        Profile.objects.filter(user_id=instance.pk).exclude(username_key=username_key).update(username_key=username_key)
+        # Staff pages show borrowers by username; login's last_login saves do not get here.
+        bump_versions([instance.pk])
@@ -0,0 +1,243 @@
+"""
+Monte Carlo loss simulation over the Active loan book.
+
+``load_book`` reads every Active loan's outstanding balance and due date into
+NumPy arrays (one query) and derives its aging bucket from the due date.
+``run_simulation`` then draws whole blocks of scenarios at once:
+
+* defaults follow a one-factor Gaussian copula: each scenario draws a
+  factor ``Z`` shared by the whole book, which sets every bucket's default
+  probability for that scenario (``Phi((Phi^-1(pd) - sqrt(rho) Z) /
+  sqrt(1 - rho))``), so bad scenarios hit many loans together; each loan then
+  defaults independently with one uniform draw
+* defaulted balances recover a Beta-distributed share, drawn per scenario
+  and bucket since recoveries are poor across the board in the same
+  downturns (and one draw per loan would dominate the run time)
+
+and reports expected loss, value at risk and expected shortfall. Scenario
+blocks get independent seeds spawned from ``seed`` and are sized from the
+book alone, so a given seed gives the same figures whether the blocks run in
+one process or across ``workers`` processes. ``simulate_portfolio`` caches
+results under the portfolio version token and the date (aging moves with the
+calendar even when nothing is written), so repeat views cost nothing until
+the book or the day changes. The staff risk page only starts small runs
+itself (``interactive``); larger ones, or other seeds, are served once
+``simulate_losses`` has computed them. Those are also stored as
+``LossSimulation`` rows, because the default cache is per process (and the
+command runs in a process of its own), so the page finds them in any worker.
+
+This module only imports Django inside ``load_book``, ``simulate_portfolio``
+and the result store, so worker processes can import it without setup.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from statistics import NormalDist
+
+import numpy as np
+
+# Probability of default over the remaining term for Current, 1-30, 31-60, 61-90 and 90+ days overdue.
+DEFAULT_PROBABILITIES = (0.03, 0.10, 0.25, 0.45, 0.70)
+# First day overdue of each overdue bucket (as core.aging.BUCKET_STARTS).
+OVERDUE_THRESHOLDS = (1, 31, 61, 91)
+# Share of the default driver common to every loan in a scenario.
+CORRELATION = 0.15
+# Recovered share of a defaulted balance ~ Beta(alpha, beta); mean 40%.
+RECOVERY_ALPHA = 2.0
+RECOVERY_BETA = 3.0
+
+DEFAULT_SCENARIOS = 2000
+MAX_SCENARIOS = 50_000
+# Loan x scenario draws per block: bounds memory at a few tens of MB per process.
+BLOCK_CELLS = 2_000_000
+HISTOGRAM_BINS = 20
+CACHE_TIMEOUT = 24 * 60 * 60
+# Runs the risk page may start on its own, within a web request: these scenario
+# counts with seed 0, over at most this many loan x scenario draws (about a second).
+INTERACTIVE_SCENARIOS = (500, DEFAULT_SCENARIOS)
+INTERACTIVE_MAX_CELLS = 50_000_000
+
+
+class LoanBook:
+    """Column arrays of the Active loans, one entry per loan."""
+
+    def __init__(self, amount, balance, days_overdue):
+        self.amount = amount
+        self.balance = balance
+        self.days_overdue = days_overdue
+        self.buckets = np.searchsorted(OVERDUE_THRESHOLDS, days_overdue, side='right')
+
+    def __len__(self):
+        return len(self.balance)
+
+
+def load_book(today=None):
+    """The Active loan book as of ``today`` (default: the current local date)."""
+    from django.utils import timezone
+
+    from .models import Loan
+
+    today = today or timezone.localdate()
+    rows = list(
+        Loan.objects.filter(status='Active').with_outstanding().order_by()
+        .values_list('amount', 'outstanding', 'due_date')
+    )
+    amount, balance, due_date = zip(*rows) if rows else ((),) * 3
+    ordinal = today.toordinal()
+    return LoanBook(
+        amount=np.fromiter(amount, dtype=np.float64, count=len(amount)),
+        balance=np.clip(np.fromiter(balance, dtype=np.float64, count=len(balance)), 0, None),
+        days_overdue=np.fromiter(
+            (ordinal - due.toordinal() if due else 0 for due in due_date), dtype=np.int64, count=len(due_date),
+        ),
+    )
+
+
+def synthetic_book(loans, seed=0):
+    """A random book of ``loans`` loans, for benchmarks."""
+    rng = np.random.default_rng(seed)
+    amount = rng.uniform(100, 5000, loans).round(2)
+    return LoanBook(
+        amount=amount,
+        balance=(amount * rng.uniform(0, 1, loans)).round(2),
+        days_overdue=rng.integers(-90, 150, loans),
+    )
+
+
+def block_sizes(loans, scenarios):
+    """Scenarios per block; depends only on the book size so results do not depend on ``workers``."""
+    per_block = max(1, BLOCK_CELLS // max(loans, 1))
+    return [min(per_block, scenarios - start) for start in range(0, scenarios, per_block)]
+
+
+_normal_cdf = np.vectorize(NormalDist().cdf, otypes=[np.float64])
+
+
+def simulate_block(balance, bounds, seed, scenarios):
+    """
+    Losses of ``scenarios`` scenarios over a book sorted by bucket, with bucket
+    ``b`` at ``balance[bounds[b]:bounds[b + 1]]``: ``(by_bucket, defaults)``
+    arrays with one row per scenario.
+    """
+    rng = np.random.default_rng(seed)
+    systematic = rng.standard_normal(scenarios)
+    thresholds = np.array([NormalDist().inv_cdf(p) for p in DEFAULT_PROBABILITIES])
+    # Default probability of each bucket in each scenario, given the common factor.
+    conditional = _normal_cdf(
+        (thresholds[None, :] - np.sqrt(CORRELATION) * systematic[:, None]) / np.sqrt(1 - CORRELATION)
+    ).astype(np.float32)
+    recovery = rng.beta(RECOVERY_ALPHA, RECOVERY_BETA, size=conditional.shape)
+    by_bucket = np.zeros(conditional.shape)
+    defaults = np.zeros(scenarios, dtype=np.int64)
+    for bucket in range(len(DEFAULT_PROBABILITIES)):
+        balances = balance[bounds[bucket]:bounds[bucket + 1]]
+        if not len(balances):
+            continue
+        defaulted = rng.random((scenarios, len(balances)), dtype=np.float32) < conditional[:, bucket:bucket + 1]
+        by_bucket[:, bucket] = (defaulted @ balances) * (1 - recovery[:, bucket])
+        defaults += np.count_nonzero(defaulted, axis=1)
+    return by_bucket, defaults
+
+
+def run_simulation(book, scenarios=DEFAULT_SCENARIOS, seed=0, workers=1):
+    """Simulate ``scenarios`` scenarios over ``book`` and summarize the loss distribution."""
+    order = np.argsort(book.buckets, kind='stable')
+    bounds = np.searchsorted(book.buckets[order], np.arange(len(DEFAULT_PROBABILITIES) + 1))
+    sizes = block_sizes(len(book), scenarios)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    arguments = (repeat(book.balance[order]), repeat(bounds), seeds, sizes)
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            blocks = list(pool.map(simulate_block, *arguments))
+    else:
+        blocks = list(map(simulate_block, *arguments))
+    by_bucket, defaults = (np.concatenate(parts) for parts in zip(*blocks))
+    return summarize(book, by_bucket, defaults, seed)
+
+
+def summarize(book, by_bucket, defaults, seed):
+    total = by_bucket.sum(axis=1)
+    exposure = float(book.balance.sum())
+    var_95, var_99 = (float(value) for value in np.quantile(total, [0.95, 0.99]))
+    counts, edges = np.histogram(total, bins=HISTOGRAM_BINS)
+    buckets_count = len(DEFAULT_PROBABILITIES)
+    bucket_loans = np.bincount(book.buckets, minlength=buckets_count)
+    bucket_exposure = np.bincount(book.buckets, weights=book.balance, minlength=buckets_count)
+    return {
+        'loans': len(book),
+        'scenarios': len(total),
+        'seed': seed,
+        'exposure': exposure,
+        'expected_loss': float(total.mean()),
+        'loss_std': float(total.std()),
+        'expected_loss_rate': float(total.mean() / exposure) if exposure else 0.0,
+        'var_95': var_95,
+        'var_99': var_99,
+        'expected_shortfall_99': float(total[total >= var_99].mean()),
+        'expected_defaults': float(defaults.mean()),
+        'buckets': [
+            {
+                'bucket': bucket,
+                'loans': int(bucket_loans[bucket]),
+                'exposure': float(bucket_exposure[bucket]),
+                'probability_of_default': DEFAULT_PROBABILITIES[bucket],
+                'expected_loss': float(by_bucket[:, bucket].mean()),
+            }
+            for bucket in range(buckets_count)
+        ],
+        'histogram': [
+            {'low': float(low), 'high': float(high), 'scenarios': int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ],
+    }
+
+
+def cache_key(version, day, scenarios, seed):
+    return f'simulation:{version}:{day.isoformat()}:{scenarios}:{seed}'
+
+
+def simulate_portfolio(version, scenarios=DEFAULT_SCENARIOS, seed=0, workers=1, refresh=False, interactive=False):
+    """
+    The simulation for today's book at portfolio ``version`` (read it before
+    calling, so a write landing meanwhile can only make the cached figures
+    newer). An ``interactive`` caller only gets a run started for
+    ``INTERACTIVE_SCENARIOS`` with seed 0 over a book of at most
+    ``INTERACTIVE_MAX_CELLS`` draws; anything else is a cached result or None.
+    """
+    from django.core.cache import cache
+    from django.utils import timezone
+
+    today = timezone.localdate()
+    key = cache_key(version, today, scenarios, seed)
+    result = None if refresh else cache.get(key)
+    if result is None and not refresh:
+        result = stored_result(version, today, scenarios, seed)
+        if result is not None:
+            cache.set(key, result, CACHE_TIMEOUT)
+    if result is None and (not interactive or (scenarios in INTERACTIVE_SCENARIOS and seed == 0)):
+        book = load_book(today)
+        if not interactive or len(book) * scenarios <= INTERACTIVE_MAX_CELLS:
+            result = run_simulation(book, scenarios=scenarios, seed=seed, workers=workers)
+            cache.set(key, result, CACHE_TIMEOUT)
+            if not interactive:
+                store_result(version, today, scenarios, seed, result)
+    return result
+
+
+def stored_result(version, day, scenarios, seed):
+    from .models import LossSimulation
+
+    return (
+        LossSimulation.objects.filter(version=version, day=day, scenarios=scenarios, seed=seed)
+        .values_list('result', flat=True)
+        .first()
+    )
+
+
+def store_result(version, day, scenarios, seed, result):
+    """Keep ``result`` for every process, dropping results for other books or days, which are never served."""
+    from .models import LossSimulation
+
+    LossSimulation.objects.exclude(version=version, day=day).delete()
+    LossSimulation.objects.update_or_create(
+        version=version, day=day, scenarios=scenarios, seed=seed, defaults={'result': result},
+    )
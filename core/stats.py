@@ -0,0 +1,107 @@
+"""
+Incrementally maintained portfolio counters (``PortfolioStats``).
+
+Model writes are picked up by ``core.signals``; code that changes loans with
+``QuerySet.update()`` or ``bulk_create()`` must call ``record_loan_transition``
+itself since no signals fire for those.
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, F, Sum
+
+from .models import ArchivedLoan, ArchivedRepayment, Loan, PortfolioStats, Profile, Repayment
+
+STATS_PK = 1
+CENTS = Decimal('0.01')
+
+
+def status_field(status):
+    return f'{status.lower()}_loans'
+
+
+def compute_portfolio_stats():
+    """Aggregate every counter from scratch, archived loans (see core.archive) included."""
+    values = {status_field(status): 0 for status, _ in Loan.STATUS_CHOICES}
+    values['total_disbursed'] = values['total_repaid'] = 0
+    for loans, repayments in ((Loan, Repayment), (ArchivedLoan, ArchivedRepayment)):
+        for row in loans.objects.order_by().values('status').annotate(count=Count('id'), total=Sum('amount')):
+            values[status_field(row['status'])] += row['count']
+            if row['status'] in Loan.DISBURSED_STATUSES:
+                values['total_disbursed'] += row['total'] or 0
+        values['total_repaid'] += repayments.objects.aggregate(total=Sum('amount'))['total'] or 0
+    values['total_users'] = Profile.objects.count()
+    # SQLite sums decimals as floats; round off the noise.
+    for field in ('total_disbursed', 'total_repaid'):
+        values[field] = Decimal(values[field]).quantize(CENTS)
+    return values
+
+
+def rebuild_portfolio_stats():
+    stats, _ = PortfolioStats.objects.update_or_create(pk=STATS_PK, defaults=compute_portfolio_stats())
+    return stats
+
+
+def get_portfolio_stats():
+    try:
+        return PortfolioStats.objects.get(pk=STATS_PK)
+    except PortfolioStats.DoesNotExist:
+        return rebuild_portfolio_stats()
+
+
+async def aget_portfolio_stats():
+    try:
+        return await PortfolioStats.objects.aget(pk=STATS_PK)
+    except PortfolioStats.DoesNotExist:
+        return await sync_to_async(rebuild_portfolio_stats)()
+
+
+def apply_deltas(deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = PortfolioStats.objects.filter(pk=STATS_PK).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated:
+        # No row yet (fresh database): the full aggregate already includes this write.
+        rebuild_portfolio_stats()
+
+
+def _add_loans(deltas, status, count, amount):
+    field = status_field(status)
+    deltas[field] = deltas.get(field, 0) + count
+    if status in Loan.DISBURSED_STATUSES:
+        deltas['total_disbursed'] = deltas.get('total_disbursed', 0) + amount
+
+
+def record_loan_transition(from_status, to_status, count=1, amount=0):
+    """
+    Account for ``count`` loans totalling ``amount`` moving between statuses.
+
+    Pass ``None`` as ``from_status`` for new loans and as ``to_status`` for deleted ones.
+    """
+    deltas = {}
+    if from_status is not None:
+        _add_loans(deltas, from_status, -count, -amount)
+    if to_status is not None:
+        _add_loans(deltas, to_status, count, amount)
+    apply_deltas(deltas)
+
+
+def record_loan_change(old_status, old_amount, new_status, new_amount):
+    """Account for a single loan whose status and/or amount changed."""
+    deltas = {}
+    if old_status is not None:
+        _add_loans(deltas, old_status, -1, -old_amount)
+    if new_status is not None:
+        _add_loans(deltas, new_status, 1, new_amount)
+    apply_deltas(deltas)
+
+
+def record_repaid(amount):
+    apply_deltas({'total_repaid': amount})
+
+
+def record_users(count):
+    apply_deltas({'total_users': count})
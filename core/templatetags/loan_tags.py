@@ -0,0 +1,33 @@
+from django import template
+
+from ..models import Loan
+from ..scoring import reasons
+
+register = template.Library()
+
+STATUS_BADGES = {
+    'Pending': 'bg-warning text-dark',
+    'Active': 'bg-info',
+    'Paid': 'bg-success',
+}
+
+
+@register.filter
+def status_badge(status):
+    """Bootstrap classes for a loan status badge (one dict lookup instead of an if/elif chain per row)."""
+    return STATUS_BADGES.get(status, 'bg-danger')
+
+
+AGING_LABELS = dict(Loan.AGING_CHOICES)
+
+
+@register.filter
+def aging_label(bucket):
+    """Display name of an aging bucket number (e.g. from ``aging_summary`` rows)."""
+    return AGING_LABELS.get(bucket, bucket)
+
+
+@register.filter
+def score_reasons(flags):
+    """Reasons behind a loan score, from ``Loan.score_flags``."""
+    return reasons(flags)
@@ -0,0 +1,45 @@
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from .instrumentation import get_query_budget
+
+
+def run_commit_hooks(using=DEFAULT_DB_ALIAS):
+    """
+    Run and clear the ``on_commit()`` callbacks pending in a ``TestCase``, as if
+    its transaction had committed; the test transaction itself never does.
+    """
+    connection = connections[using]
+    while connection.run_on_commit:
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback, _ in callbacks:
+            callback()
+
+
+class QueryBudgetMixin:
+    """TestCase mixin for checking views against their ``@query_budget``."""
+
+    def assertWithinQueryBudget(self, request, *args, **kwargs):
+        """
+        Call ``request(*args, **kwargs)`` (e.g. ``self.client.get``) and fail if
+        the view that handled it ran more queries than it declared.
+        """
+        pending = len(connection.run_on_commit)
+        with CaptureQueriesContext(connection) as captured:
+            response = request(*args, **kwargs)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            # The request's work includes what its transaction runs on commit.
+            for _, callback, _ in connection.run_on_commit[pending:]:
+                callback()
+        view = response.resolver_match.func
+        budget = get_query_budget(view)
+        if budget is None:
+            self.fail(f'{response.resolver_match.view_name} does not declare a query budget')
+        if len(captured) > budget:
+            queries = '\n'.join(f"{i}. {query['sql']}" for i, query in enumerate(captured, start=1))
+            self.fail(
+                f'{response.resolver_match.view_name} ran {len(captured)} queries, '
+                f'budget is {budget}:\n{queries}'
+            )
+        return response
@@ -1,3 +1,1895 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import pickle
+import random
+import tempfile
+import zlib
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.template.backends.django import Template as DjangoTemplate
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+
+from rilakin import urls as root_urls
+
+from . import async_views, imports, instrumentation, views
+from .admin import with_indexed_dates
+from . import urls as core_urls
+from .auth import _user_key, _user_version, get_cached_user
+from .rollups import rollup_portfolio, watermark
+from . import scoring
+from .scoring import reasons, score_loans
+from . import simulation
+from .simulation import load_book, run_simulation
+from .replicas import PIN_COOKIE, REPLICA, ReplicaRouter
+from .search import search_borrowers
+from .aging import sweep_overdue
+from .archive import archive_closed_loans
+from .benchmarks import (
+    SCENARIOS, _create_fixtures, run_archive_benchmark, run_benchmarks, run_render_benchmarks, run_scoring_benchmark,
+)
+from .events import events_after, loan_event, record_events
+from .exports import stream_ledger
+from .identifiers import normalize_national_id, normalize_phone
+from .imports import import_repayments
+from .instrumentation import RequestMetrics
+from .loans import decide_pending_loans
+from .models import (
+    ArchivedLoan, ArchivedRepayment, ConcurrentUpdate, DailyRollup, Loan, LoanEvent, LossSimulation, PortfolioStats, Profile,
+    Repayment,
+)
+from .pagination import EstimatedCountPaginator, estimate_row_count, keyset_paginate, keyset_queryset
+from .testing import QueryBudgetMixin, run_commit_hooks
+from .versions import PORTFOLIO, bump_versions, get_version
+from .stats import STATS_PK, compute_portfolio_stats, get_portfolio_stats, record_loan_transition
+from .views import LOAN_ORDERING
+
+
+class LoanRepaidTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('borrower', password='pass12345')
+        self.loan = Loan.objects.create(borrower=self.user, amount=Decimal('500.00'), term_days=30, status='Active')
+
+    def test_repayment_create_and_delete_maintain_columns(self):
+        first = Repayment.objects.create(loan=self.loan, amount=Decimal('100.00'))
+        second = Repayment.objects.create(loan=self.loan, amount=Decimal('50.00'))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_repaid, Decimal('150.00'))
+        self.assertEqual(self.loan.last_repayment_at, second.date)
+
+        second.delete()
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_repaid, Decimal('100.00'))
+        self.assertEqual(self.loan.last_repayment_at, first.date)
+
+    def test_saving_a_stale_loan_keeps_the_totals(self):
+        stale = Loan.objects.get(pk=self.loan.pk)
+        repayment = Repayment.objects.create(loan=self.loan, amount=Decimal('100.00'))
+        stale.term_days = 45
+        stale.save()
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.term_days, self.loan.amount_repaid), (45, Decimal('100.00')))
+        self.assertEqual(self.loan.last_repayment_at, repayment.date)
+        # Named explicitly, they are written as given.
+        stale.amount_repaid = Decimal('0.00')
+        stale.save(update_fields=['amount_repaid'])
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_repaid, Decimal('0.00'))
+
+    def test_balance_costs_no_queries(self):
+        Repayment.objects.create(loan=self.loan, amount=Decimal('120.00'))
+        loan = Loan.objects.get(pk=self.loan.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(loan.balance, Decimal('380.00'))
+            self.assertEqual(loan.total_repaid, Decimal('120.00'))
+
+    def test_outstanding_is_filterable_in_sql(self):
+        Repayment.objects.create(loan=self.loan, amount=Decimal('450.00'))
+        self.assertFalse(Loan.objects.with_outstanding().filter(outstanding__gt=100).exists())
+        self.assertTrue(Loan.objects.with_outstanding().filter(outstanding=50).exists())
+
+    def test_reconcile_command_repairs_drift(self):
+        Repayment.objects.create(loan=self.loan, amount=Decimal('100.00'))
+        Loan.objects.filter(pk=self.loan.pk).update(amount_repaid=Decimal('7.00'))
+
+        out = StringIO()
+        call_command('reconcile_loan_balances', stdout=out)
+        self.assertIn('1 loan(s) drifted', out.getvalue())
+
+        call_command('reconcile_loan_balances', '--fix', stdout=StringIO())
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_repaid, Decimal('100.00'))
+
+        out = StringIO()
+        call_command('reconcile_loan_balances', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are asserted against SQLite')
+class QueryPlanTests(TestCase):
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_borrower_status_lookup(self):
+        user = User.objects.create_user('planner')
+        self.assertUsesIndex(Loan.objects.filter(borrower=user, status='Paid'), 'loan_borrower_status_idx')
+
+    def test_staff_status_listing(self):
+        self.assertUsesIndex(Loan.objects.filter(status='Pending').order_by(*LOAN_ORDERING), 'loan_status_created_idx')
+
+    def test_all_loans_listing(self):
+        self.assertUsesIndex(Loan.objects.order_by(*LOAN_ORDERING)[:50], 'loan_created_idx')
+
+    def test_recent_repayments(self):
+        self.assertUsesIndex(Repayment.objects.order_by('-date')[:10], 'repayment_date_idx')
+
+
+class OneOpenLoanTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('borrower', password='pass12345')
+        Profile.objects.create(user=self.user, verified_status=True)
+
+    def test_database_rejects_second_open_loan(self):
+        Loan.objects.create(borrower=self.user, amount=500, term_days=30, status='Active')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Loan.objects.create(borrower=self.user, amount=2000, term_days=30, status='Pending')
+        # closed loans are not restricted
+        Loan.objects.create(borrower=self.user, amount=100, term_days=30, status='Paid')
+
+    def test_apply_loan_reports_conflict(self):
+        Loan.objects.create(borrower=self.user, amount=2000, term_days=30, status='Pending')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('apply_loan'), {'amount': '500', 'term_days': '30'})
+        self.assertRedirects(response, reverse('dashboard'))
+        self.assertEqual(Loan.objects.filter(borrower=self.user).count(), 1)
+
+
+    def test_migration_refuses_existing_duplicates(self):
+        check_open_loans = import_module('core.migrations.0004_loan_query_indexes').check_open_loans
+        schema_editor = mock.Mock(connection=connection)
+        first = Loan.objects.create(borrower=self.user, amount=500, term_days=30, status='Active')
+        check_open_loans(django_apps, schema_editor)
+        with connection.cursor() as cursor:  # as before the constraint; rolled back with the test
+            cursor.execute('DROP INDEX one_open_loan_per_borrower')
+        second = Loan.objects.create(borrower=self.user, amount=200, term_days=30, status='Pending')
+        with self.assertRaisesMessage(RuntimeError, f'borrower {self.user.pk}: loan {first.pk} (Active)') as error:
+            check_open_loans(django_apps, schema_editor)
+        self.assertIn(f'loan {second.pk} (Pending)', str(error.exception))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        borrowers = User.objects.bulk_create(User(username=f'b{i}') for i in range(12))
+        Profile.objects.bulk_create(Profile(user=user) for user in borrowers)
+        # identical created_at values exercise the id tie-breaker
+        Loan.objects.bulk_create(
+            Loan(borrower=user, amount=100 + i, term_days=30, status='Pending' if i % 2 else 'Paid')
+            for i, user in enumerate(borrowers)
+        )
+        Loan.objects.update(created_at=Loan.objects.first().created_at)
+
+    def walk(self, queryset, ordering, page_size):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(queryset, ordering, cursor=cursor, page_size=page_size)
+            seen.extend(obj.pk for obj in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once(self):
+        expected = list(Loan.objects.order_by(*LOAN_ORDERING).values_list('pk', flat=True))
+        self.assertEqual(self.walk(Loan.objects.all(), LOAN_ORDERING, 5), expected)
+
+        pending = Loan.objects.filter(status='Pending')
+        self.assertEqual(
+            self.walk(pending, LOAN_ORDERING, 4),
+            list(pending.order_by(*LOAN_ORDERING).values_list('pk', flat=True)),
+        )
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plans are asserted against SQLite')
+    def test_deep_page_seeks_on_index(self):
+        pending = Loan.objects.filter(status='Pending')
+        first = keyset_paginate(pending, LOAN_ORDERING, page_size=2)
+        plan = keyset_queryset(pending, LOAN_ORDERING, cursor=first.next_cursor)[:2].explain()
+        self.assertIn('loan_status_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_admin_loans_next_link_keeps_filter(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin_loans'), {'status': 'Pending', 'page_size': 4})
+        self.assertEqual(len(response.context['loans']), 4)
+        next_query = response.context['next_query']
+        self.assertIn('status=Pending', next_query)
+        self.assertContains(response, next_query.replace('&', '&amp;'))
+
+        response = self.client.get(reverse('admin_loans') + '?' + next_query)
+        self.assertEqual(len(response.context['loans']), 2)
+        self.assertTrue(all(loan.status == 'Pending' for loan in response.context['loans']))
+        self.assertFalse(response.context['loans'].has_next)
+
+    def test_admin_users_pages_and_rejects_bad_cursor(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin_users'), {'page_size': 5})
+        self.assertEqual(len(response.context['profiles']), 5)
+        self.assertTrue(response.context['profiles'].has_next)
+
+        response = self.client.get(reverse('admin_users'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PortfolioStatsTests(TestCase):
+    def assertStatsConsistent(self):
+        stats = get_portfolio_stats()
+        for field, expected in compute_portfolio_stats().items():
+            self.assertEqual(getattr(stats, field), expected, field)
+
+    def test_counters_match_aggregate_after_random_operations(self):
+        rng = random.Random(1234)
+        statuses = [status for status, _ in Loan.STATUS_CHOICES]
+        users = []
+        for step in range(200):
+            op = rng.choice(['user', 'loan', 'transition', 'repay', 'delete_repayment', 'delete_loan', 'delete_user'])
+            if op == 'user' or not users:
+                user = User.objects.create_user(f'user{step}')
+                Profile.objects.create(user=user)
+                users.append(user)
+            elif op == 'loan':
+                try:
+                    with transaction.atomic():
+                        Loan.objects.create(borrower=rng.choice(users), amount=rng.randint(100, 5000),
+                                            term_days=30, status=rng.choice(statuses))
+                except IntegrityError:
+                    pass  # borrower already has an open loan
+            elif op == 'transition':
+                loan = Loan.objects.order_by('?').first()
+                if loan:
+                    loan.status = rng.choice(statuses)
+                    loan.amount = rng.randint(100, 5000)
+                    try:
+                        with transaction.atomic():
+                            loan.save()
+                    except IntegrityError:
+                        pass
+            elif op == 'repay':
+                loan = Loan.objects.order_by('?').first()
+                if loan:
+                    Repayment.objects.create(loan=loan, amount=rng.randint(1, 500))
+            elif op == 'delete_repayment':
+                repayment = Repayment.objects.order_by('?').first()
+                if repayment:
+                    repayment.delete()
+            elif op == 'delete_loan':
+                loan = Loan.objects.order_by('?').first()
+                if loan:
+                    loan.delete()
+            elif op == 'delete_user' and rng.random() < 0.3:
+                users.pop(rng.randrange(len(users))).delete()
+            if step % 20 == 0:
+                self.assertStatsConsistent()
+        self.assertStatsConsistent()
+
+    def test_open_loan_transitions_and_bulk_updates(self):
+        user = User.objects.create_user('borrower')
+        loan = Loan.objects.create(borrower=user, amount=2000, term_days=30)
+        loan.status = 'Active'
+        loan.save()
+        self.assertStatsConsistent()
+
+        Loan.objects.filter(pk=loan.pk).update(status='Paid')
+        record_loan_transition('Active', 'Paid', count=1, amount=loan.amount)
+        self.assertStatsConsistent()
+
+    def test_stale_instances_cannot_repeat_a_transition(self):
+        user = User.objects.create_user('borrower')
+        loan = Loan.objects.create(borrower=user, amount=2000, term_days=30, status='Active')
+        first, second = Loan.objects.get(pk=loan.pk), Loan.objects.get(pk=loan.pk)
+        first.status = second.status = 'Paid'
+        first.save()
+        with self.assertRaises(ConcurrentUpdate), transaction.atomic():
+            second.save()
+        self.assertStatsConsistent()
+
+        # Instances without loaded values read them instead of rebuilding the counters.
+        deferred = Loan.objects.only('pk').get(pk=loan.pk)
+        deferred.status = 'Rejected'
+        with CaptureQueriesContext(connection) as queries:
+            deferred.save()
+        self.assertFalse([query for query in queries if 'core_repayment' in query['sql']])
+        self.assertStatsConsistent()
+
+    def test_dashboard_reads_stats_row(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        Profile.objects.create(user=staff)
+        Loan.objects.create(borrower=staff, amount=2000, term_days=30)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_users'], 1)
+        self.assertEqual(response.context['pending_loans_count'], 1)
+
+    def test_rebuild_command(self):
+        user = User.objects.create_user('borrower')
+        Profile.objects.create(user=user)
+        PortfolioStats.objects.filter(pk=STATS_PK).update(total_users=99)
+        call_command('rebuild_portfolio_stats', stdout=StringIO())
+        self.assertStatsConsistent()
+
+
+class BorrowerStateTests(TestCase):
+    # borrower state; the session and user come from the cache
+    GET_BUDGET = 1
+    # plus the version token of conditional pages
+    CONDITIONAL_GET_BUDGET = GET_BUDGET + 1
+
+    def setUp(self):
+        self.user = User.objects.create_user('borrower', password='pass12345')
+        self.profile = Profile.objects.create(user=self.user, verified_status=True, monthly_income=3000)
+        self.client.force_login(self.user)
+        get_cached_user(self.user.pk)
+
+    def test_dashboard_query_budget(self):
+        loan = Loan.objects.create(borrower=self.user, amount=500, term_days=30, status='Active')
+        Repayment.objects.create(loan=loan, amount=200)
+        with self.assertNumQueries(self.CONDITIONAL_GET_BUDGET):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['active_loan'], loan)
+        self.assertIsNone(response.context['pending_loan'])
+        self.assertContains(response, '$300.00')
+
+    def test_dashboard_without_profile_does_not_write(self):
+        self.profile.delete()
+        get_cached_user(self.user.pk)
+        with self.assertNumQueries(self.CONDITIONAL_GET_BUDGET):
+            response = self.client.get(reverse('dashboard'))
+        self.assertFalse(response.context['profile'].verified_status)
+        self.assertFalse(Profile.objects.filter(user=self.user).exists())
+
+    def test_apply_query_budget(self):
+        with self.assertNumQueries(self.GET_BUDGET):
+            response = self.client.get(reverse('apply_loan'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_repay_query_budget(self):
+        loan = Loan.objects.create(borrower=self.user, amount=500, term_days=30, status='Active')
+        with self.assertNumQueries(self.CONDITIONAL_GET_BUDGET):
+            response = self.client.get(reverse('repay_loan'))
+        self.assertEqual(response.context['loan'], loan)
+
+    def test_repay_to_zero_closes_loan(self):
+        loan = Loan.objects.create(borrower=self.user, amount=500, term_days=30, status='Active')
+        self.client.post(reverse('repay_loan'), {'amount': '500'})
+        loan.refresh_from_db()
+        self.assertEqual(loan.status, 'Paid')
+        self.assertEqual(loan.balance, 0)
+
+    def test_repay_does_not_reopen_a_loan_paid_off_meanwhile(self):
+        loan = Loan.objects.create(borrower=self.user, amount=500, term_days=30, status='Active')
+        stale = Loan.objects.get(pk=loan.pk)
+        self.client.post(reverse('repay_loan'), {'amount': '500'})
+        with mock.patch('core.views.get_borrower_state') as state:
+            state.return_value.active_loan = stale
+            self.client.post(reverse('repay_loan'), {'amount': '500'})
+        loan.refresh_from_db()
+        self.assertEqual((loan.status, loan.amount_repaid), ('Paid', 500))
+        self.assertEqual(Repayment.objects.filter(loan=loan).count(), 1)
+        self.assertEqual(LoanEvent.objects.filter(loan_id=loan.pk, kind=LoanEvent.PAID_OFF).count(), 1)
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_warm_request_skips_session_and_user_queries(self):
+        self.client.get(reverse('admin_loans'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin_loans'))
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('FROM "auth_user"', tables)
+
+    def test_revoking_staff_takes_effect_immediately(self):
+        self.assertEqual(self.client.get(reverse('admin_loans')).status_code, 200)
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertEqual(self.client.get(reverse('admin_loans')).status_code, 302)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get(reverse('admin_loans'))
+        self.staff.is_active = False
+        self.staff.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertRedirects(response, reverse('login') + '?next=/', fetch_redirect_response=False)
+
+    def test_profile_verification_refreshes_cached_user(self):
+        borrower = User.objects.create_user('borrower')
+        Profile.objects.create(user=borrower)
+        self.assertFalse(get_cached_user(borrower.pk).profile.verified_status)
+        self.client.post(reverse('verify_user_admin', args=[borrower.pk]))
+        self.assertTrue(get_cached_user(borrower.pk).profile.verified_status)
+
+    def test_invalidated_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.staff.is_staff = False
+            self.staff.save()
+            # A concurrent request that read the row before the commit
+            stale = User.objects.get(pk=self.staff.pk)
+            stale.is_staff = True
+            cache.set(_user_key(self.staff.pk, _user_version(self.staff.pk)), stale)
+        self.assertFalse(get_cached_user(self.staff.pk).is_staff)
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}):
+            self.client.force_login(self.staff)
+            self.assertEqual(self.client.get(reverse('admin_loans')).status_code, 200)
+            # The password hash never reaches the disk.
+            for name in os.listdir(location):
+                with open(os.path.join(location, name), 'rb') as entry:
+                    pickle.load(entry)  # expiry
+                    self.assertNotIn(self.staff.password.encode(), zlib.decompress(entry.read()))
+            self.staff.is_staff = False
+            self.staff.save()
+            self.assertEqual(self.client.get(reverse('admin_loans')).status_code, 302)
+
+    def test_cached_user_has_no_password_hash(self):
+        self.client.get(reverse('admin_loans'))
+        cached = cache.get(_user_key(self.staff.pk, _user_version(self.staff.pk)))
+        self.assertNotIn('password', cached.__dict__)
+        self.assertNotIn(self.staff.password.encode(), pickle.dumps(cached))
+        # Reading it loads it from the row rather than returning a blank.
+        self.assertEqual(cached.password, self.staff.password)
+
+    def test_password_change_keeps_the_session(self):
+        self.staff.set_password('old-secret')
+        self.staff.save()
+        self.client.force_login(self.staff)
+        self.client.get(reverse('admin_loans'))
+        response = self.client.post(reverse('password_change'), {
+            'old_password': 'old-secret', 'new_password1': 'N3w-s3cret-pass', 'new_password2': 'N3w-s3cret-pass',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(reverse('admin_loans')).status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.staff.pk).check_password('N3w-s3cret-pass'))
+
+
+class ReplicaRoutingTests(TestCase):
+    """Two SQLite files stand in for the primary and the replica."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings so the test runner leaves it alone.
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+        }
+        call_command('migrate', database=REPLICA, verbosity=0)
+        cls.databases = {'default', REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        # Version tokens roll back with each test but cached fragments do not.
+        cache.clear()
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.loan = Loan.objects.create(borrower=User.objects.create_user('primary-first'), amount=100, term_days=30)
+        Loan.objects.create(borrower=User.objects.create_user('primary-second'), amount=200, term_days=30)
+        Loan.objects.using(REPLICA).create(
+            borrower=User.objects.db_manager(REPLICA).create_user('replica-only'), amount=300, term_days=30,
+        )
+        self.client.force_login(self.staff)
+
+    def test_reporting_views_read_from_replica(self):
+        for name in ('admin_dashboard', 'admin_loans'):
+            response = self.client.get(reverse(name))
+            self.assertContains(response, 'replica-only')
+            self.assertNotContains(response, 'primary-first')
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = self.client.get(reverse('export_ledger', args=['loans']))
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2)
+
+    def test_other_reads_use_primary(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(Loan))
+        self.client.get(reverse('approve_loan', args=[self.loan.pk]))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, 'Active')
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        # The portfolio token moves once the approval commits, before the redirect is followed.
+        response = self.client.get(reverse('approve_loan', args=[self.loan.pk]))
+        run_commit_hooks()
+        response = self.client.get(response.url)
+        self.assertContains(response, 'primary-second')
+        self.assertNotContains(response, 'replica-only')
+        self.assertEqual(self.client.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertContains(self.client.get(reverse('admin_dashboard')), 'replica-only')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.borrower = User.objects.create_user('borrower')
+        Profile.objects.create(user=self.borrower, verified_status=True, monthly_income=3000)
+        self.loan = Loan.objects.create(borrower=self.borrower, amount=500, term_days=30)
+        self.client.force_login(self.borrower)
+        get_cached_user(self.borrower.pk)
+
+    def get(self, name, etag):
+        return self.client.get(reverse(name), headers={'if-none-match': etag})
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        response = self.client.get(reverse('dashboard'))
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(1):
+            response = self.get('dashboard', etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_loan_changes_move_the_borrower_token(self):
+        etag = self.client.get(reverse('dashboard'))['ETag']
+        decide_pending_loans(Loan.objects.filter(pk=self.loan.pk), 'Active')
+        response = self.get('dashboard', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Active Loan')
+        etag = response['ETag']
+
+        Repayment.objects.create(loan=self.loan, amount=100)
+        self.assertEqual(self.get('repay_loan', etag).status_code, 200)
+        self.assertEqual(self.get('dashboard', etag).status_code, 200)
+
+    def test_other_borrowers_do_not_move_the_token(self):
+        etag = self.client.get(reverse('dashboard'))['ETag']
+        other = User.objects.create_user('other')
+        Loan.objects.create(borrower=other, amount=100, term_days=30)
+        self.assertEqual(self.get('dashboard', etag).status_code, 304)
+
+    def test_pending_messages_are_rendered(self):
+        self.loan.delete()
+        etag = self.client.get(reverse('dashboard'))['ETag']
+        self.client.get(reverse('repay_loan'))  # queues "No active loan to repay."
+        response = self.get('dashboard', etag)
+        self.assertContains(response, 'No active loan to repay.')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.get('dashboard', etag).status_code, 304)
+
+    def test_staff_pages_follow_the_portfolio_token(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        etag = self.client.get(reverse('admin_loans'))['ETag']
+        self.assertEqual(self.get('admin_loans', etag).status_code, 304)
+        self.client.get(reverse('approve_loan', args=[self.loan.pk]))
+        self.assertEqual(self.get('admin_loans', etag).status_code, 200)
+
+    def test_portfolio_token_moves_once_per_transaction(self):
+        run_commit_hooks()
+        before = get_version(PORTFOLIO)
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for amount in (10, 20, 30):
+                    Repayment.objects.create(loan=self.loan, amount=amount)
+                bump_versions([30, 4, 12])
+                self.assertEqual(get_version(PORTFOLIO), before)
+            run_commit_hooks()
+        self.assertNotEqual(get_version(PORTFOLIO), before)
+        upserts = [query['sql'] for query in queries if 'INTO "core_versiontoken"' in query['sql']]
+        self.assertEqual(sum("'portfolio'" in sql for sql in upserts), 1)
+        # Keys in a stable order, so concurrent writers lock them in the same order.
+        self.assertRegex(upserts[-2], r"'borrower:12'.*'borrower:30'.*'borrower:4'")
+        # The repayments' loan was passed in, so finding the borrower cost nothing.
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "core_loan"."borrower_id"')])
+
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        borrower = User.objects.create_user('borrower')
+        self.loan = Loan.objects.create(borrower=borrower, amount=500, term_days=30)
+        payer = User.objects.create_user('payer')
+        Repayment.objects.create(
+            loan=Loan.objects.create(borrower=payer, amount=100, term_days=30, status='Active'), amount=40,
+        )
+        self.client.force_login(self.staff)
+
+    def test_fragments_are_reused_until_the_portfolio_changes(self):
+        self.assertContains(self.client.get(reverse('admin_loans')), '$500.00')
+        # update() skips the signals, so the version stays and the cached rows are served.
+        Loan.objects.filter(pk=self.loan.pk).update(amount=900)
+        self.assertContains(self.client.get(reverse('admin_loans')), '$500.00')
+        decide_pending_loans(Loan.objects.filter(pk=self.loan.pk), 'Active')
+        run_commit_hooks()
+        response = self.client.get(reverse('admin_loans'))
+        self.assertContains(response, '$900.00')
+        self.assertContains(response, 'bg-info">Active')
+        self.assertNotContains(response, 'Pending</span>')
+
+    def test_borrower_edits_refresh_the_fragments(self):
+        run_commit_hooks()
+        self.assertContains(self.client.get(reverse('admin_loans')), 'borrower')
+        borrower = self.loan.borrower
+        borrower.username = 'renamed-borrower'
+        borrower.save()
+        run_commit_hooks()
+        self.assertContains(self.client.get(reverse('admin_loans')), 'renamed-borrower')
+        version = get_version(PORTFOLIO)
+        Profile.objects.create(user=borrower, phone_number='0700000001')
+        run_commit_hooks()
+        self.assertNotEqual(get_version(PORTFOLIO), version)
+        version = get_version(PORTFOLIO)
+        borrower.last_login = timezone.now()
+        borrower.save(update_fields=['last_login'])
+        run_commit_hooks()
+        self.assertEqual(get_version(PORTFOLIO), version)
+
+    def test_filters_are_cached_separately(self):
+        self.client.get(reverse('admin_loans'))
+        response = self.client.get(reverse('admin_loans'), {'status': 'Active'})
+        self.assertNotContains(response, f'value="{self.loan.pk}"')
+
+    def test_warm_dashboard_skips_the_recent_repayments_query(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(reverse('admin_dashboard'))
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertContains(response, '$40')
+        self.assertLess(len(warm), len(cold))
+        self.assertFalse(any('core_repayment' in query['sql'] for query in warm.captured_queries))
+
+    def test_render_benchmark(self):
+        results = run_render_benchmarks(iterations=2, warmup=0, page_size=10)
+        self.assertEqual(set(results), {'core/admin_loans.html', 'core/admin_dashboard.html'})
+        for modes in results.values():
+            self.assertEqual(set(modes), {'reparse', 'cached_loader', 'cached_fragments'})
+
+
+
+class AgingTests(TestCase):
+    today = timezone.localdate()
+
+    def active_loan(self, days_overdue, status='Active'):
+        borrower = User.objects.create_user(f'borrower-{User.objects.count()}')
+        return Loan.objects.create(
+            borrower=borrower, amount=1000, term_days=30, status=status,
+            due_date=self.today - timedelta(days=days_overdue),
+        )
+
+    def test_buckets_follow_the_days_overdue(self):
+        expected = {
+            -5: Loan.CURRENT, 0: Loan.CURRENT, 1: Loan.OVERDUE_1_30, 30: Loan.OVERDUE_1_30,
+            31: Loan.OVERDUE_31_60, 60: Loan.OVERDUE_31_60, 61: Loan.OVERDUE_61_90,
+            90: Loan.OVERDUE_61_90, 91: Loan.OVERDUE_90_PLUS, 400: Loan.OVERDUE_90_PLUS,
+        }
+        loans = {days: self.active_loan(days) for days in expected}
+        pending = self.active_loan(100, status='Pending')
+        sweep_overdue(today=self.today, chunk_size=3)
+        for days, bucket in expected.items():
+            loans[days].refresh_from_db()
+            self.assertEqual(loans[days].aging_bucket, bucket, f'{days} days overdue')
+        pending.refresh_from_db()
+        self.assertEqual(pending.aging_bucket, Loan.CURRENT)
+
+    def test_sweeps_only_touch_changed_loans(self):
+        loan = self.active_loan(29)
+        self.assertEqual(sum(sweep_overdue(today=self.today).values()), 1)
+        self.assertEqual(sum(sweep_overdue(today=self.today).values()), 0)
+        moved = sweep_overdue(today=self.today + timedelta(days=2))
+        self.assertEqual(moved[Loan.OVERDUE_31_60], 1)
+        self.assertEqual(sum(moved.values()), 1)
+
+        loan.refresh_from_db()
+        loan.status = 'Paid'
+        loan.save()
+        moved = sweep_overdue(today=self.today + timedelta(days=2))
+        self.assertEqual(moved[Loan.CURRENT], 1)
+        loan.refresh_from_db()
+        self.assertEqual(loan.aging_bucket, Loan.CURRENT)
+
+    def test_dashboard_summary(self):
+        cache.clear()
+        self.active_loan(10)
+        self.active_loan(20)
+        Repayment.objects.create(loan=self.active_loan(45), amount=250)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertNotContains(self.client.get(reverse('admin_dashboard')), 'Overdue Loans')
+        call_command('sweep_overdue', stdout=StringIO())
+        run_commit_hooks()
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertContains(response, 'Overdue Loans')
+        self.assertContains(response, '<td>1–30 days</td>\n                    <td>2</td>', html=False)
+        self.assertContains(response, '$750.00')
+
+    def test_command(self):
+        self.active_loan(5)
+        out = StringIO()
+        call_command('sweep_overdue', '--date', (self.today + timedelta(days=40)).isoformat(), stdout=out)
+        self.assertIn('31–60 days: 1 loan(s)', out.getvalue())
+
+
+
+class RollupTests(TestCase):
+    today = timezone.localdate()
+
+    def at(self, days_ago, hour=12):
+        return timezone.make_aware(datetime.combine(self.today - timedelta(days=days_ago), time(hour)))
+
+    def setUp(self):
+        self.borrower = User.objects.create_user('borrower', date_joined=self.at(10))
+        Profile.objects.create(user=self.borrower)
+        User.objects.create_user('staff', is_staff=True, date_joined=self.at(10))  # no profile: not a borrower
+        self.loan = Loan.objects.create(borrower=self.borrower, amount=1000, term_days=30)
+        decide_pending_loans(Loan.objects.filter(pk=self.loan.pk), 'Active')
+        Loan.objects.filter(pk=self.loan.pk).update(decided_at=self.at(3))
+        repayment = Repayment.objects.create(loan=self.loan, amount=400)
+        Repayment.objects.filter(pk=repayment.pk).update(date=self.at(2))
+        rejected = Loan.objects.create(borrower=User.objects.create_user('rejected'), amount=50, term_days=30)
+        decide_pending_loans(Loan.objects.filter(pk=rejected.pk), 'Rejected')
+        Loan.objects.filter(pk=rejected.pk).update(decided_at=self.at(3, hour=23))
+
+    def rollup(self, days_ago):
+        return DailyRollup.objects.get(day=self.today - timedelta(days=days_ago))
+
+    def test_incremental_runs_from_the_watermark(self):
+        self.assertEqual(watermark(), self.today - timedelta(days=10))
+        self.assertEqual(rollup_portfolio(), 11)
+        self.assertEqual(self.rollup(10).new_borrowers, 1)
+        self.assertEqual(
+            (self.rollup(3).disbursed_count, self.rollup(3).disbursed_amount, self.rollup(3).rejected_count),
+            (1, Decimal('1000.00'), 1),
+        )
+        self.assertEqual((self.rollup(2).repaid_count, self.rollup(2).repaid_amount), (1, Decimal('400.00')))
+        self.assertEqual(self.rollup(5).disbursed_count, 0)
+
+        # Only today is recomputed on the next run.
+        self.assertEqual(watermark(), self.today)
+        Repayment.objects.create(loan=self.loan, amount=600)
+        loan = Loan.objects.get(pk=self.loan.pk)
+        loan.status = 'Paid'
+        loan.save()
+        self.assertEqual(rollup_portfolio(), 1)
+        self.assertEqual((self.rollup(0).repaid_amount, self.rollup(0).paid_off_count), (Decimal('600.00'), 1))
+
+    def test_backfill_and_defaults(self):
+        rollup_portfolio()
+        # A loan due long ago that was never repaid defaults 91 days after its due date.
+        old = Loan.objects.create(
+            borrower=User.objects.create_user('old'), amount=300, term_days=30, status='Active',
+            due_date=self.today - timedelta(days=95),
+        )
+        Loan.objects.filter(pk=old.pk).update(decided_at=self.at(9))
+        self.assertEqual(self.rollup(9).disbursed_count, 0)
+        out = StringIO()
+        call_command('rollup_portfolio', '--since', (self.today - timedelta(days=9)).isoformat(), stdout=out)
+        self.assertIn('Rolled up 10 day(s)', out.getvalue())
+        self.assertEqual(self.rollup(9).disbursed_count, 1)
+        self.assertEqual((self.rollup(4).defaulted_count, self.rollup(4).defaulted_amount), (1, Decimal('300.00')))
+
+    def test_decisions_are_timestamped(self):
+        loan = Loan.objects.create(borrower=User.objects.create_user('new'), amount=10, term_days=30)
+        self.assertIsNone(loan.decided_at)
+        loan.status = 'Active'
+        loan.save()
+        self.assertIsNotNone(loan.decided_at)
+        self.assertEqual(Loan.objects.filter(decided_at__isnull=True).count(), 0)
+
+    def test_loans_decided_before_recording_stay_undated(self):
+        legacy = Loan.objects.create(borrower=User.objects.create_user('legacy'), amount=70, term_days=30, status='Active')
+        # As 0010 leaves loans decided before the column existed.
+        Loan.objects.filter(pk=legacy.pk).update(decided_at=None)
+
+        # Repaying it later does not date the approval to today.
+        legacy = Loan.objects.get(pk=legacy.pk)
+        legacy.status = 'Paid'
+        legacy.save()
+        self.assertIsNone(legacy.decided_at)
+        rollup_portfolio()
+        self.assertEqual(self.rollup(0).disbursed_count, 0)
+        self.assertEqual(self.rollup(3).disbursed_count, 1)
+
+        Loan.objects.filter(pk=legacy.pk).update(created_at=self.at(400))
+        self.assertEqual(archive_closed_loans(), (1, 0))
+
+    def test_trend_views(self):
+        rollup_portfolio()
+        self.client.force_login(User.objects.get(username='staff'))
+        response = self.client.get(reverse('admin_trends'))
+        self.assertContains(response, '$1000')
+        self.assertEqual(len(response.context['rollups']), 11)  # the default 30 days, as far as rolled up
+
+        start = (self.today - timedelta(days=3)).isoformat()
+        end = (self.today - timedelta(days=2)).isoformat()
+        data = self.client.get(reverse('admin_trends_data'), {'start': start, 'end': end}).json()
+        self.assertEqual([day['day'] for day in data['days']], [start, end])
+        self.assertEqual(data['days'][0]['disbursed_amount'], '1000.00')
+        self.assertEqual(data['days'][1]['repaid_count'], 1)
+
+        response = self.client.get(reverse('admin_trends_data'), {'start': end, 'end': start})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ScoringTests(TestCase):
+    def borrower(self, name, income, history=()):
+        user = User.objects.create_user(name)
+        Profile.objects.create(user=user, verified_status=True, monthly_income=income)
+        today = timezone.localdate()
+        for status, days_late in history:
+            loan = Loan.objects.create(
+                borrower=user, amount=100, term_days=30, status=status, due_date=today - timedelta(days=60),
+            )
+            if status == 'Paid':
+                Loan.objects.filter(pk=loan.pk).update(
+                    last_repayment_at=timezone.now() - timedelta(days=60 - days_late),
+                )
+        return Loan.objects.create(borrower=user, amount=1000, term_days=30)
+
+    def test_batch_scores(self):
+        good = self.borrower('good', 10000, [('Paid', 0), ('Paid', -3)])
+        late = self.borrower('late', 10000, [('Paid', 20), ('Rejected', 0)])
+        stretched = self.borrower('stretched', 2200)
+        no_income = self.borrower('no-income', None)
+        Loan.objects.create(borrower=User.objects.create_user('active'), amount=10, term_days=30, status='Active')
+
+        self.assertEqual(score_loans(), 4)
+        scored = {loan.pk: loan for loan in Loan.objects.filter(status='Pending')}
+        self.assertGreater(scored[good.pk].score, scored[late.pk].score)
+        self.assertGreater(scored[late.pk].score, scored[stretched.pk].score)
+        self.assertEqual(scored[no_income.pk].score, 0)
+        self.assertEqual(reasons(scored[good.pk].score_flags), ['Repaid 2+ loans on time'])
+        self.assertEqual(
+            scored[late.pk].score_flags, scoring.LATE_HISTORY | scoring.PRIOR_REJECTION,
+        )
+        self.assertEqual(scored[stretched.pk].score_flags, scoring.HIGH_DTI | scoring.NO_HISTORY)
+        self.assertEqual(scored[no_income.pk].score_flags, scoring.NO_INCOME | scoring.NO_HISTORY)
+        self.assertFalse(Loan.objects.filter(status='Active', score__isnull=False).exists())
+
+    def test_matches_the_per_loan_reference(self):
+        results = run_scoring_benchmark(loans=200, seed=3)
+        self.assertEqual(results['loans'], 200)
+        self.assertFalse(Loan.objects.exists())
+
+    def test_command_and_empty_queue(self):
+        out = StringIO()
+        call_command('score_pending_loans', stdout=out)
+        self.assertIn('Scored 0 pending loan(s)', out.getvalue())
+        self.borrower('first', 5000)
+        call_command('score_pending_loans', '--unscored', stdout=out)
+        self.assertIn('Scored 1 pending loan(s)', out.getvalue())
+
+    def test_admin_loans_by_score(self):
+        cache.clear()
+        loans = [self.borrower(f'b{i}', income) for i, income in enumerate([3000, 20000, 6000])]
+        score_loans()
+        unscored = self.borrower('unscored', 9000)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+        response = self.client.get(reverse('admin_loans'), {'status': 'Pending', 'sort': 'score', 'page_size': 2})
+        self.assertEqual([loan.pk for loan in response.context['loans']], [loans[1].pk, loans[2].pk])
+        response = self.client.get(f"{reverse('admin_loans')}?{response.context['next_query']}")
+        self.assertEqual([loan.pk for loan in response.context['loans']], [loans[0].pk])
+
+        minimum = Loan.objects.get(pk=loans[2].pk).score
+        response = self.client.get(reverse('admin_loans'), {'min_score': minimum})
+        self.assertEqual({loan.pk for loan in response.context['loans']}, {loans[1].pk, loans[2].pk})
+        self.assertIn(unscored, self.client.get(reverse('admin_loans')).context['loans'])
+
+
+
+class SimulationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        today = timezone.localdate()
+        for i, (days_overdue, repaid) in enumerate([(-10, 0), (5, 200), (45, 0), (120, 100)]):
+            loan = Loan.objects.create(
+                borrower=User.objects.create_user(f'b{i}'), amount=1000, term_days=30, status='Active',
+                due_date=today - timedelta(days=days_overdue),
+            )
+            if repaid:
+                Repayment.objects.create(loan=loan, amount=repaid)
+        Loan.objects.create(borrower=User.objects.create_user('pending'), amount=5000, term_days=30)
+
+    def test_book_and_figures(self):
+        book = load_book()
+        self.assertEqual(sorted(book.balance.tolist()), [800.0, 900.0, 1000.0, 1000.0])
+        self.assertEqual(sorted(book.buckets.tolist()), [Loan.CURRENT, Loan.OVERDUE_1_30, Loan.OVERDUE_31_60, Loan.OVERDUE_90_PLUS])
+
+        result = run_simulation(book, scenarios=4000, seed=1)
+        self.assertEqual((result['loans'], result['scenarios'], result['exposure']), (4, 4000, 3700.0))
+        # Expected loss is close to sum(pd * balance * mean loss given default).
+        expected = sum(
+            simulation.DEFAULT_PROBABILITIES[bucket] * balance * 0.6
+            for bucket, balance in zip(book.buckets.tolist(), book.balance.tolist())
+        )
+        self.assertAlmostEqual(result['expected_loss'], expected, delta=expected * 0.05)
+        self.assertLessEqual(result['var_95'], result['var_99'])
+        self.assertLessEqual(result['var_99'], result['expected_shortfall_99'])
+        self.assertEqual(sum(row['scenarios'] for row in result['histogram']), 4000)
+
+    def test_seeds_are_reproducible_across_workers(self):
+        book = simulation.synthetic_book(500, seed=2)
+        with mock.patch.object(simulation, 'BLOCK_CELLS', 500 * 50):
+            serial = run_simulation(book, scenarios=400, seed=9)
+            parallel = run_simulation(book, scenarios=400, seed=9, workers=2)
+            other = run_simulation(book, scenarios=400, seed=10)
+        self.assertEqual(serial, parallel)
+        self.assertNotEqual(serial['expected_loss'], other['expected_loss'])
+
+    def test_empty_book(self):
+        Loan.objects.filter(status='Active').delete()
+        result = run_simulation(load_book(), scenarios=100)
+        self.assertEqual((result['loans'], result['expected_loss'], result['var_99']), (0, 0.0, 0.0))
+
+    def test_risk_page_is_cached_per_portfolio_version_and_day(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        with mock.patch.object(simulation, 'run_simulation', wraps=simulation.run_simulation) as run:
+            response = self.client.get(reverse('admin_risk'), {'scenarios': 500})
+            self.assertContains(response, 'Expected Shortfall 99%')
+            self.client.get(reverse('admin_risk'), {'scenarios': 500})
+            self.assertEqual(run.call_count, 1)
+            Repayment.objects.create(loan=Loan.objects.filter(status='Active').first(), amount=50)
+            run_commit_hooks()
+            self.client.get(reverse('admin_risk'), {'scenarios': 500})
+            self.assertEqual(run.call_count, 2)
+            # Aging moves with the date even when nothing is written.
+            tomorrow = timezone.localdate() + timedelta(days=1)
+            with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+                self.client.get(reverse('admin_risk'), {'scenarios': 500})
+            self.assertEqual(run.call_count, 3)
+        self.assertEqual(self.client.get(reverse('admin_risk'), {'scenarios': 10}).context['result'], None)
+
+    def test_risk_page_only_starts_small_runs(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        with mock.patch.object(simulation, 'run_simulation') as run:
+            for params in ({'scenarios': 5000}, {'scenarios': 500, 'seed': 3}):
+                response = self.client.get(reverse('admin_risk'), params)
+                self.assertIsNone(response.context['result'])
+                self.assertContains(response, 'python manage.py simulate_losses')
+            with mock.patch.object(simulation, 'INTERACTIVE_MAX_CELLS', 4 * 500 - 1):
+                self.assertIsNone(self.client.get(reverse('admin_risk'), {'scenarios': 500}).context['result'])
+        run.assert_not_called()
+
+    def test_command_warms_the_page(self):
+        call_command('simulate_losses', '--scenarios', '5000', '--seed', '3', stdout=StringIO())
+        cache.clear()  # the command runs in a process of its own, with its own cache
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        with mock.patch.object(simulation, 'run_simulation') as run:
+            response = self.client.get(reverse('admin_risk'), {'scenarios': 5000, 'seed': 3})
+        run.assert_not_called()
+        self.assertEqual(response.context['result']['scenarios'], 5000)
+        # Only results for the current book and day are kept.
+        Repayment.objects.create(loan=Loan.objects.filter(status='Active').first(), amount=50)
+        run_commit_hooks()
+        call_command('simulate_losses', '--scenarios', '300', stdout=StringIO())
+        self.assertEqual(list(LossSimulation.objects.values_list('scenarios', 'seed')), [(300, 0)])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.borrower = User.objects.create_user('borrower')
+        Profile.objects.create(user=self.borrower, verified_status=True, monthly_income=5000, phone_number='0700000001')
+        long_ago = timezone.now() - timedelta(days=400)
+        self.old_paid = self.closed_loan('Paid', long_ago, reference='OLD-1')
+        self.old_rejected = self.closed_loan('Rejected', long_ago)
+        self.recent_paid = self.closed_loan('Paid', timezone.now() - timedelta(days=10))
+        self.active = Loan.objects.create(borrower=self.borrower, amount=300, term_days=30, status='Active')
+
+    def closed_loan(self, status, closed, reference=None):
+        loan = Loan.objects.create(borrower=self.borrower, amount=100, term_days=30, status=status)
+        if status == 'Paid':
+            Repayment.objects.create(loan=loan, amount=100, reference=reference)
+        Loan.objects.filter(pk=loan.pk).update(
+            created_at=closed - timedelta(days=30), decided_at=closed - timedelta(days=30),
+            last_repayment_at=closed if status == 'Paid' else None,
+        )
+        Repayment.objects.filter(loan=loan).update(date=closed)
+        return loan
+
+    def test_archives_old_closed_loans_with_their_repayments(self):
+        stats_before = compute_portfolio_stats()
+        live_row = Loan.objects.filter(pk=self.old_paid.pk).values().get()
+
+        self.assertEqual(archive_closed_loans(batch_size=1), (2, 1))
+
+        self.assertEqual(
+            set(Loan.objects.values_list('pk', flat=True)), {self.recent_paid.pk, self.active.pk},
+        )
+        self.assertEqual(
+            set(ArchivedLoan.objects.values_list('pk', flat=True)), {self.old_paid.pk, self.old_rejected.pk},
+        )
+        archived = ArchivedLoan.objects.filter(pk=self.old_paid.pk).values().get()
+        self.assertEqual({key: archived[key] for key in live_row}, live_row)
+        self.assertEqual(ArchivedRepayment.objects.get().loan_id, self.old_paid.pk)
+        # Nothing left the portfolio: the stored totals still match a full recount.
+        self.assertEqual(compute_portfolio_stats(), stats_before)
+        stats = get_portfolio_stats()
+        self.assertEqual((stats.paid_loans, stats.total_repaid), (2, stats_before['total_repaid']))
+        self.assertEqual(archive_closed_loans(), (0, 0))
+
+    def test_restore_puts_rows_back_unchanged(self):
+        rows = list(Loan.objects.order_by('pk').values())
+        repayments = list(Repayment.objects.order_by('pk').values())
+        archive_closed_loans()
+
+        out = StringIO()
+        call_command('restore_archived_loans', '--borrower', 'borrower', stdout=out)
+        self.assertIn('Restored 2 loan(s) and 1 repayment(s)', out.getvalue())
+        self.assertEqual(list(Loan.objects.order_by('pk').values()), rows)
+        self.assertEqual(list(Repayment.objects.order_by('pk').values()), repayments)
+        self.assertFalse(ArchivedLoan.objects.exists())
+
+    def test_admin_loans_unions_the_archive_only_when_asked(self):
+        call_command('archive_closed_loans', stdout=StringIO())
+        self.client.force_login(self.staff)
+        url = reverse('admin_loans')
+        live = self.client.get(url).context['loans']
+        self.assertEqual([loan.pk for loan in live], [self.active.pk, self.recent_paid.pk])
+
+        # One loan per page: the cursor walks across both tables in created_at order.
+        seen, params = [], {'archived': '1', 'page_size': 1}
+        while True:
+            page = self.client.get(url, params).context['loans']
+            seen += [(loan.pk, loan.is_archived) for loan in page]
+            if not page.has_next:
+                break
+            params['after'] = page.next_cursor
+        self.assertEqual(seen, [
+            (self.active.pk, False), (self.recent_paid.pk, False),
+            (self.old_rejected.pk, True), (self.old_paid.pk, True),
+        ])
+        response = self.client.get(url, {'archived': '1', 'status': 'Paid'})
+        self.assertEqual([loan.pk for loan in response.context['loans']], [self.recent_paid.pk, self.old_paid.pk])
+        self.assertContains(response, 'Archived')
+
+    def test_exports_merge_the_archive_when_asked(self):
+        archive_closed_loans()
+        self.client.force_login(self.staff)
+        url = reverse('export_ledger', args=['loans'])
+        ids = lambda response: [
+            int(row[0]) for row in list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))[1:]
+        ]
+        self.assertEqual(ids(self.client.get(url)), [self.recent_paid.pk, self.active.pk])
+        self.assertEqual(
+            ids(self.client.get(url, {'archived': '1'})),
+            [self.old_paid.pk, self.old_rejected.pk, self.recent_paid.pk, self.active.pk],
+        )
+        out = StringIO()
+        call_command('export_ledger', 'repayments', '--format', 'jsonl', '--include-archived', stdout=out)
+        self.assertEqual(
+            [json.loads(line)['loan_id'] for line in out.getvalue().splitlines()], [self.old_paid.pk, self.recent_paid.pk],
+        )
+
+    def test_history_still_counts_after_archival(self):
+        self.active.status = 'Paid'
+        self.active.save()
+        pending = Loan.objects.create(borrower=self.borrower, amount=1000, term_days=30)
+        score_loans()
+        before = Loan.objects.values_list('score', 'score_flags').get(pk=pending.pk)
+        rollup_portfolio(since=timezone.localdate() - timedelta(days=450))
+        rollups = list(DailyRollup.objects.values())
+
+        archive_closed_loans()
+        Loan.objects.filter(pk=pending.pk).update(score=None)
+        score_loans()
+        self.assertEqual(Loan.objects.values_list('score', 'score_flags').get(pk=pending.pk), before)
+        rollup_portfolio(since=timezone.localdate() - timedelta(days=450))
+        strip = lambda rows: [{key: value for key, value in row.items() if key != 'updated_at'} for row in rows]
+        self.assertEqual(strip(DailyRollup.objects.values()), strip(rollups))
+
+    def test_archived_references_stay_imported(self):
+        archive_closed_loans()
+        report = import_repayments(['reference,phone,amount\n', 'OLD-1,0700000001,100\n'])
+        self.assertEqual(report.duplicates, 1)
+        self.assertFalse(Repayment.objects.filter(reference='OLD-1').exists())
+
+    def test_deleting_the_borrower_counts_archived_loans_out(self):
+        archive_closed_loans()
+        self.borrower.delete()
+        stats = get_portfolio_stats()
+        self.assertEqual((stats.paid_loans, stats.rejected_loans, stats.total_repaid), (0, 0, 0))
+
+    def test_benchmark_rolls_back(self):
+        report = run_archive_benchmark(history=300, iterations=1, warmup=0, names=['dashboard', 'admin_loans'])
+        self.assertAlmostEqual(report['history_rows'], 300, delta=30)
+        # The history plus the two old loans (and one repayment) of setUp.
+        self.assertEqual(report['archived']['loans'] + report['archived']['repayments'], report['history_rows'] + 3)
+        self.assertEqual(report['live_tables']['after']['loans'], 2)
+        self.assertEqual(set(report['views']), {'dashboard', 'admin_loans'})
+        self.assertFalse(User.objects.filter(username__startswith='archive-bench-').exists())
+        self.assertFalse(ArchivedLoan.objects.exists())
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_superuser('root', password='x')
+        self.client.force_login(self.staff)
+        self.add_borrowers(3)
+
+    def add_borrowers(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(f'borrower-{i:03}')
+            Profile.objects.create(user=user, phone_number=f'+2547000{i:05}', national_id=f'ID{i:05}')
+            loan = Loan.objects.create(borrower=user, amount=100, term_days=30, status='Active')
+            Repayment.objects.create(loan=loan, amount=10, reference=f'R{i:05}')
+
+    def queries(self, url):
+        self.client.get(url)  # warm the session and user caches
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(captured)
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        # Count (statistics probe + COUNT), rows with their joins, and the date
+        # hierarchy: MIN, MAX, then one seek per day shown plus one past the last.
+        expected = {
+            'admin:core_loan_changelist': 7,
+            'admin:core_repayment_changelist': 7,
+            'admin:core_profile_changelist': 3,
+        }
+        for name, count in expected.items():
+            self.assertEqual(self.queries(reverse(name)), count, name)
+        self.add_borrowers(30)
+        for name, count in expected.items():
+            self.assertEqual(self.queries(reverse(name)), count, name)
+        # Filtered: an exact COUNT only, no statistics probe.
+        self.assertEqual(self.queries(reverse('admin:core_loan_changelist') + '?status__exact=Active'), 6)
+
+    def test_search_modes(self):
+        url = reverse('admin:core_profile_changelist')
+        found = lambda q: sorted(p.user.username for p in self.client.get(url, {'q': q}).context['cl'].result_list)
+        self.assertEqual(found('borrower-00'), ['borrower-001', 'borrower-002', 'borrower-003'])
+        self.assertEqual(found('orrower-001'), [])  # prefix, not substring
+        self.assertEqual(found('BORROWER-001'), ['borrower-001'])
+        # Phone numbers and IDs in any format, through their normalized keys.
+        self.assertEqual(found('0700 000 002'), ['borrower-002'])
+        self.assertEqual(found('+254 7000'), ['borrower-001', 'borrower-002', 'borrower-003'])
+        self.assertEqual(found('id-00003'), ['borrower-003'])
+        repayments = self.client.get(reverse('admin:core_repayment_changelist'), {'q': 'R00001'})
+        self.assertEqual([r.reference for r in repayments.context['cl'].result_list], ['R00001'])
+
+    def test_prefix_lookup(self):
+        for name in ('ab', 'abc', 'ab~', 'aa', 'ac', 'b', 'AB', 'a-b', 'a.b', 'a b'):
+            User.objects.create_user(name)
+        found = lambda prefix: sorted(User.objects.filter(username__prefix=prefix).values_list('username', flat=True))
+        self.assertEqual(found('ab'), ['ab', 'abc', 'ab~'])
+        # Punctuation and case compare by code point, whatever the database's locale.
+        self.assertEqual(found('a-'), ['a-b'])
+        self.assertEqual(found('A'), ['AB'])
+        query = User.objects.filter(username__prefix='a-').query
+        sql, params = query.where.children[0].as_postgresql(query.get_compiler(connection=connection), connection)
+        self.assertEqual((sql.count('COLLATE "C"'), params), (2, ['a-', 'a.']))
+
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.add_borrowers(2)  # not in the statistics yet
+        self.assertEqual(estimate_row_count(Loan), 3)
+        with mock.patch('core.pagination.ESTIMATE_ABOVE', 1):
+            self.assertEqual(EstimatedCountPaginator(Loan.objects.order_by('-id'), 10).count, 3)
+            self.assertEqual(EstimatedCountPaginator(Loan.objects.filter(status='Active').order_by('-id'), 10).count, 5)
+        self.assertEqual(EstimatedCountPaginator(Loan.objects.order_by('-id'), 10).count, 5)
+
+    def test_indexed_dates_match_distinct_dates(self):
+        now = timezone.now()
+        for days in (0, 1, 40, 400, 401, 800):
+            self.add_borrowers(1)
+            Loan.objects.filter(pk=Loan.objects.latest('pk').pk).update(created_at=now - timedelta(days=days))
+        for kind in ('year', 'month', 'day'):
+            for queryset in (Loan.objects.all(), Loan.objects.filter(created_at__lt=now - timedelta(days=30))):
+                self.assertEqual(
+                    with_indexed_dates(queryset).datetimes('created_at', kind), list(queryset.datetimes('created_at', kind)),
+                )
+            dates = Loan.objects.all()
+            self.assertEqual(with_indexed_dates(dates).dates('due_date', kind), list(dates.dates('due_date', kind)))
+
+
+class BorrowerSearchTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_superuser('root', password='x')
+        self.client.force_login(self.staff)
+        for i, (phone, national_id) in enumerate([
+            ('0712 345 678', '12345678'), ('+254712345699', '1234-5679'), ('0722000000', 'a 99 12345'),
+        ]):
+            user = User.objects.create_user(f'mary-{i}')
+            Profile.objects.create(user=user, phone_number=phone, national_id=national_id, verified_status=True)
+        self.loan = Loan.objects.create(borrower=User.objects.get(username='mary-1'), amount=500, term_days=30,
+                                        status='Active')
+        Loan.objects.create(borrower=User.objects.get(username='mary-0'), amount=100, term_days=30, status='Paid')
+
+    def found(self, query, **kwargs):
+        return [(m.user.username, m.matched, m.exact) for m in search_borrowers(query, **kwargs)]
+
+    def test_normalization(self):
+        for value in ('0712345678', '0712 345 678', '+254 712-345-678', '00254712345678', '712345678', '254712345678'):
+            self.assertEqual(normalize_phone(value), '254712345678', value)
+        self.assertEqual(normalize_phone('+44 20 7946 0000'), '442079460000')
+        self.assertEqual(normalize_phone('071'), '25471')
+        self.assertIsNone(normalize_phone(' - '))
+        self.assertEqual(normalize_national_id(' a-99 12345 '), 'A9912345')
+        self.assertIsNone(normalize_national_id('--'))
+        profile = Profile.objects.get(user__username='mary-0')
+        self.assertEqual((profile.phone_key, profile.national_id_key), ('254712345678', '12345678'))
+        profile.phone_number = '0733 111 222'
+        profile.save(update_fields=['phone_number'])
+        self.assertEqual(Profile.objects.get(pk=profile.pk).phone_key, '254733111222')
+        self.assertEqual(profile.username_key, 'mary-0')
+        profile.user.username = 'Mary.W'
+        profile.user.save()
+        self.assertEqual(Profile.objects.get(pk=profile.pk).username_key, 'mary.w')
+        self.assertEqual(self.found('mary.'), [('Mary.W', 'username', False)])
+
+    def test_matches_any_format_exact_first(self):
+        self.assertEqual(self.found('+254 712 345 678'), [('mary-0', 'phone', True)])
+        self.assertEqual(self.found('0712-345'), [('mary-0', 'phone', False), ('mary-1', 'phone', False)])
+        self.assertEqual(self.found('1234 5679'), [('mary-1', 'national_id', True)])
+        self.assertEqual(self.found('A99'), [('mary-2', 'national_id', False)])
+        self.assertEqual(self.found('mary-2'), [('mary-2', 'username', True)])
+        self.assertEqual(self.found('mary'), [('mary-0', 'username', False), ('mary-1', 'username', False),
+                                              ('mary-2', 'username', False)])
+        self.assertEqual(self.found('mary', limit=2), [('mary-0', 'username', False), ('mary-1', 'username', False)])
+        self.assertEqual(self.found('MARY-2'), [('mary-2', 'username', True)])
+        self.assertEqual(self.found('ary'), [])  # prefixes, not substrings
+        self.assertEqual(self.found('m'), [])
+
+    def test_open_loans_in_bounded_queries(self):
+        with self.assertNumQueries(4):  # phone, national ID, username, open loans
+            matches = search_borrowers('0712')
+        self.assertEqual({m.user.username: m.open_loan for m in matches}, {'mary-0': None, 'mary-1': self.loan})
+        for i in range(20):
+            user = User.objects.create_user(f'mary-x{i}')
+            Profile.objects.create(user=user, phone_number=f'07129{i:05}')
+            Loan.objects.create(borrower=user, amount=100, term_days=30)
+        with self.assertNumQueries(4):
+            self.assertEqual(len(search_borrowers('0712', limit=50)), 22)
+
+    def test_view_and_json(self):
+        url = reverse('borrower_search')
+        response = self.client.get(url, {'q': '0712 345 699'})
+        self.assertContains(response, 'mary-1')
+        self.assertContains(response, 'Exact phone')
+        self.assertNotContains(response, 'mary-0')
+        data = self.client.get(url, {'q': 'mary-1', 'format': 'json'}).json()
+        self.assertEqual(data['query'], 'mary-1')
+        [result] = data['results']
+        self.assertEqual(result['username'], 'mary-1')
+        self.assertEqual(result['open_loan']['id'], self.loan.pk)
+        self.assertEqual(result['open_loan']['balance'], '500.00')
+        self.assertEqual(self.client.get(url, {'q': 'mary', 'limit': 0, 'format': 'json'}).status_code, 400)
+        self.assertContains(self.client.get(reverse('admin_users')), url)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {'q': 'mary'}).status_code, 302)
+
+
+class UserSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('root', password='x')
+        users = User.objects.bulk_create(User(username=f'u{i:05}') for i in range(10_000))
+        Profile.objects.bulk_create(Profile(user=user, verified_status=i % 3 == 0) for i, user in enumerate(users))
+        now = timezone.now()
+        loans = []
+        for i, user in enumerate(users[:300]):
+            loans.append(Loan(borrower=user, amount=1000, amount_repaid=i % 7 * 10, term_days=30, status='Active',
+                              last_repayment_at=now - timedelta(days=i % 5)))
+            if i % 2:
+                loans.append(Loan(borrower=user, amount=200, amount_repaid=200, term_days=30, status='Paid',
+                                  last_repayment_at=now - timedelta(days=10)))
+        Loan.objects.bulk_create(loans)
+        cls.users = users
+        cls.closed_at = now - timedelta(days=400)
+        ArchivedLoan.objects.create(
+            id=10 ** 9, borrower=users[1], amount=50, amount_repaid=50, term_days=30, status='Paid',
+            created_at=cls.closed_at, last_repayment_at=cls.closed_at, archived_at=now,
+        )
+        ArchivedLoan.objects.create(
+            id=10 ** 9 + 1, borrower=users[9999], amount=70, amount_repaid=70, term_days=30, status='Paid',
+            created_at=cls.closed_at, last_repayment_at=cls.closed_at, archived_at=now,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_summary_matches_loans(self):
+        profiles = Profile.objects.with_loan_summary().in_bulk([self.users[i].profile.pk for i in (0, 1, 2, 9999)])
+        for profile in profiles.values():
+            loans = [*Loan.objects.filter(borrower=profile.user_id), *ArchivedLoan.objects.filter(borrower=profile.user_id)]
+            self.assertEqual(profile.loan_count, len(loans))
+            self.assertEqual(profile.outstanding, sum((loan.balance for loan in loans if loan.status == 'Active'), 0))
+            self.assertEqual(profile.total_repaid, sum((loan.amount_repaid for loan in loans), 0))
+            self.assertEqual(
+                profile.last_repayment_at, max((loan.last_repayment_at for loan in loans), default=None),
+            )
+        self.assertEqual(profiles[self.users[9999].profile.pk].last_repayment_at, self.closed_at)
+
+    def test_query_count_at_10k_users(self):
+        url = reverse('admin_users')
+        for params in ({}, {'sort': 'balance'}, {'verified': '0', 'min_balance': '950'}, {'sort': 'balance', 'verified': '1'}):
+            response = self.client.get(url, params)  # warm the session and user caches
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url + '?' + response.context['next_query'])
+            self.assertEqual(response.status_code, 200)
+            # The page of profiles with every summary column is a single statement.
+            self.assertEqual(len(captured), 1, params)
+            self.assertEqual(len(response.context['profiles']), 50)
+
+    def test_sort_and_filter_by_balance(self):
+        params, seen = {'sort': 'balance', 'min_balance': '980', 'verified': '1', 'page_size': 7}, []
+        url = reverse('admin_users')
+        response = self.client.get(url, params)
+        self.assertContains(response, '$1000.00')
+        while True:
+            profiles = response.context['profiles']
+            seen += [(profile.outstanding, profile.user_id) for profile in profiles]
+            if not profiles.has_next:
+                break
+            response = self.client.get(url + '?' + response.context['next_query'])
+        expected = sorted(
+            (Decimal(1000 - i % 7 * 10), user.pk) for i, user in enumerate(self.users[:300])
+            if i % 3 == 0 and 1000 - i % 7 * 10 >= 980
+        )
+        self.assertEqual(seen, sorted(expected, key=lambda row: (-row[0], row[1])))
+
+
+@override_settings(EVENT_FEED_SETTLE_SECONDS=0, EVENT_FEED_TOKENS=['feed-secret'])
+class LoanEventTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def borrower(self, username, verified=True):
+        user = User.objects.create_user(username)
+        Profile.objects.create(user=user, verified_status=verified, monthly_income=5000)
+        client = Client()
+        client.force_login(user)
+        return user, client
+
+    def kinds(self, after=0):
+        return [(event.kind, event.loan_id, event.actor_id) for event in LoanEvent.objects.filter(pk__gt=after).order_by('pk')]
+
+    def test_views_log_each_change(self):
+        alice, client = self.borrower('alice')
+        self.assertWithinQueryBudget(client.post, reverse('apply_loan'), {'amount': 500, 'term_days': 30})
+        loan = Loan.objects.get(borrower=alice)
+        self.assertEqual(self.kinds(), [('applied', loan.pk, None), ('approved', loan.pk, None)])
+
+        last = LoanEvent.objects.latest('pk').pk
+        self.assertWithinQueryBudget(client.post, reverse('repay_loan'), {'amount': 200})
+        self.assertWithinQueryBudget(client.post, reverse('repay_loan'), {'amount': 300})
+        self.assertEqual(self.kinds(last), [('repaid', loan.pk, None), ('repaid', loan.pk, None), ('paid_off', loan.pk, None)])
+        repaid = LoanEvent.objects.filter(kind='repaid').latest('pk')
+        self.assertEqual((repaid.amount, repaid.data['balance'], repaid.data['status']), (Decimal('300'), '0.00', 'Active'))
+
+        bob, client = self.borrower('bob')
+        carol, other = self.borrower('carol')
+        client.post(reverse('apply_loan'), {'amount': 5000, 'term_days': 30})
+        other.post(reverse('apply_loan'), {'amount': 5000, 'term_days': 30})
+        bobs, carols = Loan.objects.get(borrower=bob), Loan.objects.get(borrower=carol)
+        last = LoanEvent.objects.latest('pk').pk
+        self.assertWithinQueryBudget(self.staff_client.get, reverse('approve_loan', args=[bobs.pk]))
+        self.assertWithinQueryBudget(self.staff_client.get, reverse('reject_loan', args=[carols.pk]))
+        self.staff_client.get(reverse('approve_loan', args=[bobs.pk]))  # no longer Pending: no event
+        self.assertWithinQueryBudget(self.staff_client.post, reverse('admin_create_loan'), {
+            'borrower': carol.pk, 'amount': 700, 'term_days': 30, 'status': 'Active',
+        })
+        created = Loan.objects.get(borrower=carol, status='Active')
+        self.assertEqual(self.kinds(last), [
+            ('approved', bobs.pk, self.staff.pk),
+            ('rejected', carols.pk, self.staff.pk),
+            ('created', created.pk, self.staff.pk),
+            ('approved', created.pk, self.staff.pk),
+        ])
+
+        dave, client = self.borrower('dave', verified=False)
+        erin, erins_client = self.borrower('erin', verified=False)
+        last = LoanEvent.objects.latest('pk').pk
+        self.assertWithinQueryBudget(self.staff_client.get, reverse('verify_user_admin', args=[dave.pk]))
+        self.staff_client.get(reverse('verify_user_admin', args=[dave.pk]))  # already verified
+        self.assertWithinQueryBudget(erins_client.post, reverse('verify_profile'), {
+            'national_id': '1', 'phone_number': '0700000000', 'monthly_income': 1,
+        })
+        self.assertEqual(
+            [(e.kind, e.borrower_id, e.actor_id) for e in LoanEvent.objects.filter(pk__gt=last)],
+            [('verified', dave.pk, self.staff.pk), ('verified', erin.pk, None)],
+        )
+        self.assertWithinQueryBudget(self.staff_client.post, reverse('admin_create_user'), {
+            'username': 'fay', 'email': 'fay@example.com', 'password1': 'Xk3!long-pass', 'password2': 'Xk3!long-pass',
+        })
+        self.assertEqual(LoanEvent.objects.latest('pk').borrower_id, User.objects.get(username='fay').pk)
+
+    def test_bulk_paths_log_events(self):
+        users = [self.borrower(f'b{i}')[0] for i in range(3)]
+        pending = [Loan.objects.create(borrower=user, amount=100, term_days=30) for user in users[:2]]
+        decide_pending_loans(Loan.objects.all(), 'Rejected', actor=self.staff)
+        self.assertEqual(self.kinds(), [('rejected', loan.pk, self.staff.pk) for loan in pending])
+
+        loan = Loan.objects.create(borrower=users[2], amount=100, term_days=30, status='Active')
+        Profile.objects.filter(user=users[2]).update(phone_key='254700000042')
+        last = LoanEvent.objects.latest('pk').pk
+        import_repayments(['reference,phone,amount\n', 'S1,0700000042,100\n'], actor=self.staff)
+        self.assertEqual(self.kinds(last), [('repaid', loan.pk, self.staff.pk), ('paid_off', loan.pk, self.staff.pk)])
+        self.assertEqual(LoanEvent.objects.get(kind='repaid').data['reference'], 'S1')
+
+    def test_append_only(self):
+        loan = Loan.objects.create(borrower=self.staff, amount=100, term_days=30)
+        with transaction.atomic():
+            [event] = record_events([loan_event(LoanEvent.APPROVED, loan)])
+        event.amount = 1
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+        # A failed application leaves no event behind.
+        _, client = self.borrower('frank')
+        client.post(reverse('apply_loan'), {'amount': 5000, 'term_days': 30})
+        count = LoanEvent.objects.count()
+        with mock.patch('core.views.get_borrower_state') as state:
+            state.return_value.verified, state.return_value.open_loan = True, None
+            client.post(reverse('apply_loan'), {'amount': 5000, 'term_days': 30})
+        self.assertEqual(LoanEvent.objects.count(), count)
+
+    def test_feed_pages_by_id(self):
+        loan = Loan.objects.create(borrower=self.staff, amount=Decimal('100.00'), term_days=30)
+        with transaction.atomic():
+            ids = [event.pk for event in record_events(
+                loan_event(LoanEvent.REPAID if i % 2 else LoanEvent.APPROVED, loan) for i in range(7)
+            )]
+        url, seen, after = reverse('loan_events'), [], 0
+        while True:
+            response = self.assertWithinQueryBudget(self.staff_client.get, url, {'after': after, 'limit': 3})
+            data = response.json()
+            seen += [event['id'] for event in data['events']]
+            after = data['next_after']
+            if not data['has_more']:
+                break
+        self.assertEqual(seen, ids)
+        self.assertEqual(self.staff_client.get(url, {'after': after}).json(), {'events': [], 'next_after': after, 'has_more': False})
+        repaid = self.staff_client.get(url, {'kind': 'repaid'}).json()['events']
+        self.assertEqual([event['id'] for event in repaid], ids[1::2])
+        self.assertEqual(repaid[0]['data'], {'status': 'Pending', 'balance': '100.00'})
+        self.assertEqual(self.staff_client.get(url, {'limit': 0}).status_code, 400)
+        with override_settings(EVENT_FEED_SETTLE_SECONDS=60):
+            self.assertEqual(self.staff_client.get(url).json()['events'], [])
+            # A settled event behind one that has not settled waits for it: the cursor must not skip it.
+            LoanEvent.objects.filter(pk=ids[0]).update(created_at=timezone.now() - timedelta(minutes=5))
+            LoanEvent.objects.filter(pk__in=ids[2:]).update(created_at=timezone.now() - timedelta(minutes=5))
+            data = self.staff_client.get(url).json()
+            self.assertEqual(([event['id'] for event in data['events']], data['next_after']), ([ids[0]], ids[0]))
+            self.assertEqual(events_after(ids[0], kinds=['repaid']), [])
+
+        self.assertIn('INTEGER PRIMARY KEY', LoanEvent.objects.filter(pk__gt=ids[2]).order_by('pk')[:3].explain())
+
+    def test_feed_auth(self):
+        url = reverse('loan_events')
+        self.assertEqual(Client().get(url).status_code, 401)
+        self.assertEqual(Client().get(url, headers={'authorization': 'Bearer wrong'}).status_code, 401)
+        self.assertEqual(Client().get(url, headers={'authorization': 'Bearer feed-secret'}).status_code, 200)
+        _, borrower = self.borrower('gina')
+        self.assertEqual(borrower.get(url).status_code, 401)
+
+    def test_tail_events_command(self):
+        loan = Loan.objects.create(borrower=self.staff, amount=100, term_days=30)
+        with transaction.atomic():
+            first, second = record_events([loan_event(LoanEvent.APPROVED, loan), loan_event(LoanEvent.REPAID, loan, amount=5)])
+        out = StringIO()
+        call_command('tail_events', '--after', str(first.pk), '--limit', '1', stdout=out)
+        [line] = out.getvalue().splitlines()
+        self.assertEqual(json.loads(line)['id'], second.pk)
+        self.assertEqual(json.loads(line)['amount'], '5.00')
+
+
+class BulkDecisionTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        borrowers = [User.objects.create_user(f'b{i}') for i in range(4)]
+        self.loans = [
+            Loan.objects.create(borrower=user, amount=amount, term_days=30, status=status)
+            for user, amount, status in zip(
+                borrowers, [1500, 2500, 5000, 1200], ['Pending', 'Pending', 'Pending', 'Active']
+            )
+        ]
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.staff)
+
+    def post(self, data):
+        self.client.get(reverse('admin_dashboard'))
+        data['csrfmiddlewaretoken'] = self.client.cookies['csrftoken'].value
+        return self.client.post(reverse('bulk_decide_loans'), data, follow=True)
+
+    def test_requires_post_with_csrf(self):
+        self.assertEqual(self.client.get(reverse('bulk_decide_loans')).status_code, 405)
+        response = self.client.post(reverse('bulk_decide_loans'), {'action': 'approve', 'loan_ids': [self.loans[0].pk]})
+        self.assertEqual(response.status_code, 403)
+
+    def test_selected_loans_skip_non_pending(self):
+        ids = [self.loans[0].pk, self.loans[1].pk, self.loans[3].pk]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'action': 'approve', 'scope': 'selected', 'loan_ids': ids})
+        self.assertContains(response, '2 loan(s) approved, 1 skipped')
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "core_loan"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            list(Loan.objects.order_by('pk').values_list('status', flat=True)),
+            ['Active', 'Active', 'Pending', 'Active'],
+        )
+        stats = get_portfolio_stats()
+        self.assertEqual(stats.pending_loans, 1)
+        self.assertEqual(stats.total_disbursed, Decimal('5200.00'))
+
+    def test_filter_scope(self):
+        response = self.post({'action': 'reject', 'scope': 'filter', 'max_amount': '3000'})
+        self.assertContains(response, '2 pending loan(s) rejected.')
+        self.assertEqual(Loan.objects.filter(status='Rejected').count(), 2)
+        self.assertEqual(get_portfolio_stats().rejected_loans, 2)
+
+    def test_invalid_request_changes_nothing(self):
+        response = self.post({'action': 'approve', 'scope': 'selected'})
+        self.assertContains(response, 'Select at least one loan.')
+        self.assertEqual(Loan.objects.filter(status='Pending').count(), 3)
+
+
+class LedgerExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        borrower = User.objects.create_user('borrower')
+        self.loan = Loan.objects.create(borrower=borrower, amount=500, term_days=30, status='Active')
+        Repayment.objects.create(loan=self.loan, amount=200)
+        Loan.objects.create(borrower=self.staff, amount=800, term_days=30, status='Rejected')
+        self.client.force_login(self.staff)
+
+    def test_csv_export_streams_with_filters(self):
+        response = self.client.get(reverse('export_ledger', args=['loans']), {'status': 'Active'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'borrower', 'amount'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1], 'borrower')
+        self.assertEqual(rows[1][4], '300.00')
+
+    def test_gzip_jsonl_repayments(self):
+        response = self.client.get(
+            reverse('export_ledger', args=['repayments']),
+            {'format': 'jsonl', 'gzip': '1', 'start': timezone.localdate().isoformat()},
+        )
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('.jsonl.gz"', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['amount'] for line in lines], ['200.00'])
+
+    def test_date_range_excludes_rows(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        chunks = list(stream_ledger('loans', start=tomorrow))
+        self.assertEqual(len(b''.join(chunks).splitlines()), 1)  # header only
+
+    def test_rejects_bad_filters_and_non_staff(self):
+        response = self.client.get(reverse('export_ledger', args=['loans']), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_ledger', args=['profiles'])).status_code, 404)
+        self.client.force_login(User.objects.get(username='borrower'))
+        self.assertEqual(self.client.get(reverse('export_ledger', args=['loans'])).status_code, 302)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_ledger', 'repayments', '--format', 'jsonl', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['loan_id'], self.loan.pk)
+
+
+class RepaymentImportTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.loans = {}
+        for i, (phone, amount) in enumerate([('0700000001', 500), ('0700000002', 300), ('0700000003', 100)]):
+            user = User.objects.create_user(f'b{i}')
+            Profile.objects.create(user=user, phone_number=phone)
+            self.loans[phone] = Loan.objects.create(borrower=user, amount=amount, term_days=30, status='Active')
+        Profile.objects.create(user=User.objects.create_user('no-loan'), phone_number='0700000009')
+
+    def settlement(self, *rows):
+        return ['reference,phone,amount\n'] + [','.join(map(str, row)) + '\n' for row in rows]
+
+    def test_import_matches_closes_and_reports(self):
+        lines = self.settlement(
+            ('T1', '0700000001', '200'),
+            ('T2', '0700000001', '50.50'),
+            ('T3', '0700000002', '300'),
+            ('T4', '0799999999', '10'),
+            ('T5', '0700000009', '10'),
+            ('T6', '0700000003', 'abc'),
+            ('T1', '0700000002', '1'),
+        )
+        with self.assertNumQueries(12):  # one INSERT logs the batch's events
+            report = import_repayments(lines)
+        self.assertEqual(report.imported, 3)
+        self.assertEqual(report.imported_amount, Decimal('550.50'))
+        self.assertEqual(report.loans_closed, 1)
+        self.assertEqual([reason for _, _, reason in report.problems], [
+            'invalid amount',
+            'no borrower with this phone number',
+            'borrower has no active loan',
+            'reference repeated in file',
+        ])
+
+        first, second = (Loan.objects.get(pk=self.loans[phone].pk) for phone in ('0700000001', '0700000002'))
+        self.assertEqual(first.balance, Decimal('249.50'))
+        self.assertEqual(first.status, 'Active')
+        self.assertEqual(second.status, 'Paid')
+        self.assertIsNotNone(second.last_repayment_at)
+
+        stats = get_portfolio_stats()
+        for field, expected in compute_portfolio_stats().items():
+            self.assertEqual(getattr(stats, field), expected, field)
+
+    def test_phone_formats_match(self):
+        report = import_repayments(self.settlement(('F1', '+254 700 000 001', '20'), ('F2', '700000002', '30')))
+        self.assertEqual((report.imported, report.rejected), (2, 0))
+
+    def test_reimport_is_idempotent(self):
+        lines = self.settlement(('T1', '0700000001', '200'), ('T2', '0700000003', '20'))
+        import_repayments(lines)
+        report = import_repayments(lines, batch_size=1)
+        self.assertEqual(report.imported, 0)
+        self.assertEqual(report.duplicates, 2)
+        self.assertEqual(Repayment.objects.count(), 2)
+        self.assertEqual(Loan.objects.get(pk=self.loans['0700000001'].pk).amount_repaid, Decimal('200.00'))
+
+    def test_rows_after_payoff_are_rejected(self):
+        report = import_repayments(self.settlement(
+            ('P1', '0700000003', '60'), ('P2', '0700000003', '40'), ('P3', '0700000003', '25'),
+        ))
+        self.assertEqual((report.imported, report.loans_closed), (2, 1))
+        self.assertEqual(report.problems, [(4, 'P3', 'loan already paid off')])
+        loan = Loan.objects.get(pk=self.loans['0700000003'].pk)
+        self.assertEqual((loan.status, loan.amount_repaid), ('Paid', Decimal('100.00')))
+        self.assertEqual(
+            [event.data['balance'] for event in LoanEvent.objects.filter(kind=LoanEvent.REPAID).order_by('pk')],
+            ['40.00', '0.00'],
+        )
+
+    def test_batch_is_retried_after_a_concurrent_import(self):
+        real_import_batch = imports._import_batch
+        loan = self.loans['0700000001']
+
+        def import_batch(*args, **kwargs):
+            if not import_batch.raced:
+                # Another import commits T1 between this batch's duplicate check and its INSERT.
+                import_batch.raced = True
+                Repayment.objects.create(loan=loan, amount=5, reference='T1')
+                raise IntegrityError('UNIQUE constraint failed: core_repayment.reference')
+            return real_import_batch(*args, **kwargs)
+        import_batch.raced = False
+
+        with mock.patch.object(imports, '_import_batch', import_batch):
+            report = import_repayments(self.settlement(('T1', '0700000001', '5'), ('T2', '0700000001', '10')))
+        self.assertEqual((report.imported, report.duplicates, report.rejected), (1, 1, 0))
+        self.assertEqual(Loan.objects.get(pk=loan.pk).amount_repaid, Decimal('15.00'))
+
+    def test_missing_columns(self):
+        report = import_repayments(['ref,msisdn,amount\n', 'T1,0700000001,5\n'])
+        self.assertEqual(report.problems, [(1, '', 'missing column(s): reference, phone')])
+
+    def test_upload_view(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        upload = SimpleUploadedFile('settlement.csv', ''.join(self.settlement(('T9', '0700000003', '100'))).encode())
+        response = self.assertWithinQueryBudget(self.client.post, reverse('import_repayments'), {'file': upload})
+        self.assertContains(response, '1 repayment(s) imported')
+        self.assertEqual(Loan.objects.get(pk=self.loans['0700000003'].pk).status, 'Paid')
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as settlement:
+            settlement.writelines(self.settlement(('T1', '0700000002', '100'), ('T2', '0711111111', '5')))
+        self.addCleanup(os.remove, settlement.name)
+        out = StringIO()
+        call_command('import_repayments', settlement.name, stdout=out)
+        self.assertIn('line 3 (T2): no borrower with this phone number', out.getvalue())
+        self.assertIn('1 repayment(s) imported', out.getvalue())
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_every_core_url_has_a_scenario(self):
+        url_names = {pattern.name for pattern in core_urls.urlpatterns}
+        self.assertEqual(url_names, {scenario.name for scenario in SCENARIOS})
+
+    def test_run_reports_percentiles_and_rolls_back(self):
+        call_command('seed_loanbook', '--users', '30', '--seed', '7', stdout=StringIO())
+        loans_before = list(Loan.objects.order_by('pk').values_list('pk', 'status'))
+
+        results = run_benchmarks(iterations=2, warmup=0, host='testserver')
+        self.assertEqual(set(results), {scenario.name for scenario in SCENARIOS})
+        for name, stats in results.items():
+            self.assertTrue(all(status < 400 for status in stats['status']), name)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(list(Loan.objects.order_by('pk').values_list('pk', 'status')), loans_before)
+        self.assertFalse(User.objects.filter(username__startswith='bench-').exists())
+
+    def test_seed_is_reproducible(self):
+        call_command('seed_loanbook', '--users', '20', '--seed', '3', '--prefix', 'a', stdout=StringIO())
+        call_command('seed_loanbook', '--users', '20', '--seed', '3', '--prefix', 'b', stdout=StringIO())
+        shape = lambda prefix: list(
+            Loan.objects.filter(borrower__username__startswith=f'{prefix}-')
+            .order_by('pk').values_list('amount', 'status', 'amount_repaid')
+        )
+        self.assertEqual(shape('a'), shape('b'))
+        out = StringIO()
+        call_command('reconcile_loan_balances', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+class SQLiteProfileTests(TestCase):
+    def test_write_transactions_begin_immediate(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_contention_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_sqlite_writes', '--profiles', 'tuned', '--workers', '3', '--transactions', '10', stdout=out)
+        report = json.loads(out.getvalue())['tuned']
+        self.assertEqual(report['committed'], 30)
+        self.assertEqual(report['locked_errors'], 0)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_core_views_stay_within_budget(self):
+        call_command('seed_loanbook', '--users', '30', '--seed', '5', stdout=StringIO())
+        fixtures = _create_fixtures()
+        for scenario in SCENARIOS:
+            with self.subTest(view=scenario.name), transaction.atomic():
+                client = Client()
+                if scenario.role:
+                    client.force_login(fixtures[scenario.role])
+                url = reverse(scenario.name, args=scenario.args(fixtures))
+                self.assertWithinQueryBudget(getattr(client, scenario.method), url, scenario.data(fixtures))
+                transaction.set_rollback(True)
+
+    @override_settings(REQUEST_INSTRUMENTATION=False)
+    def test_helper_fails_over_budget(self):
+        user = User.objects.create_user('borrower')
+        self.client.force_login(user)
+        with mock.patch.object(views.dashboard, 'query_budget', 1):
+            with self.assertRaises(AssertionError):
+                self.assertWithinQueryBudget(self.client.get, reverse('dashboard'))
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_LATENCY_BUDGET_MS=None)
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('admin_loans'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_over_budget_is_logged_with_duplicates(self):
+        borrowers = [User.objects.create_user(f'b{i}') for i in range(3)]
+        for user in borrowers:
+            Loan.objects.create(borrower=user, amount=100, term_days=30, status='Paid')
+        with mock.patch.object(views.admin_loans, 'query_budget', 1), \
+                self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('admin_loans'))
+        record = logs.records[0]
+        self.assertEqual(record.view, 'admin_loans')
+        self.assertGreater(record.queries, 1)
+        self.assertEqual(record.query_budget, 1)
+
+    def test_renders_are_only_wrapped_during_requests(self):
+        original = instrumentation._original_render
+        self.assertIs(DjangoTemplate.render, original)
+        with instrumentation.timing_renders():
+            with instrumentation.timing_renders():  # overlapping requests
+                self.assertIs(DjangoTemplate.render, instrumentation._instrumented_render)
+            self.assertIs(DjangoTemplate.render, instrumentation._instrumented_render)
+        self.assertIs(DjangoTemplate.render, original)
+        response = self.client.get(reverse('admin_loans'))
+        self.assertRegex(response['Server-Timing'], r'render;dur=(?!0\.0,)')
+        self.assertIs(DjangoTemplate.render, original)
+
+    def test_metrics_count_repeated_queries(self):
+        metrics = RequestMetrics()
+        execute = lambda sql, params, many, context: None
+        for pk in (1, 1, 2):
+            metrics(execute, 'SELECT 1 WHERE id = %s', (pk,), False, {})
+        self.assertEqual(metrics.query_count, 3)
+        self.assertEqual(metrics.duplicate_queries, 1)
+        self.assertEqual(metrics.similar_queries, 2)
+
+
+class AsyncReadUrls:
+    urlpatterns = [
+        path('', async_views.dashboard, name='dashboard'),
+        path('staff/dashboard/', async_views.admin_dashboard, name='admin_dashboard'),
+        path('staff/users/', async_views.admin_users, name='admin_users'),
+        path('staff/loans/', async_views.admin_loans, name='admin_loans'),
+    ] + root_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncReadUrls)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.borrower = User.objects.create_user('borrower')
+        Profile.objects.create(user=self.borrower, verified_status=True)
+        self.loan = Loan.objects.create(borrower=self.borrower, amount=2500, term_days=30)
+        for i in range(3):
+            Loan.objects.create(borrower=User.objects.create_user(f'b{i}'), amount=100, term_days=30, status='Paid')
+
+    async def test_dashboard(self):
+        await self.async_client.aforce_login(self.borrower)
+        response = await self.async_client.get('/')
+        self.assertEqual(response.resolver_match.func, async_views.dashboard)
+        self.assertEqual(response.context['pending_loan'], self.loan)
+        self.assertContains(response, 'currently under review')
+
+    async def test_admin_dashboard(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get('/staff/dashboard/')
+        self.assertEqual(response.context['pending_loans_count'], 1)
+        self.assertEqual([loan.pk for loan in response.context['pending_loans']], [self.loan.pk])
+        self.assertContains(response, 'borrower')
+
+    async def test_admin_loans_pagination_and_filter(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get('/staff/loans/', {'status': 'Paid', 'page_size': 2})
+        self.assertEqual(len(response.context['loans']), 2)
+        response = await self.async_client.get('/staff/loans/?' + response.context['next_query'])
+        self.assertEqual(len(response.context['loans']), 1)
+
+    async def test_admin_users_requires_staff(self):
+        await self.async_client.aforce_login(self.borrower)
+        response = await self.async_client.get('/staff/users/')
+        self.assertEqual(response.status_code, 302)
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get('/staff/users/')
+        self.assertEqual(len(response.context['profiles']), 1)
+
+    async def test_conditional_dashboard(self):
+        await self.async_client.aforce_login(self.borrower)
+        etag = (await self.async_client.get('/'))['ETag']
+        response = await self.async_client.get('/', headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(REQUEST_INSTRUMENTATION=True)
+    async def test_instrumented_async_request(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get('/staff/loans/')
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
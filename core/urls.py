@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Read-heavy views have async twins for ASGI deployments
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.dashboard, name='dashboard'),
+    path('', read_views.dashboard, name='dashboard'),
     path('register/', views.register, name='register'),
     path('register-admin/', views.register_admin, name='register_admin'),
     path('verify/', views.verify_profile, name='verify_profile'),
@@ -10,12 +14,20 @@ urlpatterns = [
     path('repay/', views.repay_loan, name='repay_loan'),
     
     # Admin
-    path('staff/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('staff/dashboard/', read_views.admin_dashboard, name='admin_dashboard'),
     path('staff/loan/<int:pk>/approve/', views.approve_loan, name='approve_loan'),
     path('staff/loan/<int:pk>/reject/', views.reject_loan, name='reject_loan'),
-    path('staff/users/', views.admin_users, name='admin_users'),
+    path('staff/loans/bulk-decision/', views.bulk_decide_loans, name='bulk_decide_loans'),
+    path('staff/users/', read_views.admin_users, name='admin_users'),
+    path('staff/users/search/', views.borrower_search, name='borrower_search'),
     path('staff/users/<int:pk>/verify/', views.verify_user_admin, name='verify_user_admin'),
-    path('staff/loans/', views.admin_loans, name='admin_loans'),
+    path('staff/loans/', read_views.admin_loans, name='admin_loans'),
     path('staff/loans/create/', views.admin_create_loan, name='admin_create_loan'),
     path('staff/users/create/', views.admin_create_user, name='admin_create_user'),
+    path('staff/export/<str:kind>/', views.export_ledger, name='export_ledger'),
+    path('staff/repayments/import/', views.import_repayments_view, name='import_repayments'),
+    path('staff/trends/', views.admin_trends, name='admin_trends'),
+    path('staff/trends/data/', views.admin_trends_data, name='admin_trends_data'),
+    path('staff/risk/', views.admin_risk, name='admin_risk'),
+    path('staff/events/', views.loan_events, name='loan_events'),
 ]
@@ -0,0 +1,136 @@
+"""
+Version tokens for conditional GETs.
+
+Every write to a borrower's loans, repayments or profile replaces the
+borrower's ``VersionToken`` (``borrower:<id>``) in its transaction, and the
+portfolio-wide one once that transaction commits: a single row every writer
+would otherwise update is bumped once per transaction rather than once per
+row, and never before the data it describes is visible. ``@conditional_page`` turns the relevant token into an
+ETag, so an unchanged page costs one primary-key lookup and a 304 instead of
+its queries and a render. Model saves are picked up by ``core.signals``; code
+that writes with ``QuerySet.update()`` or ``bulk_create()`` must call
+``bump_versions`` itself, like it calls ``core.stats``.
+"""
+import hashlib
+from functools import wraps
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import VersionToken
+
+PORTFOLIO = 'portfolio'
+
+
+def borrower_key(user_id):
+    return f'borrower:{user_id}'
+
+
+def portfolio_key(request):
+    return PORTFOLIO
+
+
+def own_borrower_key(request):
+    return borrower_key(request.user.pk)
+
+
+def _replace_tokens(keys):
+    VersionToken.objects.bulk_create(
+        [VersionToken(key=key, token=uuid4().hex) for key in keys],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['token'],
+    )
+
+
+def _bump_portfolio():
+    _replace_tokens([PORTFOLIO])
+
+
+def bump_versions(borrower_ids=()):
+    """
+    Replace the tokens of ``borrower_ids`` now, in one query, and the portfolio
+    token when the current transaction commits (at most once per transaction).
+    """
+    # Sorted so concurrent transactions lock the rows in the same order.
+    keys = sorted({borrower_key(user_id) for user_id in borrower_ids})
+    if keys:
+        _replace_tokens(keys)
+    connection = transaction.get_connection()
+    # One callback per transaction (per savepoint, if nested): a rolled-back savepoint
+    # drops its own callback but not one registered outside it.
+    scope = set(connection.savepoint_ids)
+    if not any(callback is _bump_portfolio and ids == scope for ids, callback, _ in connection.run_on_commit):
+        transaction.on_commit(_bump_portfolio)
+
+
+def get_version(key):
+    # Keys nobody has written to yet share a constant token.
+    return VersionToken.objects.filter(pk=key).values_list('token', flat=True).first() or '0'
+
+
+def data_version(request, key):
+    """``get_version`` memoized on the request; also keys the pages' cached fragments."""
+    versions = request.__dict__.setdefault('_data_versions', {})
+    if key not in versions:
+        versions[key] = get_version(key)
+    return versions[key]
+
+
+async def adata_version(request, key):
+    return await sync_to_async(data_version)(request, key)
+
+
+def page_etag(request, key_func):
+    """
+    ETag for a page built from the data behind ``key_func(request)``, or None
+    when the page must be rendered anyway (unsafe method, or flash messages to show).
+    """
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+        return None
+    key = key_func(request)
+    # The page embeds the user and a CSRF token, and its markup may change with a
+    # deploy. get_token() makes sure the CSRF secret exists before it is hashed.
+    get_token(request)
+    parts = [
+        key, data_version(request, key), request.get_full_path(), request.user.pk,
+        request.META.get('CSRF_COOKIE'), settings.ETAG_SALT,
+    ]
+    return '"%s"' % hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _finish(request, response, etag):
+    if etag and response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        # Let the browser keep the page but check back every time.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(key_func):
+    """
+    Answer GETs whose If-None-Match still matches the version token of
+    ``key_func(request)`` with 304, without running the view.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                etag = await sync_to_async(page_etag)(request, key_func)
+                response = etag and get_conditional_response(request, etag=etag)
+                if not response:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, etag)
+        else:
+            def wrapper(request, *args, **kwargs):
+                etag = page_etag(request, key_func)
+                response = etag and get_conditional_response(request, etag=etag)
+                if not response:
+                    response = view(request, *args, **kwargs)
+                return _finish(request, response, etag)
+        return wraps(view)(wrapper)
+    return decorator
@@ -1,11 +1,21 @@
+from decimal import Decimal, InvalidOperation
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
-from .forms import UserRegisterForm, ProfileForm, LoanForm, RepaymentForm, AdminLoanForm, AdminUserForm
-from .models import Loan, Profile, Repayment
+from django.db import IntegrityError, transaction
+from .forms import UserRegisterForm, ProfileForm, LoanForm, RepaymentForm, AdminLoanForm, AdminUserForm, BorrowerSearchForm, BulkLoanDecisionForm, EventFeedForm, LedgerExportForm, RepaymentImportForm, SimulationForm, TrendsForm
+from .models import ArchivedLoan, Loan, LoanEvent, Profile, Repayment
+from .borrowers import get_borrower_state
+from .events import (
+    event_json, events_after, feed_auth_required, loan_event, opened_loan_events, record_events, verified_event,
+)
+from .instrumentation import query_budget
+from .versions import PORTFOLIO, conditional_page, data_version, own_borrower_key, portfolio_key
 
+@query_budget(5)
 def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
@@ -18,6 +28,7 @@ def register(request):
         form = UserRegisterForm()
     return render(request, 'core/register.html', {'form': form})
 
+@query_budget(5)
 def register_admin(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
@@ -33,21 +44,20 @@ def register_admin(request):
         form = UserRegisterForm()
     return render(request, 'core/register_admin.html', {'form': form})
 
+@query_budget(3)
 @login_required
+@conditional_page(own_borrower_key)
 def dashboard(request):
-    # Ensure profile exists (handle cases where it might not)
-    profile, created = Profile.objects.get_or_create(user=request.user)
-    
-    active_loan = Loan.objects.filter(borrower=request.user, status='Active').first()
-    pending_loan = Loan.objects.filter(borrower=request.user, status='Pending').first()
+    state = get_borrower_state(request)
     
     context = {
-        'profile': profile,
-        'active_loan': active_loan,
-        'pending_loan': pending_loan,
+        'profile': state.profile,
+        'active_loan': state.active_loan,
+        'pending_loan': state.pending_loan,
     }
     return render(request, 'core/dashboard.html', context)
 
+@query_budget(8)
 @login_required
 def verify_profile(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
@@ -56,8 +66,12 @@ def verify_profile(request):
         form = ProfileForm(request.POST, instance=profile)
         if form.is_valid():
             prof = form.save(commit=False)
+            newly_verified = not prof.verified_status
             prof.verified_status = True  # Simulate auto-verification
-            prof.save()
+            with transaction.atomic():
+                prof.save()
+                if newly_verified:
+                    record_events([verified_event(request.user)])
             messages.success(request, 'Profile verified successfully!')
             return redirect('dashboard')
     else:
@@ -65,18 +79,18 @@ def verify_profile(request):
     
     return render(request, 'core/verify.html', {'form': form})
 
+@query_budget(9)
 @login_required
 def apply_loan(request):
-    profile, created = Profile.objects.get_or_create(user=request.user)
+    state = get_borrower_state(request)
     
-    if not profile.verified_status:
+    if not state.verified:
         messages.warning(request, 'You must verify your profile first.')
         return redirect('verify_profile')
     
-    # prevent multiple active/pending loans
-    if Loan.objects.filter(borrower=request.user, status__in=['Active', 'Pending']).exists():
-         messages.info(request, 'You already have an active or pending loan.')
-         return redirect('dashboard')
+    if state.open_loan:
+        messages.info(request, 'You already have an active or pending loan.')
+        return redirect('dashboard')
 
     if request.method == 'POST':
         form = LoanForm(request.POST)
@@ -85,23 +99,32 @@ def apply_loan(request):
             loan.borrower = request.user
             
             # Simple Logic
-            if loan.amount < 1000:
-                loan.status = 'Active'
+            loan.status = 'Active' if loan.amount < 1000 else 'Pending'
+            
+            # one_open_loan_per_borrower also catches a concurrent application
+            try:
+                with transaction.atomic():
+                    loan.save()
+                    record_events(opened_loan_events(LoanEvent.APPLIED, loan))
+            except IntegrityError:
+                messages.info(request, 'You already have an active or pending loan.')
+                return redirect('dashboard')
+
+            if loan.status == 'Active':
                 messages.success(request, 'Loan auto-approved!')
             else:
-                loan.status = 'Pending'
                 messages.info(request, 'Loan request submitted for review.')
-            
-            loan.save()
             return redirect('dashboard')
     else:
         form = LoanForm()
         
     return render(request, 'core/apply.html', {'form': form})
 
+@query_budget(13)
 @login_required
+@conditional_page(own_borrower_key)
 def repay_loan(request):
-    active_loan = Loan.objects.filter(borrower=request.user, status='Active').first()
+    active_loan = get_borrower_state(request).active_loan
     
     if not active_loan:
         messages.info(request, 'No active loan to repay.')
@@ -111,13 +134,33 @@ def repay_loan(request):
         form = RepaymentForm(request.POST)
         if form.is_valid():
             repayment = form.save(commit=False)
-            repayment.loan = active_loan
-            repayment.save()
-            
-            # Check balance
-            if active_loan.balance <= 0:
-                active_loan.status = 'Paid'
-                active_loan.save()
+            with transaction.atomic():
+                # Locked and read again: a concurrent repayment may have paid it off since
+                # the borrower state was loaded, and only one of them may close it.
+                try:
+                    active_loan = Loan.objects.select_for_update().get(pk=active_loan.pk, status='Active')
+                except Loan.DoesNotExist:
+                    active_loan = None
+                else:
+                    repayment.loan = active_loan
+                    repayment.save()
+                    # core.signals bumps amount_repaid in SQL; the row is locked, so this is the result.
+                    active_loan.amount_repaid += repayment.amount
+                    active_loan.last_repayment_at = repayment.date
+
+                    events = [loan_event(
+                        LoanEvent.REPAID, active_loan, amount=repayment.amount, repayment_id=repayment.pk,
+                        reference=repayment.reference,
+                    )]
+                    # Check balance
+                    if active_loan.balance <= 0:
+                        active_loan.status = 'Paid'
+                        active_loan.save()
+                        events.append(loan_event(LoanEvent.PAID_OFF, active_loan))
+                    record_events(events)
+            if active_loan is None:
+                messages.info(request, 'This loan is no longer active.')
+            elif active_loan.status == 'Paid':
                 messages.success(request, 'Loan fully paid! Congratulations.')
             else:
                 messages.success(request, f'Repayment of {repayment.amount} accepted.')
@@ -159,91 +202,356 @@ def admin_register_view(request):
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Sum, Count
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from .pagination import get_page_size, keyset_paginate, keyset_paginate_many
+from .replicas import reporting_reads
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_GET, require_POST
+from .exports import CONTENT_TYPES, LEDGERS, export_filename, stream_ledger
+from .imports import import_repayments
+from .loans import decide_pending_loans
+from .stats import get_portfolio_stats
+from .aging import aging_summary
+from .rollups import METRICS, get_rollups
+from .search import search_borrowers
+from .simulation import INTERACTIVE_SCENARIOS, simulate_portfolio
+
+# Newest first; id breaks ties between loans created in the same instant.
+LOAN_ORDERING = ('-created_at', '-id')
+SCORE_ORDERING = ('-score', '-id')
+
+
+# Profiles in user id order, or the largest outstanding balance first (?sort=balance).
+USER_ORDERING = ('user_id',)
+BALANCE_ORDERING = ('-outstanding', 'user_id')
 
+
+def user_list_query(request):
+    """
+    Queryset and keyset ordering of admin_users: every profile with its
+    borrower's loan summary (``ProfileQuerySet.with_loan_summary``), filtered
+    by ``?verified=1|0`` and ``?min_balance=``, sorted by ``?sort=balance``.
+    """
+    profiles = Profile.objects.select_related('user').with_loan_summary()
+    verified = request.GET.get('verified')
+    if verified in ('0', '1'):
+        profiles = profiles.filter(verified_status=verified == '1')
+    try:
+        min_balance = Decimal(request.GET.get('min_balance', ''))
+    except InvalidOperation:
+        min_balance = None
+    if min_balance is not None and min_balance.is_finite():
+        profiles = profiles.filter(outstanding__gte=min_balance)
+    return profiles, BALANCE_ORDERING if request.GET.get('sort') == 'balance' else USER_ORDERING
+
+
+def include_archived(request):
+    return request.GET.get('archived') == '1'
+
+
+def loan_list_query(request):
+    """
+    Querysets and keyset ordering of admin_loans for ``?status=``,
+    ``?min_score=`` and ``?sort=score``: the live loans, plus the archived
+    ones (core.archive) with ``?archived=1``.
+    """
+    models = [Loan, ArchivedLoan] if include_archived(request) else [Loan]
+    querysets = []
+    for model in models:
+        loans = model.objects.select_related('borrower').all()
+        status = request.GET.get('status')
+        if status:
+            loans = loans.filter(status=status)
+        min_score = request.GET.get('min_score', '')
+        if min_score.isdigit():
+            loans = loans.filter(score__gte=int(min_score))
+        if request.GET.get('sort') == 'score':
+            # Unscored loans have no place in this order (nor a cursor value), so they are left out.
+            loans = loans.filter(score__isnull=False)
+        querysets.append(loans)
+    return querysets, SCORE_ORDERING if request.GET.get('sort') == 'score' else LOAN_ORDERING
+
+
+@query_budget(6)
 @staff_member_required
+@reporting_reads
+@conditional_page(portfolio_key)
 def admin_dashboard(request):
-    # Debug: Print to verify this view is being called
-    print(f"Admin dashboard accessed by: {request.user.username}")
-    
-    # Stats
-    total_users = Profile.objects.count()
-    active_loans_count = Loan.objects.filter(status='Active').count()
-    pending_loans_count = Loan.objects.filter(status='Pending').count()
-    total_repaid = Repayment.objects.aggregate(Sum('amount'))['amount__sum'] or 0
+    # Stats (maintained incrementally, see core.stats)
+    stats = get_portfolio_stats()
     
     # Lists
-    pending_loans = Loan.objects.filter(status='Pending').order_by('-created_at')
+    pending_loans = keyset_paginate(
+        Loan.objects.select_related('borrower').filter(status='Pending'),
+        LOAN_ORDERING,
+        page_size=get_page_size(request),
+    )
     recent_repayments = Repayment.objects.select_related('loan__borrower').order_by('-date')[:10]
     
     context = {
-        'total_users': total_users,
-        'active_loans_count': active_loans_count,
-        'pending_loans_count': pending_loans_count,
-        'total_repaid': total_repaid,
+        'aging_summary': aging_summary(),
+        'total_users': stats.total_users,
+        'active_loans_count': stats.active_loans,
+        'pending_loans_count': stats.pending_loans,
+        'total_repaid': stats.total_repaid,
         'pending_loans': pending_loans,
         'recent_repayments': recent_repayments,
+        'portfolio_version': data_version(request, PORTFOLIO),
     }
     return render(request, 'core/admin_dashboard.html', context)
 
+@query_budget(9)
 @staff_member_required
 def approve_loan(request, pk):
-    loan = get_object_or_404(Loan, pk=pk)
-    if loan.status == 'Pending':
-        loan.status = 'Active'
-        loan.save()
-        messages.success(request, f"Loan {loan.id} approved.")
+    with transaction.atomic():
+        loan = get_object_or_404(Loan.objects.select_for_update(), pk=pk)
+        if loan.status == 'Pending':
+            loan.status = 'Active'
+            loan.save()
+            record_events([loan_event(LoanEvent.APPROVED, loan, request.user)])
+            messages.success(request, f"Loan {loan.id} approved.")
     return redirect('admin_dashboard')
 
+@query_budget(9)
 @staff_member_required
 def reject_loan(request, pk):
-    loan = get_object_or_404(Loan, pk=pk)
-    if loan.status == 'Pending':
-        loan.status = 'Rejected'
-        loan.save()
-        messages.warning(request, f"Loan {loan.id} rejected.")
+    with transaction.atomic():
+        loan = get_object_or_404(Loan.objects.select_for_update(), pk=pk)
+        if loan.status == 'Pending':
+            loan.status = 'Rejected'
+            loan.save()
+            record_events([loan_event(LoanEvent.REJECTED, loan, request.user)])
+            messages.warning(request, f"Loan {loan.id} rejected.")
     return redirect('admin_dashboard')
 
+@query_budget(9)
+@staff_member_required
+@require_POST
+def bulk_decide_loans(request):
+    form = BulkLoanDecisionForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect(_safe_next(request, 'admin_dashboard'))
+
+    if form.cleaned_data['scope'] == 'filter':
+        loans = Loan.objects.filter(amount__lt=form.cleaned_data['max_amount'])
+        requested = None
+    else:
+        loans = Loan.objects.filter(pk__in=form.cleaned_data['loan_ids'])
+        requested = len(set(form.cleaned_data['loan_ids']))
+
+    changed = decide_pending_loans(loans, form.new_status, actor=request.user)
+    verb = 'approved' if form.cleaned_data['action'] == 'approve' else 'rejected'
+    if requested is None:
+        messages.success(request, f"{changed} pending loan(s) {verb}.")
+    else:
+        messages.success(request, f"{changed} loan(s) {verb}, {requested - changed} skipped (no longer pending).")
+    return redirect(_safe_next(request, 'admin_dashboard'))
+
+def _safe_next(request, default):
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return next_url
+    return reverse(default)
+
+@query_budget(4)
 @staff_member_required
+@reporting_reads
 def admin_users(request):
-    profiles = Profile.objects.select_related('user').all()
-    return render(request, 'core/admin_users.html', {'profiles': profiles})
+    queryset, ordering = user_list_query(request)
+    profiles = keyset_paginate(
+        queryset,
+        ordering,
+        cursor=request.GET.get('after'),
+        page_size=get_page_size(request),
+    )
+    return render(request, 'core/admin_users.html', {
+        'profiles': profiles,
+        'current_verified': request.GET.get('verified'),
+        'current_sort': request.GET.get('sort'),
+        'min_balance': request.GET.get('min_balance', ''),
+        'next_query': profiles.next_query(request.GET),
+    })
 
+@query_budget(5)
+@staff_member_required
+@reporting_reads
+def borrower_search(request):
+    form = BorrowerSearchForm(request.GET)
+    matches = []
+    if form.is_valid() and form.cleaned_data['q']:
+        matches = search_borrowers(form.cleaned_data['q'], form.cleaned_data['limit'])
+    if request.GET.get('format') == 'json':
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse({
+            'query': form.cleaned_data['q'],
+            'results': [match.as_json() for match in matches],
+        })
+    return render(request, 'core/admin_borrower_search.html', {'form': form, 'matches': matches})
+
+@query_budget(8)
 @staff_member_required
 def verify_user_admin(request, pk):
     user = get_object_or_404(User, pk=pk)
-    profile, created = Profile.objects.get_or_create(user=user)
-    profile.verified_status = True
-    profile.save()
+    with transaction.atomic():
+        profile, created = Profile.objects.get_or_create(user=user)
+        if not profile.verified_status:
+            profile.verified_status = True
+            profile.save()
+            record_events([verified_event(user, request.user)])
     messages.success(request, f"User {user.username} verified.")
     return redirect('admin_users')
 
+@query_budget(5)
 @staff_member_required
+@reporting_reads
+@conditional_page(portfolio_key)
 def admin_loans(request):
-    status = request.GET.get('status')
-    loans = Loan.objects.select_related('borrower').all().order_by('-created_at')
-    
-    if status:
-        loans = loans.filter(status=status)
+    querysets, ordering = loan_list_query(request)
+    loans = keyset_paginate_many(
+        querysets,
+        ordering,
+        cursor=request.GET.get('after'),
+        page_size=get_page_size(request),
+    )
         
     return render(request, 'core/admin_loans.html', {
         'loans': loans,
-        'current_status': status
+        'current_status': request.GET.get('status'),
+        'current_sort': request.GET.get('sort'),
+        'include_archived': include_archived(request),
+        'next_query': loans.next_query(request.GET),
+        'portfolio_version': data_version(request, PORTFOLIO),
+    })
+
+@query_budget(3)
+@staff_member_required
+@reporting_reads
+def export_ledger(request, kind):
+    if kind not in LEDGERS:
+        raise Http404
+    form = LedgerExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    fmt, gzip = form.cleaned_data['format'], form.cleaned_data['gzip']
+    # A .gz file to keep, not a compressed transfer of the CSV: no Content-Encoding,
+    # so clients and proxies leave the body as it is.
+    response = StreamingHttpResponse(
+        stream_ledger(kind, fmt, gzip, include_archived=form.cleaned_data['archived'], **form.filters()),
+        content_type='application/gzip' if gzip else CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, fmt, gzip)}"'
+    return response
+
+@query_budget(2)
+@staff_member_required
+@reporting_reads
+def admin_trends(request):
+    form = TrendsForm(request.GET)
+    rollups, totals = [], {}
+    if form.is_valid():
+        rollups = list(get_rollups(form.cleaned_data['start'], form.cleaned_data['end']))
+        totals = {metric: sum(getattr(rollup, metric) for rollup in rollups) for metric in METRICS}
+    return render(request, 'core/admin_trends.html', {'form': form, 'rollups': rollups, 'totals': totals})
+
+@query_budget(2)
+@staff_member_required
+@reporting_reads
+def admin_trends_data(request):
+    form = TrendsForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    start, end = form.cleaned_data['start'], form.cleaned_data['end']
+    return JsonResponse({
+        'start': start,
+        'end': end,
+        'days': list(get_rollups(start, end).values('day', *METRICS)),
+    })
+
+@query_budget(2)
+@require_GET
+@feed_auth_required
+def loan_events(request):
+    form = EventFeedForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    after, limit = form.cleaned_data['after'], form.cleaned_data['limit']
+    # One row past the page tells whether the consumer should come straight back.
+    events = events_after(after, limit + 1, kinds=form.cleaned_data['kind'])
+    page = events[:limit]
+    return JsonResponse({
+        'events': [event_json(event) for event in page],
+        # Pass back as ?after= to continue; unchanged when there is nothing new yet.
+        'next_after': page[-1].pk if page else after,
+        'has_more': len(events) > limit,
     })
 
+# The user, the portfolio version, the stored result and, for an interactive run, the book.
+@query_budget(4)
+@staff_member_required
+@reporting_reads
+def admin_risk(request):
+    form = SimulationForm(request.GET)
+    result = None
+    if form.is_valid():
+        # Cached per portfolio version and day: only the first view after a change runs the
+        # simulation, and only small runs start here; simulate_losses stores the rest.
+        result = simulate_portfolio(
+            data_version(request, PORTFOLIO),
+            scenarios=form.cleaned_data['scenarios'],
+            seed=form.cleaned_data['seed'],
+            interactive=True,
+        )
+    return render(request, 'core/admin_risk.html', {
+        'form': form,
+        'result': result,
+        'interactive_scenarios': INTERACTIVE_SCENARIOS,
+        'histogram_peak': max((row['scenarios'] for row in result['histogram']), default=0) if result else 0,
+    })
+
+# A file of up to imports.BATCH_SIZE rows: the user, the batch's ten statements (duplicates,
+# phones, loans, repayments, totals, payoffs, two stats updates, events, versions) plus its
+# savepoint when nested in a transaction, and the portfolio bump it runs on commit.
+# Each further batch adds up to 13 more.
+@query_budget(14)
+@staff_member_required
+def import_repayments_view(request):
+    report = None
+    if request.method == 'POST':
+        form = RepaymentImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            lines = (line.decode('utf-8-sig') for line in form.cleaned_data['file'])
+            try:
+                report = import_repayments(lines, actor=request.user)
+            except UnicodeDecodeError:
+                form.add_error('file', 'The file must be UTF-8 encoded CSV.')
+            else:
+                messages.success(request, report.summary())
+    else:
+        form = RepaymentImportForm()
+    return render(request, 'core/admin_import_repayments.html', {'form': form, 'report': report})
+
+@query_budget(10)
 @staff_member_required
 def admin_create_loan(request):
     if request.method == 'POST':
         form = AdminLoanForm(request.POST)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                loan = form.save()
+                record_events(opened_loan_events(LoanEvent.CREATED, loan, request.user))
             messages.success(request, 'Loan created successfully!')
             return redirect('admin_loans')
     else:
         form = AdminLoanForm()
     return render(request, 'core/admin_create_loan.html', {'form': form})
 
+@query_budget(10)
 @staff_member_required
 def admin_create_user(request):
     if request.method == 'POST':
@@ -253,8 +561,10 @@ def admin_create_user(request):
             if form.cleaned_data['is_staff']:
                 user.is_staff = True
                 user.is_superuser = True
-            user.save()
-            Profile.objects.create(user=user, verified_status=True)
+            with transaction.atomic():
+                user.save()
+                Profile.objects.create(user=user, verified_status=True)
+                record_events([verified_event(user, request.user)])
             messages.success(request, f'User {user.username} created successfully!')
             return redirect('admin_users')
     else:
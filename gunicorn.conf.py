@@ -0,0 +1,11 @@
+# Gunicorn settings shared by both deployment modes. Worker count comes from
+# WEB_CONCURRENCY and the bind address from PORT (gunicorn reads both itself).
+import os
+
+if os.environ.get('SERVER_MODE') == 'asgi':
+    # Uvicorn workers serving the ASGI app; settings.ASYNC_VIEWS switches the
+    # read-heavy views to core.async_views so slow queries don't pin a worker.
+    wsgi_app = 'rilakin.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'rilakin.wsgi:application'
@@ -50,9 +50,22 @@ INSTALLED_APPS = [
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
+# Rows per page on the staff listings (overridable per request with ?page_size=)
+STAFF_PAGE_SIZE = int(os.environ.get('STAFF_PAGE_SIZE', 50))
+
+# Bearer tokens accepted by the loan event feed besides staff sessions (comma-separated, see core.events)
+EVENT_FEED_TOKENS = [token for token in os.environ.get('EVENT_FEED_TOKENS', '').split(',') if token]
+# The feed holds back events younger than this, so transactions still committing cannot be skipped
+EVENT_FEED_SETTLE_SECONDS = float(os.environ.get('EVENT_FEED_SETTLE_SECONDS', 2))
+
+# Country calling code assumed for phone numbers written in national format (0712..., see core.identifiers)
+PHONE_COUNTRY_CODE = os.environ.get('PHONE_COUNTRY_CODE', '254')
+
 MIDDLEWARE = [
+    "core.instrumentation.RequestInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.replicas.ReplicaPinningMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -61,6 +74,19 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Per-request query/latency instrumentation, see core.instrumentation; off unless enabled here
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+REQUEST_LATENCY_BUDGET_MS = int(os.environ.get('REQUEST_LATENCY_BUDGET_MS', 500))
+
+# Serve the read-heavy views from core.async_views; on by default when gunicorn runs the ASGI app
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', str(os.environ.get('SERVER_MODE') == 'asgi')).lower() in ('1', 'true', 'yes')
+
+# Mixed into page ETags (core.versions) so browsers drop cached pages after a deploy
+ETAG_SALT = os.environ.get('RENDER_GIT_COMMIT', '')
+
+# Benchmarking only: delay every SQL query by this many ms (see core.benchmarks)
+SIMULATED_DB_LATENCY_MS = int(os.environ.get('SIMULATED_DB_LATENCY_MS', 0))
+
 ROOT_URLCONF = "rilakin.urls"
 
 TEMPLATES = [
@@ -92,6 +118,56 @@ DATABASES = {
     )
 }
 
+# Optional read replica for the staff reporting views (see core.replicas)
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES["replica"] = dj_database_url.parse(os.environ['REPLICA_DATABASE_URL'], conn_max_age=600)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+
+# Keep a client's reports on the primary for this long after it writes
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# Tuned SQLite profile for deployments on the db.sqlite3 fallback: WAL lets
+# readers run alongside the single writer, and BEGIN IMMEDIATE takes the write
+# lock up front so concurrent transactions queue on the busy timeout instead
+# of failing with "database is locked". SQLITE_PROFILE=default restores the
+# stock settings (see benchmark_sqlite_writes).
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'tuned')
+SQLITE_TUNED_OPTIONS = {
+    "init_command": ";".join([
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA mmap_size=134217728",
+        "PRAGMA cache_size=-20000",
+    ]),
+    "transaction_mode": "IMMEDIATE",
+    # busy_timeout, in seconds
+    "timeout": 20,
+}
+
+for database in DATABASES.values():
+    if database["ENGINE"] == "django.db.backends.sqlite3" and SQLITE_PROFILE == 'tuned':
+        database["OPTIONS"] = {**SQLITE_TUNED_OPTIONS, **database.get("OPTIONS", {})}
+
+
+# Cache, sessions and the cached user lookup (see core.auth)
+# Local memory is per process: multi-worker deployments should point
+# CACHE_BACKEND at a shared cache, e.g. FileBasedCache or RedisCache.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.environ.get('CACHE_LOCATION', 'rilakin'),
+    }
+}
+
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+AUTHENTICATION_BACKENDS = ["core.auth.CachedModelBackend"]
+
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -132,6 +208,18 @@ STATIC_URL = "static/"
 if not DEBUG:
     STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    # Parse each template once per process; the staff pages also cache
+    # fragments keyed on core.versions tokens (see benchmark_render).
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "django.template.loaders.cached.Loader",
+            [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        ),
+    ]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field